@@ -6,6 +6,11 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DB_PATH = os.getenv("DATABASE_PATH", "database/data/delivery.db")
 AUCTION_DURATION = int(os.getenv("AUCTION_DURATION", 120))  # 2 минуты (120 секунд)
+# Внутренний адрес API webapp (сеть docker-compose)
+API_BASE_URL = os.getenv("API_BASE_URL", "http://webapp:5000")
+# Запросы к API webapp от имени пользователей (тот же секрет, что у вебхуков)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "change-this-secret-key")
+API_HEADERS = {"Authorization": f"Bearer {WEBHOOK_SECRET}"}
 
 # Иерархические типы машин для грузоперевозок
 TRUCK_CATEGORIES = {
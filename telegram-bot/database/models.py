@@ -155,13 +155,15 @@ async def get_user_by_id(user_id: int):
                 }
             return None
 
-async def get_all_drivers(truck_type: str = None):
+async def get_all_drivers(truck_type: str = None, cells: list = None):
     """
     Получить всех водителей
     
     Args:
         truck_type: Фильтр по типу машины (опционально). 
                    Если указан, вернёт водителей, у которых есть машина этого типа.
+        cells: Ячейки сетки рядом с точкой подачи (опционально).
+               Если указаны, вернёт водителей с базой в них и водителей без базы.
     """
     async with aiosqlite.connect(DB_PATH) as db:
         if truck_type:
@@ -174,8 +176,12 @@ async def get_all_drivers(truck_type: str = None):
             """
             params = (truck_type,)
         else:
-            query = "SELECT * FROM users WHERE role = 'driver'"
+            query = "SELECT * FROM users u WHERE u.role = 'driver'"
             params = ()
+        
+        if cells:
+            query += f" AND (u.home_cell IS NULL OR u.home_cell IN ({','.join('?' * len(cells))}))"
+            params += tuple(cells)
             
         async with db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
@@ -281,25 +287,6 @@ async def get_drivers_by_truck_type(truck_type: str):
                 'created_at': row[6]
             } for row in rows]
 
-async def create_bid(order_id: int, driver_id: int, price: float):
-    """Создать предложение водителя"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            await db.execute(
-                "INSERT INTO bids (order_id, driver_id, price) VALUES (?, ?, ?)",
-                (order_id, driver_id, price)
-            )
-            await db.commit()
-            return True
-        except aiosqlite.IntegrityError:
-            # Водитель уже сделал предложение для этого заказа
-            await db.execute(
-                "UPDATE bids SET price = ? WHERE order_id = ? AND driver_id = ?",
-                (price, order_id, driver_id)
-            )
-            await db.commit()
-            return True
-
 async def get_order_by_id(order_id: int):
     """Получить заявку по ID"""
     async with aiosqlite.connect(DB_PATH) as db:
@@ -582,6 +569,16 @@ async def set_primary_vehicle(driver_id: int, truck_type: str):
         await db.commit()
         return True
 
+async def get_driver_home_base(driver_id: int):
+    """Адрес базы водителя (users.home_address) или None"""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT home_address FROM users WHERE id = ?",
+            (driver_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
 async def get_drivers_by_truck_type_multiple(truck_type: str):
     """Получить всех водителей с указанным типом машины (из множественных машин)"""
     async with aiosqlite.connect(DB_PATH) as db:
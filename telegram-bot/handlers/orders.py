@@ -5,12 +5,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime, timedelta
 import asyncio
+import aiohttp
 import aiosqlite
 import logging
 
 from database.models import (
     get_user_by_telegram_id, create_order, get_drivers_by_truck_type_multiple, 
-    get_order_by_id, create_bid, get_bids_for_order, complete_order,
+    get_order_by_id, get_bids_for_order,
     save_order_message, get_order_message, get_driver_messages_for_order
 )
 from bot.config import TRUCK_TYPES, TRUCK_CATEGORIES, AUCTION_DURATION, DB_PATH, get_truck_display_name
@@ -395,9 +396,8 @@ async def order_details_received(message: Message, state: FSMContext, bot: Bot):
             message_type='customer'
         )
         
-        # Запускаем таймер подбора
-        import asyncio
-        asyncio.create_task(auction_timer(bot, order_id))
+        # Подбор по истечении времени завершает сервис auction-checker (пакет
+        # webapp/auction), результат приходит webhook'ом -> show_auction_result
         
     except Exception as e:
         await status_message.edit_text(f"❌ Ошибка при создании заявки: {str(e)}")
@@ -506,7 +506,6 @@ async def bid_price_received(message: Message, state: FSMContext, bot: Bot):
         message_id = data.get('message_id')
         chat_id = data.get('chat_id')
         
-        user = await get_user_by_telegram_id(message.from_user.id)
         order = await get_order_by_id(order_id)
         
         # Проверяем, что заказ еще активен
@@ -518,7 +517,32 @@ async def bid_price_received(message: Message, state: FSMContext, bot: Bot):
             await state.clear()
             return
         
-        await create_bid(order_id, user['id'], price)
+        # Ставка - через webapp: проверка срока подбора, история заказа,
+        # push-события и групповой коммит (bid_ingest.py)
+        from bot.config import API_BASE_URL, API_HEADERS
+        
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{API_BASE_URL}/api/bids",
+                json={'telegram_id': message.from_user.id, 'order_id': order_id, 'price': price},
+                headers=API_HEADERS
+            ) as response:
+                result = await response.json()
+        
+        if response.status != 200:
+            logging.error(f"Ошибка создания предложения для заказа {order_id}: {result}")
+            error = result.get('error')
+            if error == 'Bid already exists':
+                await message.answer("ℹ️ Вы уже сделали предложение по этой заявке.")
+            elif error == 'Auction is closed':
+                await message.answer(
+                    "❌ К сожалению, прием предложений по этой заявке уже завершен.\n"
+                    "Заявка больше не активна."
+                )
+            else:
+                await message.answer("❌ Не удалось отправить предложение. Попробуйте позже.")
+            await state.clear()
+            return
         
         # Обновляем существующее сообщение с подтверждением предложения
         if message_id and chat_id:
@@ -560,100 +584,62 @@ async def bid_price_received(message: Message, state: FSMContext, bot: Bot):
     
     await state.clear()
 
-async def auction_timer(bot: Bot, order_id: int):
-    """Таймер подбора - НОВАЯ ЛОГИКА"""
-    # Ждем окончания подбора
-    await asyncio.sleep(AUCTION_DURATION)
+async def show_auction_result(bot: Bot, order_id: int):
+    """
+    Обновить сообщение заказчика после завершения подбора
     
-    # Получаем все предложения
-    bids = await get_bids_for_order(order_id)
+    Вызывается из webhook'ов auction-bids-ready / auction-no-bids: статус
+    заказа уже выставил движок подбора, здесь только отображение.
+    """
     order = await get_order_by_id(order_id)
+    order_message_info = await get_order_message(order_id, 'customer')
     
-    if not order or order['status'] != 'active':
+    if not order or not order_message_info:
         return
     
-    if not bids:
-        # Нет предложений - закрываем заявку
-        await complete_order(order_id, None, None, 'no_offers')
-        
-        # Получаем информацию о сообщении заявки
-        order_message_info = await get_order_message(order_id, 'customer')
-        
-        # Обновляем статусное сообщение заказчика
-        if order_message_info:
-            try:
-                truck_name = get_truck_display_name(order['truck_type'])
-                await bot.edit_message_text(
-                    chat_id=order_message_info['chat_id'],
-                    message_id=order_message_info['message_id'],
-                    text=f"❌ Заявка #{order_id} закрыта\n\n"
-                         f"🚚 Тип машины: {truck_name}\n"
-                         f"📦 Описание: {order['cargo_description']}\n\n"
-                         f"⏰ Подбор завершен\n"
-                         f"🔄 Статус: Нет предложений от водителей\n\n"
-                         f"💡 Попробуйте создать новую заявку или изменить условия."
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при обновлении сообщения заявки: {e}")
-                # Fallback: отправляем новое сообщение если не удалось обновить
-                async with aiosqlite.connect(DB_PATH) as db:
-                    async with db.execute("SELECT telegram_id FROM users WHERE id = ?", (order['customer_id'],)) as cursor:
-                        customer_row = await cursor.fetchone()
-                        if customer_row:
-                            try:
-                                await bot.send_message(
-                                    chat_id=customer_row[0],
-                                    text=f"❌ К сожалению, на заявку #{order_id} не поступило предложений от водителей.\n\n"
-                                         f"Попробуйте создать новую заявку или изменить условия."
-                                )
-                            except:
-                                pass
+    truck_name = get_truck_display_name(order['truck_type'])
+    
+    try:
+        if order['status'] == 'no_offers':
+            await bot.edit_message_text(
+                chat_id=order_message_info['chat_id'],
+                message_id=order_message_info['message_id'],
+                text=f"❌ Заявка #{order_id} закрыта\n\n"
+                     f"🚚 Тип машины: {truck_name}\n"
+                     f"📦 Описание: {order['cargo_description']}\n\n"
+                     f"⏰ Подбор завершен\n"
+                     f"🔄 Статус: Нет предложений от водителей\n\n"
+                     f"💡 Попробуйте создать новую заявку или изменить условия."
+            )
+        elif order['status'] == 'auction_completed':
+            bids = await get_bids_for_order(order_id)
             
-    else:
-        # Есть предложения - переводим заявку в статус "auction_completed" 
-        # для ручного выбора заказчиком
-        
-        # Обновляем статус заявки в базе
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("UPDATE orders SET status = ? WHERE id = ?", ('auction_completed', order_id))
-            await db.commit()
-        
-        # Получаем информацию о сообщении заявки
-        order_message_info = await get_order_message(order_id, 'customer')
-        
-        # Показываем только 5 лучших предложений (по цене)
-        top_bids = bids[:5]
-        
-        # Обновляем сообщение заказчика с предложениями
-        if order_message_info:
-            try:
-                truck_name = get_truck_display_name(order['truck_type'])
-                
-                bids_text = ""
-                for i, bid in enumerate(top_bids, 1):
-                    bids_text += f"{i}. {bid['price']} руб. - {bid['driver_name'] or 'Водитель'}\n"
-                
-                # Создаем кнопку для просмотра всех предложений
-                show_bids_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📋 Посмотреть все предложения", 
-                                        callback_data=f"show_all_bids_{order_id}")]
-                ])
-                
-                await bot.edit_message_text(
-                    chat_id=order_message_info['chat_id'],
-                    message_id=order_message_info['message_id'],
-                    text=f"✅ Заявка #{order_id} - Прием заявок завершен\n\n"
-                         f"🚚 Тип машины: {truck_name}\n"
-                         f"📦 Описание: {order['cargo_description']}\n\n"
-                         f"📊 Получено предложений: {len(bids)}\n"
-                         f"💰 Топ-5 предложений:\n{bids_text}\n"
-                         f"🔄 Статус: Ожидает выбора исполнителя",
-                    reply_markup=show_bids_keyboard
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при обновлении сообщения заявки: {e}")
-        
-        # НЕ уведомляем водителей о результатах - они узнают только при выборе заказчиком
+            # Показываем только 5 лучших предложений (по цене)
+            bids_text = ""
+            for i, bid in enumerate(bids[:5], 1):
+                bids_text += f"{i}. {bid['price']} руб. - {bid['driver_name'] or 'Водитель'}\n"
+            
+            # Создаем кнопку для просмотра всех предложений
+            show_bids_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="📋 Посмотреть все предложения", 
+                                    callback_data=f"show_all_bids_{order_id}")]
+            ])
+            
+            await bot.edit_message_text(
+                chat_id=order_message_info['chat_id'],
+                message_id=order_message_info['message_id'],
+                text=f"✅ Заявка #{order_id} - Прием заявок завершен\n\n"
+                     f"🚚 Тип машины: {truck_name}\n"
+                     f"📦 Описание: {order['cargo_description']}\n\n"
+                     f"📊 Получено предложений: {len(bids)}\n"
+                     f"💰 Топ-5 предложений:\n{bids_text}\n"
+                     f"🔄 Статус: Ожидает выбора исполнителя",
+                reply_markup=show_bids_keyboard
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении сообщения заявки: {e}")
+    
+    # НЕ уведомляем водителей о результатах - они узнают только при выборе заказчиком
 
 @router.callback_query(F.data.startswith("show_all_bids_"))
 async def show_all_bids(callback: CallbackQuery, bot: Bot):
@@ -755,34 +741,28 @@ async def select_driver(callback: CallbackQuery, bot: Bot):
         await callback.answer("❌ Предложение не найдено!")
         return
     
-    # Обновляем заказ - устанавливаем выбранного водителя
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE orders 
-            SET status = 'in_progress', 
-                winner_driver_id = ?,
-                winning_price = ?
-            WHERE id = ?
-        """, (selected_bid['driver_id'], selected_bid['price'], order_id))
-        await db.commit()
-    
-    # Уведомляем выбранного водителя
-    truck_name = get_truck_display_name(order['truck_type'])
-    
+    # Назначение исполнителя - через движок подбора webapp; водителя
+    # и заказчика уведомит webhook auction-complete
     try:
-        await bot.send_message(
-            chat_id=selected_bid['driver_telegram_id'],
-            text=f"🎉 Вы выбраны исполнителем!\n\n"
-                 f"📋 Заявка #{order_id}\n"
-                 f"🚚 Тип машины: {truck_name}\n"
-                 f"📦 Описание: {order['cargo_description']}\n"
-                 f"💰 Цена: {selected_bid['price']} руб.\n\n"
-                 f"👤 Заказчик: {user['name'] or 'Не указано'}\n"
-                 f"📞 Телефон заказчика: {user['phone_number']}\n\n"
-                 f"✅ Свяжитесь с заказчиком для уточнения деталей!"
-        )
+        from bot.config import API_BASE_URL, API_HEADERS
+        
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{API_BASE_URL}/api/orders/{order_id}/select-winner",
+                json={'telegram_id': callback.from_user.id, 'bid_id': bid_id},
+                headers=API_HEADERS
+            ) as response:
+                result = await response.json()
+                if response.status != 200:
+                    logging.error(f"Ошибка выбора исполнителя для заказа {order_id}: {result}")
+                    await callback.answer("❌ Не удалось выбрать исполнителя!")
+                    return
     except Exception as e:
-        logging.error(f"Ошибка отправки уведомления водителю: {e}")
+        logging.error(f"Ошибка выбора исполнителя для заказа {order_id}: {e}")
+        await callback.answer("❌ Не удалось выбрать исполнителя!")
+        return
+    
+    truck_name = get_truck_display_name(order['truck_type'])
     
     # Обновляем сообщение заказчика
     try:
@@ -1083,7 +1063,7 @@ async def finish_photo_upload(message: Message, state: FSMContext, bot: Bot):
     try:
         import aiohttp
         import io
-        from bot.config import API_BASE_URL
+        from bot.config import API_BASE_URL, API_HEADERS
         
         # Скачиваем фото из Telegram и загружаем на сервер
         async with aiohttp.ClientSession() as session:
@@ -1107,12 +1087,21 @@ async def finish_photo_upload(message: Message, state: FSMContext, bot: Bot):
             
             # Отправляем на сервер
             endpoint = f"{API_BASE_URL}/api/orders/{order_id}/photos/{photo_type}"
-            headers = {'telegram_id': str(message.from_user.id)}
+            headers = {'telegram_id': str(message.from_user.id), **API_HEADERS}
             
             async with session.post(endpoint, data=form_data, headers=headers) as response:
-                if response.status == 200:
+                if response.status in (200, 202):
                     result = await response.json()
                     
+                    # 202 - фото поставлены в очередь обработки, ждём её завершения
+                    if result.get('status_url'):
+                        job = await wait_photo_job(session, f"{API_BASE_URL}{result['status_url']}", headers)
+                        if job.get('status') != 'done':
+                            error_text = job.get('error') or 'обработка не завершилась вовремя'
+                            await message.answer(f"❌ Ошибка при загрузке фотографий: {error_text}")
+                            await state.clear()
+                            return
+                    
                     photo_type_ru = "загрузки" if photo_type == "loading" else "выгрузки"
                     await message.answer(
                         f"✅ Фотографии {photo_type_ru} успешно загружены!\n"
@@ -1133,6 +1122,25 @@ async def finish_photo_upload(message: Message, state: FSMContext, bot: Bot):
     await state.clear()
 
 
+async def wait_photo_job(session, status_url: str, headers: dict, timeout: int = 120) -> dict:
+    """Дождаться завершения фоновой обработки фото на сервере"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    job = {}
+    
+    while loop.time() < deadline:
+        async with session.get(status_url, headers=headers) as response:
+            if response.status != 200:
+                return {'status': 'failed', 'error': await response.text()}
+            job = (await response.json())['jobs'][0]
+        
+        if job['status'] in ('done', 'failed'):
+            return job
+        await asyncio.sleep(1)
+    
+    return job
+
+
 @router.message(StateFilter(PhotoStates.uploading_loading_photos, PhotoStates.uploading_unloading_photos), F.text == "/cancel")
 async def cancel_photo_upload(message: Message, state: FSMContext):
     """Отмена загрузки фотографий"""
@@ -1144,11 +1152,11 @@ async def send_driver_order_menu(driver_telegram_id: int, order_id: int, bot: Bo
     """Отправка меню с действиями водителя для заказа"""
     try:
         import aiohttp
-        from bot.config import API_BASE_URL
+        from bot.config import API_BASE_URL, API_HEADERS
         
         # Получаем информацию о заказе с сервера
         async with aiohttp.ClientSession() as session:
-            headers = {'telegram_id': str(driver_telegram_id)}
+            headers = {'telegram_id': str(driver_telegram_id), **API_HEADERS}
             async with session.get(f"{API_BASE_URL}/api/orders/{order_id}", headers=headers) as response:
                 if response.status != 200:
                     return
@@ -1207,14 +1215,15 @@ async def driver_confirm_completion(callback: CallbackQuery, bot: Bot):
     
     try:
         import aiohttp
-        from bot.config import API_BASE_URL
+        from bot.config import API_BASE_URL, API_HEADERS
         
         # Отправляем запрос на подтверждение
         async with aiohttp.ClientSession() as session:
             payload = {'telegram_id': callback.from_user.id}
             async with session.post(
                 f"{API_BASE_URL}/api/orders/{order_id}/confirm-completion",
-                json=payload
+                json=payload,
+                headers=API_HEADERS
             ) as response:
                 if response.status == 200:
                     result = await response.json()
@@ -5,7 +5,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from database.models import get_user_by_telegram_id, create_user
-from bot.config import TRUCK_TYPES, USER_ROLES, TRUCK_CATEGORIES, get_truck_display_name
+from bot.config import TRUCK_TYPES, USER_ROLES, TRUCK_CATEGORIES, API_HEADERS, get_truck_display_name
 from bot.keyboards import get_webapp_menu
 from bot.webapp_config import WEBAPP_URL
 import aiohttp
@@ -18,7 +18,8 @@ async def mark_invite_code_used(code: str, telegram_id: int):
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f'{WEBAPP_URL}/api/invite-codes/use',
-                json={'code': code, 'telegram_id': telegram_id}
+                json={'code': code, 'telegram_id': telegram_id},
+                headers=API_HEADERS
             ) as response:
                 result = await response.json()
                 if result.get('success'):
@@ -156,7 +157,8 @@ async def invite_code_received(message: Message, state: FSMContext):
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f'{WEBAPP_URL}/api/invite-codes/validate',
-                json={'code': code, 'telegram_id': message.from_user.id}
+                json={'code': code, 'telegram_id': message.from_user.id},
+                headers=API_HEADERS
             ) as response:
                 result = await response.json()
                 
@@ -5,13 +5,16 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.filters import StateFilter
+from aiogram.filters import StateFilter, Command, CommandObject
+import aiohttp
+import html
+import logging
 
 from database.models import (
     get_user_by_telegram_id, get_driver_vehicles, add_driver_vehicle,
-    delete_driver_vehicle, set_primary_vehicle
+    delete_driver_vehicle, set_primary_vehicle, get_driver_home_base
 )
-from bot.config import TRUCK_CATEGORIES, get_truck_display_name
+from bot.config import TRUCK_CATEGORIES, API_BASE_URL, API_HEADERS, get_truck_display_name
 from bot.keyboards import get_driver_menu
 
 router = Router()
@@ -312,4 +315,73 @@ async def show_vehicles_list(message, driver_id: int):
         response += f"\n💡 Основная машина отмечена звездочкой ⭐\n"
         response += "По основной машине вы будете получать уведомления в первую очередь."
     
-    await message.edit_text(response, reply_markup=keyboard)
\ No newline at end of file
+    await message.edit_text(response, reply_markup=keyboard)
+
+@router.message(Command("base"))
+async def set_home_base(message: Message, command: CommandObject):
+    """
+    База водителя: /base Казань
+    
+    Заявки и уведомления приходят только по заказам рядом с базой
+    (заказы без распознанного адреса видны всем). /base без города - показать
+    текущую базу, /base - (минус) - убрать её.
+    """
+    if not message.from_user:
+        return
+    
+    user = await get_user_by_telegram_id(message.from_user.id)
+    
+    if not user or user['role'] != 'driver':
+        await message.answer("❌ Эта функция доступна только водителям!")
+        return
+    
+    if not command.args:
+        home_address = await get_driver_home_base(user['id'])
+        if home_address:
+            await message.answer(
+                f"🏠 <b>База водителя:</b> {html.escape(home_address)}\n\n"
+                "Вы получаете заявки с подачей в радиусе ~50–100 км от базы.\n"
+                "/base Казань - сменить базу\n"
+                "/base - (минус) - получать заявки по всей стране.",
+                parse_mode='HTML'
+            )
+        else:
+            await message.answer(
+                "🏠 <b>База водителя</b>\n\n"
+                "База не указана - вы получаете заявки по всей стране.\n"
+                "Укажите город, рядом с которым вы работаете:\n"
+                "/base Казань\n\n"
+                "Вы будете получать заявки с подачей в радиусе ~50–100 км от базы.",
+                parse_mode='HTML'
+            )
+        return
+    
+    address = '' if command.args.strip() == '-' else command.args.strip()
+    
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{API_BASE_URL}/api/driver/home-base",
+                json={'telegram_id': message.from_user.id, 'address': address},
+                headers=API_HEADERS
+            ) as response:
+                result = await response.json()
+                if response.status == 422:
+                    await message.answer("❌ Город не найден. Попробуйте указать крупный город рядом, например: /base Казань")
+                    return
+                if response.status != 200:
+                    logging.error(f"Ошибка сохранения базы водителя {message.from_user.id}: {result}")
+                    await message.answer("❌ Не удалось сохранить базу, попробуйте позже")
+                    return
+    except Exception as e:
+        logging.error(f"Ошибка сохранения базы водителя {message.from_user.id}: {e}")
+        await message.answer("❌ Не удалось сохранить базу, попробуйте позже")
+        return
+    
+    if result['home_address']:
+        await message.answer(
+            f"✅ База сохранена: {(result['place'] or result['home_address']).title()}\n\n"
+            f"Теперь вы получаете заявки рядом с базой."
+        )
+    else:
+        await message.answer("✅ База убрана. Вы получаете заявки по всей стране.")
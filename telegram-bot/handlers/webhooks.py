@@ -17,6 +17,7 @@ from utils.notifications import (
     notify_order_cancelled
 )
 from utils.helpers import logger
+from handlers.orders import show_auction_result
 
 router = Router()
 
@@ -41,7 +42,8 @@ async def webhook_new_order(request):
         "truck_type": "gazel_tent_3m",
         "cargo_description": "Мебель для переезда",
         "delivery_address": "ул. Ленина, д. 10",
-        "max_price": 5000.0
+        "max_price": 5000.0,
+        "pickup_cells": [209234, 209235, ...]  # ячейки рядом с подачей или null
     }
     """
     if not await verify_webhook_token(request):
@@ -72,7 +74,8 @@ async def webhook_new_order(request):
             pickup_address=data.get('pickup_address'),
             pickup_time=data.get('pickup_time'),
             delivery_time=data.get('delivery_time'),
-            delivery_date=data.get('delivery_date')
+            delivery_date=data.get('delivery_date'),
+            pickup_cells=data.get('pickup_cells')
         )
         
         logger.info(f"Webhook: Отправлены уведомления о заявке #{data['order_id']} ({count} водителей)")
@@ -177,6 +180,9 @@ async def webhook_auction_no_bids(request):
             cargo_description=data['cargo_description']
         )
         
+        # Сообщение заявки у заказчика: "закрыта, нет предложений"
+        await show_auction_result(bot, data['order_id'])
+        
         logger.info(f"Webhook: Подбор #{data['order_id']} завершён без ставок")
         
         return web.json_response({'success': True})
@@ -216,6 +222,9 @@ async def webhook_auction_bids_ready(request):
             min_price=float(data['min_price'])
         )
         
+        # Сообщение заявки у заказчика: топ-5 и кнопка выбора исполнителя
+        await show_auction_result(bot, data['order_id'])
+        
         logger.info(f"Webhook: Заказчику уведомление о готовности {data['bids_count']} предложений для заказа #{data['order_id']}")
         
         return web.json_response({'success': True})
@@ -9,9 +9,9 @@ from bot.webapp_config import WEBAPP_URL
 
 from typing import Optional
 
-async def notify_drivers_new_order(bot: Bot, order_id: int, truck_type: str, cargo_description: str, delivery_address: str, max_price: Optional[float] = None, pickup_address: Optional[str] = None, pickup_time: Optional[str] = None, delivery_time: Optional[str] = None, delivery_date: Optional[str] = None):
+async def notify_drivers_new_order(bot: Bot, order_id: int, truck_type: str, cargo_description: str, delivery_address: str, max_price: Optional[float] = None, pickup_address: Optional[str] = None, pickup_time: Optional[str] = None, delivery_time: Optional[str] = None, delivery_date: Optional[str] = None, pickup_cells: Optional[list] = None):
     """
-    Уведомляет водителей о новой заявке (только с подходящим типом машины)
+    Уведомляет водителей о новой заявке (только с подходящим типом машины и базой рядом)
     
     Args:
         bot: Экземпляр бота
@@ -24,9 +24,10 @@ async def notify_drivers_new_order(bot: Bot, order_id: int, truck_type: str, car
         pickup_time: Время подачи (может быть None)
         delivery_time: Время доставки (может быть None)
         delivery_date: Дата доставки (может быть None)
+        pickup_cells: Ячейки сетки рядом с адресом подачи (None - адрес не найден, без фильтра)
     """
-    # Получаем только водителей с подходящим типом машины
-    drivers = await get_all_drivers(truck_type=truck_type)
+    # Получаем только водителей с подходящим типом машины и базой рядом с точкой подачи
+    drivers = await get_all_drivers(truck_type=truck_type, cells=pickup_cells)
     truck_name = get_truck_display_name(truck_type)
     
     # Формируем текст сообщения
@@ -7,46 +7,96 @@ import secrets
 import string
 from datetime import datetime, timedelta
 
+from auth import request_telegram_id
+from identity import identity_cache
+from search import fts_query
+
+MAX_INVITE_CODES_BATCH = 50000  # Кодов за один запрос генерации
+INVITE_CODE_ATTEMPTS = 10  # Повторов для кодов, совпавших с существующими
+ORGANIZATIONS_PAGE_SIZE = 50
+MAX_ORGANIZATIONS_PAGE_SIZE = 500
+USERS_PAGE_SIZE = 50
+MAX_USERS_PAGE_SIZE = 200
+
+# Список админов (telegram_id)
+ADMIN_IDS = [643813567]  # Замените на ваш telegram_id
+
+def is_admin(telegram_id):
+    """Проверка прав администратора"""
+    return int(telegram_id) in ADMIN_IDS
+
 def setup_admin_routes(app, get_db_connection):
     """Настройка маршрутов админ панели"""
     
-    # Список админов (telegram_id)
-    ADMIN_IDS = [643813567]  # Замените на ваш telegram_id
-    
-    def is_admin(telegram_id):
-        """Проверка прав администратора"""
-        return int(telegram_id) in ADMIN_IDS
-    
     # ========== ОРГАНИЗАЦИИ ==========
     
     @app.route('/api/admin/organizations', methods=['GET'])
     def get_organizations():
-        """Получить список всех организаций"""
-        telegram_id = request.args.get('telegram_id')
+        """
+        Список организаций со счётчиками (organization_stats)
+        
+        Query: q - поиск по названию и описанию, limit (по умолчанию 50), offset
+        """
+        telegram_id = request_telegram_id()
         
         if not telegram_id or not is_admin(telegram_id):
             return jsonify({'error': 'Access denied'}), 403
         
+        search = request.args.get('q', '').strip()
+        limit = request.args.get('limit', default=ORGANIZATIONS_PAGE_SIZE, type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        limit = min(max(limit, 0), MAX_ORGANIZATIONS_PAGE_SIZE)
+        offset = max(offset, 0)
+        
+        search_filter = ''
+        params = []
+        if search:
+            # % и _ в запросе ищутся буквально
+            search_filter = "WHERE o.name LIKE ? ESCAPE '!' OR o.description LIKE ? ESCAPE '!'"
+            pattern = '%' + search.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+            params += [pattern, pattern]
+        
         conn = get_db_connection()
-        orgs = conn.execute('''
-            SELECT o.*, 
-                   COUNT(DISTINCT u.id) as users_count,
-                   COUNT(DISTINCT ic.id) as total_codes,
-                   COUNT(DISTINCT CASE WHEN ic.used_by_telegram_id IS NOT NULL THEN ic.id END) as used_codes
+        orgs = conn.execute(f'''
+            SELECT o.*,
+                   COALESCE(s.users_count, 0) as users_count,
+                   COALESCE(s.total_codes, 0) as total_codes,
+                   COALESCE(s.used_codes, 0) as used_codes,
+                   COUNT(*) OVER () as total_count
             FROM organizations o
-            LEFT JOIN users u ON o.id = u.organization_id
-            LEFT JOIN invite_codes ic ON o.id = ic.organization_id
-            GROUP BY o.id
-            ORDER BY o.created_at DESC
-        ''').fetchall()
+            LEFT JOIN organization_stats s ON s.organization_id = o.id
+            {search_filter}
+            ORDER BY o.created_at DESC, o.id DESC
+            LIMIT ? OFFSET ?
+        ''', params + [limit, offset]).fetchall()
+        
+        if orgs:
+            total = orgs[0]['total_count']
+        else:
+            total = conn.execute(
+                f'SELECT COUNT(*) FROM organizations o {search_filter}', params
+            ).fetchone()[0]
         conn.close()
         
-        return jsonify([dict(org) for org in orgs])
+        organizations = []
+        for org in orgs:
+            org_dict = dict(org)
+            del org_dict['total_count']
+            organizations.append(org_dict)
+        
+        return jsonify({
+            'organizations': organizations,
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'total': total
+            }
+        })
     
     @app.route('/api/admin/organizations', methods=['POST'])
     def create_organization():
         """Создать новую организацию"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         data = request.json
         
         if not telegram_id or not is_admin(telegram_id):
@@ -78,7 +128,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/organizations/<int:org_id>', methods=['PUT'])
     def update_organization(org_id):
         """Обновить организацию"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         data = request.json
         
         if not telegram_id or not is_admin(telegram_id):
@@ -119,7 +169,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/organizations/<int:org_id>', methods=['DELETE'])
     def delete_organization(org_id):
         """Удалить организацию"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         
         if not telegram_id or not is_admin(telegram_id):
             return jsonify({'error': 'Access denied'}), 403
@@ -138,10 +188,57 @@ def setup_admin_routes(app, get_db_connection):
         chars = string.ascii_uppercase + string.digits
         return ''.join(secrets.choice(chars) for _ in range(length))
     
+    def create_invite_codes(conn, org_id, count, expires_at=None):
+        """
+        Создать count инвайт-кодов одной транзакцией
+        
+        Коды генерируются пачкой и вставляются через INSERT OR IGNORE
+        (invite_codes.code UNIQUE): совпавшие с существующими пропускаются
+        и генерируются заново только в нужном количестве. Строки читаются
+        одним запросом по диапазону id - под BEGIN IMMEDIATE других
+        вставок нет, а AUTOINCREMENT не выдаёт id меньше прежних.
+        
+        Returns:
+            Список созданных строк invite_codes
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM invite_codes').fetchone()[0]
+            
+            remaining = count
+            for _ in range(INVITE_CODE_ATTEMPTS):
+                codes = {generate_invite_code() for _ in range(remaining)}
+                conn.executemany(
+                    '''INSERT OR IGNORE INTO invite_codes (code, organization_id, expires_at)
+                       VALUES (?, ?, ?)''',
+                    [(code, org_id, expires_at) for code in codes]
+                )
+                # total_changes учитывает и записи триггеров - считаем новые строки
+                inserted = conn.execute(
+                    'SELECT COUNT(*) FROM invite_codes WHERE id > ?',
+                    (last_id,)
+                ).fetchone()[0]
+                remaining = count - inserted
+                if not remaining:
+                    break
+            else:
+                raise RuntimeError('Could not generate unique invite codes')
+            
+            rows = conn.execute(
+                'SELECT * FROM invite_codes WHERE id > ? ORDER BY id',
+                (last_id,)
+            ).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        return [dict(row) for row in rows]
+    
     @app.route('/api/admin/invite-codes', methods=['GET'])
     def get_invite_codes():
         """Получить инвайт-коды (все или по организации)"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         org_id = request.args.get('organization_id')
         
         if not telegram_id or not is_admin(telegram_id):
@@ -173,7 +270,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/invite-codes/generate', methods=['POST'])
     def generate_invite_codes():
         """Генерация нескольких инвайт-кодов для организации"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         data = request.json
         
         if not telegram_id or not is_admin(telegram_id):
@@ -186,8 +283,8 @@ def setup_admin_routes(app, get_db_connection):
         if not org_id:
             return jsonify({'error': 'organization_id is required'}), 400
         
-        if count < 1 or count > 100:
-            return jsonify({'error': 'Count must be between 1 and 100'}), 400
+        if not isinstance(count, int) or count < 1 or count > MAX_INVITE_CODES_BATCH:
+            return jsonify({'error': f'Count must be between 1 and {MAX_INVITE_CODES_BATCH}'}), 400
         
         conn = get_db_connection()
         
@@ -197,35 +294,17 @@ def setup_admin_routes(app, get_db_connection):
             conn.close()
             return jsonify({'error': 'Organization not found'}), 404
         
-        generated_codes = []
         expires_at = None
         
         if expires_days:
-            expires_at = (datetime.now() + timedelta(days=expires_days)).isoformat()
-        
-        for _ in range(count):
-            # Генерируем уникальный код
-            while True:
-                code = generate_invite_code()
-                existing = conn.execute('SELECT id FROM invite_codes WHERE code = ?', (code,)).fetchone()
-                if not existing:
-                    break
-            
-            cursor = conn.execute(
-                '''INSERT INTO invite_codes (code, organization_id, expires_at) 
-                   VALUES (?, ?, ?)''',
-                (code, org_id, expires_at)
-            )
-            
-            code_data = conn.execute(
-                'SELECT * FROM invite_codes WHERE id = ?',
-                (cursor.lastrowid,)
-            ).fetchone()
-            
-            generated_codes.append(dict(code_data))
+            expires_at = (datetime.now() + timedelta(days=int(expires_days))).isoformat()
         
-        conn.commit()
-        conn.close()
+        try:
+            generated_codes = create_invite_codes(conn, org_id, count, expires_at)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 500
+        finally:
+            conn.close()
         
         return jsonify({
             'success': True,
@@ -236,7 +315,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/invite-codes/<int:code_id>', methods=['PUT'])
     def update_invite_code(code_id):
         """Обновить инвайт-код (активировать/деактивировать)"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         data = request.json
         
         if not telegram_id or not is_admin(telegram_id):
@@ -261,7 +340,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/invite-codes/<int:code_id>', methods=['DELETE'])
     def delete_invite_code(code_id):
         """Удалить инвайт-код"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         
         if not telegram_id or not is_admin(telegram_id):
             return jsonify({'error': 'Access denied'}), 403
@@ -280,7 +359,7 @@ def setup_admin_routes(app, get_db_connection):
         """Проверить валидность инвайт-кода"""
         data = request.json
         code = data.get('code')
-        telegram_id = data.get('telegram_id')
+        telegram_id = request_telegram_id()
         
         if not code or not telegram_id:
             return jsonify({'valid': False, 'error': 'Code and telegram_id required'}), 400
@@ -334,7 +413,7 @@ def setup_admin_routes(app, get_db_connection):
         """Использовать инвайт-код (привязать к пользователю)"""
         data = request.json
         code = data.get('code')
-        telegram_id = data.get('telegram_id')
+        telegram_id = request_telegram_id()
         
         if not code or not telegram_id:
             return jsonify({'error': 'Code and telegram_id required'}), 400
@@ -377,40 +456,76 @@ def setup_admin_routes(app, get_db_connection):
     
     @app.route('/api/admin/users', methods=['GET'])
     def get_users():
-        """Получить список всех пользователей"""
-        telegram_id = request.args.get('telegram_id')
+        """
+        Поиск пользователей (постранично, новые сверху)
+        
+        Query: q - имя, username или телефон (по началу слов, индекс users_fts),
+        role, organization_id (none - без организации), is_banned (0/1),
+        limit (по умолчанию 50), offset
+        """
+        telegram_id = request_telegram_id()
         org_id = request.args.get('organization_id')
+        role = request.args.get('role')
+        is_banned = request.args.get('is_banned')
+        limit = request.args.get('limit', default=USERS_PAGE_SIZE, type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        limit = min(max(limit, 0), MAX_USERS_PAGE_SIZE)
+        offset = max(offset, 0)
         
         if not telegram_id or not is_admin(telegram_id):
             return jsonify({'error': 'Access denied'}), 403
         
+        conditions = []
+        params = []
+        
+        match = fts_query(request.args.get('q'))
+        if match:
+            conditions.append('u.id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)')
+            params.append(match)
+        if role:
+            conditions.append('u.role = ?')
+            params.append(role)
+        if org_id == 'none':
+            conditions.append('u.organization_id IS NULL')
+        elif org_id:
+            conditions.append('u.organization_id = ?')
+            params.append(org_id)
+        if is_banned in ('0', '1'):
+            conditions.append('COALESCE(u.is_banned, 0) = ?')
+            params.append(int(is_banned))
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
         conn = get_db_connection()
         
-        if org_id:
-            users = conn.execute('''
-                SELECT u.*, o.name as organization_name, ic.code as invite_code
-                FROM users u
-                LEFT JOIN organizations o ON u.organization_id = o.id
-                LEFT JOIN invite_codes ic ON u.invite_code_id = ic.id
-                WHERE u.organization_id = ?
-                ORDER BY u.created_at DESC
-            ''', (org_id,)).fetchall()
-        else:
-            users = conn.execute('''
+        try:
+            users = conn.execute(f'''
                 SELECT u.*, o.name as organization_name, ic.code as invite_code
                 FROM users u
                 LEFT JOIN organizations o ON u.organization_id = o.id
                 LEFT JOIN invite_codes ic ON u.invite_code_id = ic.id
-                ORDER BY u.created_at DESC
-            ''').fetchall()
+                {where}
+                ORDER BY u.created_at DESC, u.id DESC
+                LIMIT ? OFFSET ?
+            ''', params + [limit, offset]).fetchall()
+            
+            total = conn.execute(f'SELECT COUNT(*) FROM users u {where}', params).fetchone()[0]
+        finally:
+            conn.close()
         
-        conn.close()
-        return jsonify([dict(user) for user in users])
+        return jsonify({
+            'users': [dict(user) for user in users],
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'total': total
+            }
+        })
     
     @app.route('/api/admin/users/<int:user_telegram_id>', methods=['PUT'])
     def update_user(user_telegram_id):
         """Обновить пользователя (привязка к организации, бан, имя)"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         data = request.json
         
         print(f"[ADMIN] Update user {user_telegram_id}, data: {data}")
@@ -454,6 +569,7 @@ def setup_admin_routes(app, get_db_connection):
             print(f"[ADMIN] Params: {params}")
             conn.execute(query, params)
             conn.commit()
+            identity_cache.invalidate(user_telegram_id)
             print(f"[ADMIN] User {user_telegram_id} updated successfully")
         except Exception as e:
             conn.close()
@@ -476,7 +592,7 @@ def setup_admin_routes(app, get_db_connection):
     @app.route('/api/admin/users/<int:user_telegram_id>', methods=['DELETE'])
     def delete_user(user_telegram_id):
         """Удалить пользователя"""
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         
         if not telegram_id or not is_admin(telegram_id):
             return jsonify({'error': 'Access denied'}), 403
@@ -485,5 +601,6 @@ def setup_admin_routes(app, get_db_connection):
         conn.execute('DELETE FROM users WHERE telegram_id = ?', (user_telegram_id,))
         conn.commit()
         conn.close()
+        identity_cache.invalidate(user_telegram_id)
         
         return jsonify({'success': True})
@@ -5,6 +5,7 @@ from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 import os
 import sqlite3
+import hashlib
 import logging
 from datetime import datetime
 
@@ -19,9 +20,18 @@ logger = logging.getLogger(__name__)
 from truck_config import TRUCK_CATEGORIES, DATABASE_PATH, SECRET_KEY
 from webhook_client import notify_new_order  # Webhook уведомления
 from reviews_api import setup_review_routes  # Расширенная система отзывов
+from profile_api import setup_profile_routes  # Профиль пользователя одним запросом
 from photos_api import setup_photo_routes  # Фотофиксация этапов доставки
 from chat_api import setup_chat_routes  # Система чата
 from admin_api import setup_admin_routes  # Админ панель для организаций
+from events_api import setup_event_routes  # Server-Sent Events для Mini App
+from order_book import order_books, book_stats, TOP_BIDS  # Книга ставок активных заказов
+from identity import identity_cache, resolve_user, resolve_user_by_id  # Кэш пользователей по telegram_id
+from auth import setup_auth_routes, current_user, request_telegram_id  # Сессии Mini App (Telegram initData)
+from admin_api import is_admin  # Список админов
+from search import fts_query  # Строка поиска -> MATCH для FTS5
+from geo import geocode, grid_cell, nearby_cells, lon_scale, distance_km, MATCH_RADIUS_CELLS, MAX_NEAR_RADIUS_CELLS  # Координаты адресов и сетка ячеек
+from auction import AuctionEngine, ranked_bids, MAX_PAGE_SIZE  # Правила подбора и выбор победителя
 
 app = Flask(__name__)
 CORS(app)
@@ -29,6 +39,8 @@ CORS(app)
 # Конфигурация
 app.config['SECRET_KEY'] = SECRET_KEY
 
+auction_engine = AuctionEngine()
+
 def get_db_connection():
     """Создание подключения к БД"""
     # Создаём папку для БД если не существует
@@ -63,6 +75,105 @@ def dict_from_row(row):
     """Преобразование Row в dict"""
     return dict(zip(row.keys(), row)) if row else None
 
+def get_orders_feed_etag(conn, user_id, feed, variant=''):
+    """
+    ETag ленты заказов по версиям (orders.version поддерживается триггерами)
+
+    Один запрос по индексам вместо сборки всей ленты.
+    feed: 'customer' или 'driver'
+    variant: параметры запроса, от которых зависит содержимое (режим "рядом")
+    """
+    if feed == 'customer':
+        # Своя лента заказчика: свои заказы + оставленные отзывы + имя и телефон
+        # назначенных водителей (users.profile_version растёт при их изменении)
+        row = conn.execute(
+            '''SELECT (SELECT MAX(version) FROM orders WHERE customer_id = ?),
+                      (SELECT COUNT(*) FROM orders WHERE customer_id = ?),
+                      (SELECT COUNT(*) FROM reviews WHERE reviewer_id = ?),
+                      (SELECT COALESCE(SUM(d.profile_version), 0)
+                       FROM users d
+                       WHERE d.id IN (SELECT winner_driver_id FROM orders WHERE customer_id = ?))''',
+            (user_id, user_id, user_id, user_id)
+        ).fetchone()
+    else:
+        # Вкладка "Открытые" зависит от любых активных заказов - берём глобальный максимум
+        # и от базы водителя (фильтр по ячейкам). Имена и телефоны заказчиков -
+        # из любых заказов, поэтому и общий счётчик users_version
+        row = conn.execute(
+            '''SELECT (SELECT MAX(version) FROM orders),
+                      (SELECT COUNT(*) FROM reviews WHERE reviewer_id = ?),
+                      (SELECT COUNT(*) || ':' || COALESCE(MAX(id), 0) FROM driver_vehicles WHERE driver_id = ?),
+                      (SELECT home_cell FROM users WHERE id = ?),
+                      (SELECT version FROM users_version WHERE id = 1)''',
+            (user_id, user_id, user_id)
+        ).fetchone()
+
+    token = f"{feed}:{user_id}:{variant}:" + ':'.join(str(value) for value in row)
+    return hashlib.sha1(token.encode()).hexdigest()[:20]
+
+def get_nearby_open_orders(conn, driver_id, lat, lon, radius):
+    """
+    Открытые заявки рядом с точкой, ближайшие первыми
+    
+    Кандидаты берутся только из ячеек сетки вокруг точки (индекс
+    orders(status, pickup_cell)), поэтому работа не растёт с общим числом
+    заказов. Сортируются только id по расстоянию в плоской проекции, полные
+    строки читаются для первых 50. Заказы без координат сюда не попадают.
+    """
+    cells = nearby_cells(grid_cell(lat, lon), radius)
+    return conn.execute(
+        f'''SELECT o.*
+           FROM (
+               SELECT id,
+                      (pickup_lat - ?) * (pickup_lat - ?)
+                      + (pickup_lon - ?) * (pickup_lon - ?) * ? as distance
+               FROM orders
+               WHERE status = 'active'
+                 AND pickup_cell IN ({','.join('?' * len(cells))})
+                 AND truck_type IN (SELECT truck_type FROM driver_vehicles WHERE driver_id = ?)
+                 AND NOT EXISTS (
+                     SELECT 1 FROM bids b WHERE b.order_id = orders.id AND b.driver_id = ?
+                 )
+               ORDER BY distance, id
+               LIMIT 50
+           ) nearby
+           JOIN orders o ON o.id = nearby.id
+           ORDER BY nearby.distance, o.id''',
+        (lat, lat, lon, lon, lon_scale(lat) ** 2, *cells, driver_id, driver_id)
+    ).fetchall()
+
+def near_origin(home):
+    """
+    Точка для ленты "рядом": ?lat=&lon= (геопозиция устройства) или база водителя
+    
+    Returns:
+        (lat, lon) или None
+    """
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return lat, lon
+    except (KeyError, ValueError):
+        pass
+    if home['home_lat'] is not None and home['home_lon'] is not None:
+        return home['home_lat'], home['home_lon']
+    return None
+
+def feed_response(result, etag):
+    """JSON-ответ ленты с ETag (клиент перепроверяет его при каждом опросе)"""
+    response = jsonify(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def feed_not_modified(etag):
+    """304 Not Modified для ленты заказов"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # === МАРШРУТЫ ===
 
 @app.route('/')
@@ -88,7 +199,7 @@ def admin_panel():
 @app.route('/api/user', methods=['GET'])
 def get_user():
     """Получение данных пользователя по telegram_id"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     
     if not telegram_id:
         return jsonify({'error': 'telegram_id required'}), 400
@@ -103,15 +214,12 @@ def get_user():
     all_users = conn.execute('SELECT telegram_id, name, role FROM users LIMIT 10').fetchall()
     logger.info(f"Users in DB: {[dict(u) for u in all_users]}")
     
-    user = conn.execute(
-        'SELECT * FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    user = resolve_user(conn, telegram_id)
     conn.close()
     
     if user:
-        logger.info(f"User found: {dict(user)}")
-        return jsonify(dict_from_row(user))
+        logger.info(f"User found: {user}")
+        return jsonify(user)
     
     logger.error(f"User NOT found for telegram_id={telegram_id}")
     return jsonify({
@@ -177,7 +285,7 @@ def get_truck_types():
 @app.route('/api/customer/orders', methods=['GET'])
 def get_customer_orders():
     """Получение всех заказов заказчика, сгруппированных по статусам"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     
     if not telegram_id:
         return jsonify({'error': 'telegram_id required'}), 400
@@ -185,16 +293,20 @@ def get_customer_orders():
     conn = get_db_connection()
     
     # Получаем ID пользователя
-    user = conn.execute(
-        'SELECT id FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    user = current_user(conn)
     
     if not user:
         conn.close()
         return jsonify({'error': 'User not found'}), 404
     
-    # Получаем все заказы с контактами водителя (для завершенных)
+    # Ничего не изменилось с прошлого опроса - отдаём 304 без сборки ленты
+    etag = get_orders_feed_etag(conn, user['id'], 'customer')
+    if etag in request.if_none_match:
+        conn.close()
+        return feed_not_modified(etag)
+    
+    # Получаем все заказы с контактами водителя (для завершенных).
+    # Ставки активных заказов считаются по книгам в памяти, остальных - в запросе
     orders = conn.execute(
         '''SELECT o.*, 
                   COUNT(DISTINCT b.id) as bids_count,
@@ -211,7 +323,7 @@ def get_customer_orders():
                   o.driver_completed_at,
                   (SELECT COUNT(*) FROM reviews WHERE order_id = o.id AND reviewer_id = ?) as customer_reviewed
            FROM orders o
-           LEFT JOIN bids b ON o.id = b.order_id
+           LEFT JOIN bids b ON o.id = b.order_id AND o.status != 'active'
            LEFT JOIN users winner ON o.winner_driver_id = winner.id
            WHERE o.customer_id = ?
            GROUP BY o.id
@@ -219,6 +331,8 @@ def get_customer_orders():
         (user['id'], user['id'])
     ).fetchall()
     
+    books = order_books.get_many(conn, [order for order in orders if order['status'] == 'active'])
+    
     conn.close()
     
     # Группируем по статусам
@@ -241,6 +355,7 @@ def get_customer_orders():
             # Заявки с завершенным подбором показываем во вкладке "В процессе"
             result['in_progress'].append(order_data)
         elif status == 'active':
+            order_data['bids_count'], order_data['min_bid_price'] = book_stats(books.get(order['id']))
             if order_data['bids_count'] > 0:
                 result['searching'].append(order_data)
             else:
@@ -249,12 +364,12 @@ def get_customer_orders():
             # Legacy статусы - переводим в closed
             result['closed'].append(order_data)
     
-    return jsonify(result)
+    return feed_response(result, etag)
 
 @app.route('/api/orders', methods=['POST'])
 def create_order():
     """Создание новой заявки"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     data = request.json
     
     logger.info(f"Create order request: telegram_id={telegram_id}, data={data}")
@@ -274,10 +389,7 @@ def create_order():
         logger.info(f"DB connected: {DATABASE_PATH}")
         
         # Получаем ID пользователя (по схеме БД бота - используем id, не telegram_id)
-        user = conn.execute(
-            'SELECT id FROM users WHERE telegram_id = ?',
-            (telegram_id,)
-        ).fetchone()
+        user = current_user(conn)
         
         if not user:
             conn.close()
@@ -290,13 +402,19 @@ def create_order():
         from datetime import timedelta
         expires_at = (datetime.now() + timedelta(minutes=2)).isoformat()
         
+        # Координаты по локальному справочнику; без них заказ видят все водители
+        pickup = geocode(conn, data.get('pickup_location')) or {}
+        delivery = geocode(conn, data['delivery_location']) or {}
+        
         # Создаем заказ по схеме БД бота
         cursor = conn.execute(
             '''INSERT INTO orders (
                 customer_id, truck_type, cargo_description, delivery_address,
                 status, created_at, expires_at,
-                pickup_address, pickup_time, delivery_time, max_price, delivery_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                pickup_address, pickup_time, delivery_time, max_price, delivery_date,
+                pickup_lat, pickup_lon, pickup_cell,
+                delivery_lat, delivery_lon, delivery_cell
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
             (
                 user['id'],  # customer_id - это users.id
                 data['truck_type_id'],  # truck_type - строка вида "manipulator_5t"
@@ -309,7 +427,13 @@ def create_order():
                 data.get('pickup_time'),  # pickup_time
                 data.get('delivery_time'),  # delivery_time
                 data.get('price', 0),  # max_price
-                data.get('delivery_date')  # delivery_date
+                data.get('delivery_date'),  # delivery_date
+                pickup.get('lat'),
+                pickup.get('lon'),
+                pickup.get('cell'),
+                delivery.get('lat'),
+                delivery.get('lon'),
+                delivery.get('cell')
             )
         )
         
@@ -340,7 +464,8 @@ def create_order():
                 pickup_address=data.get('pickup_location'),
                 pickup_time=data.get('pickup_time'),
                 delivery_time=data.get('delivery_time'),
-                delivery_date=data.get('delivery_date')
+                delivery_date=data.get('delivery_date'),
+                pickup_cells=nearby_cells(pickup['cell']) if pickup else None
             )
             logger.info(f"Webhook sent successfully")
         except Exception as e:
@@ -360,7 +485,7 @@ def create_order():
 @app.route('/api/orders/<int:order_id>/bids', methods=['GET'])
 def get_order_bids(order_id):
     """Получение всех предложений по заказу с контактами водителей"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     
     if not telegram_id:
         return jsonify({'error': 'telegram_id required'}), 400
@@ -368,17 +493,14 @@ def get_order_bids(order_id):
     conn = get_db_connection()
     
     # Проверяем, что пользователь - заказчик этой заявки
-    user = conn.execute(
-        'SELECT id FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    user = current_user(conn)
     
     if not user:
         conn.close()
         return jsonify({'error': 'User not found'}), 404
     
     order = conn.execute(
-        'SELECT customer_id, status FROM orders WHERE id = ?',
+        'SELECT id, customer_id, status, version FROM orders WHERE id = ?',
         (order_id,)
     ).fetchone()
     
@@ -390,9 +512,19 @@ def get_order_bids(order_id):
         conn.close()
         return jsonify({'error': 'Access denied'}), 403
     
+    # Во время подбора топ-5 берём из книги ставок в памяти, из БД -
+    # только данные водителей этих ставок
+    book = order_books.get(conn, order)
+    bid_filter = 'b.order_id = ?'
+    params = [order_id]
+    if book is not None:
+        top_ids = [bid['bid_id'] for bid in book.top(TOP_BIDS)] or [None]
+        bid_filter += f" AND b.id IN ({', '.join('?' * len(top_ids))})"
+        params += top_ids
+    
     # Получаем предложения с полной информацией о водителях
     bids = conn.execute(
-        '''SELECT b.id,
+        f'''SELECT b.id,
                   b.order_id,
                   b.driver_id,
                   b.price,
@@ -400,30 +532,93 @@ def get_order_bids(order_id):
                   u.name, 
                   u.phone_number, 
                   u.telegram_id as driver_telegram_id,
-                  COALESCE((SELECT AVG(r2.rating) FROM reviews r2 WHERE r2.reviewee_id = u.id), 0) as driver_rating,
-                  COALESCE((SELECT COUNT(r3.id) FROM reviews r3 WHERE r3.reviewee_id = u.id), 0) as review_count
+                  COALESCE(ROUND(s.rating_sum * 1.0 / NULLIF(s.review_count, 0), 2), 0) as driver_rating,
+                  COALESCE(s.review_count, 0) as review_count
            FROM bids b
            JOIN users u ON b.driver_id = u.id
-           WHERE b.order_id = ?
-           ORDER BY b.price ASC''',
-        (order_id,)
+           LEFT JOIN driver_stats s ON s.driver_id = b.driver_id
+           WHERE {bid_filter}
+           ORDER BY b.price ASC, b.id ASC''',
+        params
     ).fetchall()
     
     conn.close()
     
     # Показываем только ТОП-5 или все (в зависимости от статуса заказа)
-    if order['status'] == 'active' and len(bids) > 5:
+    if order['status'] == 'active' and len(bids) > TOP_BIDS:
         # Для активных заказов показываем только топ-5
-        bids = bids[:5]
+        bids = bids[:TOP_BIDS]
     
     return jsonify([dict_from_row(bid) for bid in bids])
 
+@app.route('/api/orders/<int:order_id>/bids/ranked', methods=['GET'])
+def get_order_bids_ranked(order_id):
+    """
+    Предложения по заказу по композитной оценке (цена, рейтинг,
+    доля завершённых заказов, время отклика) с постраничной выдачей
+    
+    Query: telegram_id, limit (по умолчанию 20), offset
+    """
+    telegram_id = request_telegram_id()
+    limit = request.args.get('limit', default=20, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+    
+    limit = min(max(limit, 0), MAX_PAGE_SIZE)
+    offset = max(offset, 0)
+    
+    conn = get_db_connection()
+    
+    user = current_user(conn)
+    
+    if not user:
+        conn.close()
+        return jsonify({'error': 'User not found'}), 404
+    
+    order = conn.execute(
+        'SELECT id, customer_id, status FROM orders WHERE id = ?',
+        (order_id,)
+    ).fetchone()
+    
+    if not order:
+        conn.close()
+        return jsonify({'error': 'Order not found'}), 404
+        
+    if order['customer_id'] != user['id']:
+        conn.close()
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Во время подбора заказчику видны только первые TOP_BIDS ставок
+    visible = TOP_BIDS if order['status'] == 'active' else None
+    if visible is not None:
+        limit = min(limit, max(visible - offset, 0))
+    
+    bids, total = ranked_bids(conn, order_id, limit=limit, offset=offset)
+    conn.close()
+    
+    if visible is not None:
+        total = min(total, visible)
+    
+    return jsonify({
+        'bids': bids,
+        'total': total,
+        'limit': limit,
+        'offset': offset
+    })
+
 # === ВОДИТЕЛЬ - Управление предложениями ===
 
 @app.route('/api/driver/orders', methods=['GET'])
 def get_driver_orders():
-    """Получение заказов для водителя, сгруппированных по статусам"""
-    telegram_id = request.args.get('telegram_id')
+    """
+    Получение заказов для водителя, сгруппированных по статусам
+    
+    ?open=near - вкладка "Открытые" по расстоянию от ?lat=&lon= или базы
+    водителя (в пределах ?radius= ячеек сетки, по умолчанию соседних)
+    """
+    telegram_id = request_telegram_id()
     
     if not telegram_id:
         return jsonify({'error': 'telegram_id required'}), 400
@@ -431,15 +626,30 @@ def get_driver_orders():
     conn = get_db_connection()
     
     # Получаем ID пользователя
-    user = conn.execute(
-        'SELECT id FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    user = current_user(conn)
     
     if not user:
         conn.close()
         return jsonify({'error': 'User not found'}), 404
     
+    # База - из строки users (в токене сессии её нет)
+    home = resolve_user_by_id(conn, user['id'])
+    
+    if not home:
+        # Сессия пережила удаление пользователя
+        conn.close()
+        return jsonify({'error': 'User not found'}), 404
+    
+    near = request.args.get('open') == 'near'
+    origin = near_origin(home) if near else None
+    radius = min(max(request.args.get('radius', MATCH_RADIUS_CELLS, type=int), 0), MAX_NEAR_RADIUS_CELLS)
+    variant = f"near:{origin[0]:.4f}:{origin[1]:.4f}:{radius}" if origin else ('near' if near else '')
+    
+    etag = get_orders_feed_etag(conn, user['id'], 'driver', variant)
+    if etag in request.if_none_match:
+        conn.close()
+        return feed_not_modified(etag)
+    
     result = {
         'open': [],         # Открытые заявки (можно сделать предложение)
         'my_bids': [],      # Заявки с моими предложениями
@@ -450,39 +660,46 @@ def get_driver_orders():
     
     # Получаем открытые заявки (без предложений от этого водителя)
     # Фильтруем по типам машин водителя через driver_vehicles
-    open_orders = conn.execute(
-        '''SELECT o.*, 
-                  COUNT(DISTINCT b.id) as bids_count,
-                  MIN(b.price) as min_bid_price
-           FROM orders o
-           LEFT JOIN bids b ON o.id = b.order_id
-           INNER JOIN driver_vehicles dv ON o.truck_type = dv.truck_type
-           WHERE o.status = 'active'
-             AND dv.driver_id = ?
-             AND o.id NOT IN (
-                 SELECT order_id FROM bids WHERE driver_id = ?
-             )
-           GROUP BY o.id
-           ORDER BY o.created_at DESC
-           LIMIT 50''',
-        (user['id'], user['id'])
-    ).fetchall()
+    # Количество ставок и минимальная цена - из книг ставок в памяти
+    if near:
+        # Ближайшие к точке; без точки (нет базы и геопозиции) - пусто
+        open_orders = get_nearby_open_orders(conn, user['id'], *origin, radius) if origin else []
+    else:
+        # Новые первыми; если задана база - только рядом с ней (заказы без координат видны всем)
+        cell_filter = ''
+        cells = []
+        if home['home_cell'] is not None:
+            cells = nearby_cells(home['home_cell'])
+            cell_filter = f"AND (o.pickup_cell IS NULL OR o.pickup_cell IN ({','.join('?' * len(cells))}))"
+        
+        open_orders = conn.execute(
+            f'''SELECT o.*
+               FROM orders o
+               INNER JOIN driver_vehicles dv ON o.truck_type = dv.truck_type
+               WHERE o.status = 'active'
+                 AND dv.driver_id = ?
+                 {cell_filter}
+                 AND o.id NOT IN (
+                     SELECT order_id FROM bids WHERE driver_id = ?
+                 )
+               ORDER BY o.created_at DESC
+               LIMIT 50''',
+            (user['id'], *cells, user['id'])
+        ).fetchall()
     
     # Заявки с предложениями от водителя (подбор еще идет)
     my_bids_orders = conn.execute(
-        '''SELECT o.*, b.price as my_bid_price, b.id as bid_id,
-                  COUNT(DISTINCT b2.id) as total_bids,
-                  MIN(b2.price) as min_bid_price
+        '''SELECT o.*, b.price as my_bid_price, b.id as bid_id
            FROM orders o
            JOIN bids b ON o.id = b.order_id
-           LEFT JOIN bids b2 ON o.id = b2.order_id
            WHERE b.driver_id = ? 
              AND o.status = 'active'
-           GROUP BY o.id
            ORDER BY o.created_at DESC''',
         (user['id'],)
     ).fetchall()
     
+    books = order_books.get_many(conn, list(open_orders) + list(my_bids_orders))
+    
     # Выигранные заявки (подбор завершен, этот водитель победитель, но еще не начата работа)
     # Оставляем пустым - они сразу переходят в in_progress
     won_orders = []
@@ -525,18 +742,72 @@ def get_driver_orders():
     
     conn.close()
     
-    result['open'] = [dict_from_row(order) for order in open_orders] if open_orders else []
-    result['my_bids'] = [dict_from_row(order) for order in my_bids_orders] if my_bids_orders else []
+    for order in open_orders:
+        order_data = dict_from_row(order)
+        order_data['bids_count'], order_data['min_bid_price'] = book_stats(books.get(order['id']))
+        if origin:
+            order_data['distance_km'] = round(distance_km(*origin, order['pickup_lat'], order['pickup_lon']), 1)
+        result['open'].append(order_data)
+    
+    for order in my_bids_orders:
+        order_data = dict_from_row(order)
+        order_data['total_bids'], order_data['min_bid_price'] = book_stats(books.get(order['id']))
+        result['my_bids'].append(order_data)
+    
     result['won'] = [dict_from_row(order) for order in won_orders] if won_orders else []
     result['in_progress'] = [dict_from_row(order) for order in in_progress_orders] if in_progress_orders else []
     result['closed'] = [dict_from_row(order) for order in closed_orders] if closed_orders else []
     
-    return jsonify(result)
+    return feed_response(result, etag)
+
+@app.route('/api/driver/home-base', methods=['POST'])
+def set_driver_home_base():
+    """
+    База водителя: открытые заказы и уведомления - только рядом с ней
+    
+    Адрес ищется в локальном справочнике (geo.py); пустой адрес убирает базу.
+    """
+    telegram_id = request_telegram_id()
+    data = request.json or {}
+    
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+    
+    conn = get_db_connection()
+    
+    try:
+        user = current_user(conn)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        if user['role'] != 'driver':
+            return jsonify({'error': 'Only drivers have a home base'}), 403
+        
+        address = (data.get('address') or '').strip()
+        place = geocode(conn, address) if address else {}
+        if place is None:
+            return jsonify({'error': 'Address not found'}), 422
+        
+        conn.execute(
+            'UPDATE users SET home_address = ?, home_lat = ?, home_lon = ?, home_cell = ? WHERE id = ?',
+            (address or None, place.get('lat'), place.get('lon'), place.get('cell'), user['id'])
+        )
+        conn.commit()
+        identity_cache.invalidate(user['telegram_id'])
+        
+        return jsonify({
+            'home_address': address or None,
+            'place': place.get('place'),
+            'lat': place.get('lat'),
+            'lon': place.get('lon')
+        })
+    finally:
+        conn.close()
 
 @app.route('/api/bids', methods=['POST'])
 def create_bid():
     """Создание предложения на заказ"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     data = request.json
     
     if not telegram_id:
@@ -548,54 +819,33 @@ def create_bid():
     
     conn = get_db_connection()
     
-    # Получаем ID пользователя
-    user = conn.execute(
-        'SELECT id FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    # Получаем пользователя (данные нужны и для истории заказа)
+    user = current_user(conn)
+    
+    conn.close()
     
     if not user:
-        conn.close()
         return jsonify({'error': 'User not found'}), 404
     
-    # Проверяем, существует ли уже предложение
-    existing = conn.execute(
-        'SELECT id FROM bids WHERE order_id = ? AND driver_id = ?',
-        (data['order_id'], user['id'])
-    ).fetchone()
-    
-    if existing:
-        conn.close()
-        return jsonify({'error': 'Bid already exists'}), 400
-    
-    # Создаем предложение
-    cursor = conn.execute(
-        '''INSERT INTO bids (order_id, driver_id, price)
-           VALUES (?, ?, ?)''',
-        (
-            data['order_id'],
-            user['id'],
-            data['price']
-        )
+    # Ставка, история и push-события пишутся одной транзакцией вместе
+    # со ставками параллельных запросов (bid_ingest.py)
+    from bid_ingest import bid_ingestor, BID_CREATED, BID_EXISTS, BID_ORDER_NOT_FOUND, BID_AUCTION_CLOSED
+    bid = bid_ingestor.submit(
+        data['order_id'], user, data['price'],
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent')
     )
     
-    bid_id = cursor.lastrowid
-    conn.commit()
-    
-    # Логируем добавление ставки
-    from order_logger import log_order_change, ACTION_BID_ADDED
-    log_order_change(
-        conn=conn,
-        order_id=data['order_id'],
-        user_id=user['id'],
-        action=ACTION_BID_ADDED,
-        description=f"Добавлена ставка: {data['price']} ₽",
-        new_value=str(data['price'])
-    )
-    
-    conn.close()
+    if bid.status == BID_EXISTS:
+        return jsonify({'error': 'Bid already exists'}), 400
+    if bid.status == BID_ORDER_NOT_FOUND:
+        return jsonify({'error': 'Order not found'}), 404
+    if bid.status == BID_AUCTION_CLOSED:
+        return jsonify({'error': 'Auction is closed'}), 400
+    if bid.status != BID_CREATED:
+        return jsonify({'error': 'Failed to create bid'}), 500
     
-    return jsonify({'id': bid_id, 'message': 'Bid created successfully'})
+    return jsonify({'id': bid.bid_id, 'message': 'Bid created successfully'})
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 def get_order_details(order_id):
@@ -619,8 +869,7 @@ def get_order_details(order_id):
 @app.route('/api/orders/<int:order_id>/confirm-completion', methods=['POST'])
 def confirm_order_completion(order_id):
     """Подтверждение выполнения заказа одной из сторон"""
-    data = request.json
-    telegram_id = data.get('telegram_id')
+    telegram_id = request_telegram_id()
     
     if not telegram_id:
         return jsonify({'error': 'telegram_id is required'}), 400
@@ -783,7 +1032,7 @@ def confirm_order_completion(order_id):
 def cancel_order(order_id):
     """Отмена заказа одной из сторон"""
     data = request.json
-    telegram_id = data.get('telegram_id')
+    telegram_id = request_telegram_id()
     cancellation_reason = data.get('cancellation_reason', '')
     
     if not telegram_id:
@@ -856,6 +1105,7 @@ def cancel_order(order_id):
         )
     
     conn.commit()
+    order_books.drop(order_id)
     
     # Логируем отмену заказа
     from order_logger import log_order_change, ACTION_CANCELLED, ACTION_STATUS_CHANGED
@@ -913,7 +1163,7 @@ def cancel_order(order_id):
 def select_auction_winner(order_id):
     """Ручной выбор исполнителя заказчиком (досрочное завершение подбора)"""
     data = request.json
-    telegram_id = data.get('telegram_id')
+    telegram_id = request_telegram_id()
     bid_id = data.get('bid_id')
     
     if not telegram_id or not bid_id:
@@ -959,75 +1209,15 @@ def select_auction_winner(order_id):
         conn.close()
         return jsonify({'error': 'Bid not found'}), 404
     
-    # Обновляем заказ: устанавливаем победителя и статус in_progress
-    conn.execute(
-        '''UPDATE orders 
-           SET status = 'in_progress', 
-               winner_driver_id = ?,
-               winning_price = ?
-           WHERE id = ?''',
-        (bid['driver_id'], bid['price'], order_id)
-    )
-    conn.commit()
-    
-    # Логируем выбор исполнителя
-    from order_logger import log_order_change, ACTION_WINNER_SELECTED, ACTION_STATUS_CHANGED
-    log_order_change(
-        conn=conn,
-        order_id=order_id,
-        user_id=order['customer_id'],
-        action=ACTION_WINNER_SELECTED,
-        description=f"Выбран исполнитель: {bid['driver_name']} (цена: {bid['price']} ₽)",
-        new_value=str(bid['driver_id'])
-    )
-    log_order_change(
-        conn=conn,
-        order_id=order_id,
-        user_id=order['customer_id'],
-        action=ACTION_STATUS_CHANGED,
-        field_name='status',
-        old_value=order['status'],
-        new_value='in_progress'
-    )
-    
-    # Получаем данные заказчика
-    customer = conn.execute(
-        'SELECT phone_number, username FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    # Назначаем исполнителя (статус in_progress) и уведомляем стороны
+    if not auction_engine.award(conn, order, bid, user_id=order['customer_id']):
+        conn.close()
+        return jsonify({'error': 'Order is not active'}), 400
+    order_books.drop(order_id)
+    auction_engine.notify_award(conn, order, bid)
     
     conn.close()
     
-    # Отправляем уведомление выбранному водителю через webhook
-    try:
-        from webhook_client import notify_auction_complete, notify_status_changed
-        
-        notify_auction_complete(
-            order_id=order_id,
-            winner_telegram_id=bid['driver_telegram_id'],
-            winner_user_id=bid['driver_id'],
-            winner_username=bid['driver_username'] if bid['driver_username'] else None,
-            winning_price=bid['price'],
-            cargo_description=order['cargo_description'],
-            delivery_address=order['delivery_address'],
-            customer_user_id=telegram_id,
-            customer_username=customer['username'] if customer and customer['username'] else None,
-            customer_phone=customer['phone_number'] if customer else '',
-            driver_phone=bid['driver_phone']
-        )
-        
-        # Уведомляем об изменении статуса
-        notify_status_changed(
-            order_id=order_id,
-            old_status=order['status'],
-            new_status='in_progress',
-            customer_telegram_id=telegram_id,
-            driver_telegram_id=bid['driver_telegram_id'],
-            cargo_description=order['cargo_description']
-        )
-    except Exception as e:
-        logger.error(f"Failed to send webhook notification: {e}")
-    
     return jsonify({
         'success': True,
         'message': 'Winner selected, order moved to in_progress',
@@ -1050,10 +1240,6 @@ def debug_db_info():
         # Считаем пользователей
         users_count = conn.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
         
-        # Получаем список всех пользователей
-        users = conn.execute('SELECT telegram_id, name, role, phone_number FROM users').fetchall()
-        users_list = [dict(u) for u in users]
-        
         # Считаем заказы
         orders_count = conn.execute('SELECT COUNT(*) as count FROM orders').fetchone()['count']
         
@@ -1062,7 +1248,6 @@ def debug_db_info():
         return jsonify({
             'database_path': db_path,
             'users_count': users_count,
-            'users': users_list,
             'orders_count': orders_count,
             'status': 'ok'
         })
@@ -1077,17 +1262,14 @@ def get_user_info(telegram_id):
     """Получение информации о пользователе"""
     conn = get_db_connection()
     
-    user = conn.execute(
-        'SELECT id, telegram_id, name, phone_number, role FROM users WHERE telegram_id = ?',
-        (telegram_id,)
-    ).fetchone()
+    user = resolve_user(conn, telegram_id)
     
     conn.close()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(dict_from_row(user))
+    return jsonify({key: user[key] for key in ('id', 'telegram_id', 'name', 'phone_number', 'role')})
 
 @app.route('/api/user/<int:telegram_id>/rating', methods=['GET'])
 def get_user_rating(telegram_id):
@@ -1095,7 +1277,7 @@ def get_user_rating(telegram_id):
     conn = get_db_connection()
     
     # Находим пользователя
-    user = conn.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    user = resolve_user(conn, telegram_id)
     
     if not user:
         conn.close()
@@ -1122,7 +1304,7 @@ def get_user_stats(telegram_id):
     conn = get_db_connection()
     
     # Находим пользователя
-    user = conn.execute('SELECT id, role FROM users WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    user = resolve_user(conn, telegram_id)
     
     if not user:
         conn.close()
@@ -1152,7 +1334,7 @@ def get_user_reviews(telegram_id):
     conn = get_db_connection()
     
     # Находим пользователя
-    user = conn.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    user = resolve_user(conn, telegram_id)
     
     if not user:
         conn.close()
@@ -1175,7 +1357,7 @@ def get_user_reviews(telegram_id):
 @app.route('/api/reviews', methods=['POST'])
 def create_review():
     """Создание отзыва"""
-    telegram_id = request.args.get('telegram_id')
+    telegram_id = request_telegram_id()
     data = request.get_json()
     
     if not telegram_id:
@@ -1195,7 +1377,7 @@ def create_review():
     conn = get_db_connection()
     
     # Находим пользователя
-    reviewer = conn.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    reviewer = current_user(conn)
     
     if not reviewer:
         conn.close()
@@ -1271,23 +1453,141 @@ def get_order_change_history(order_id):
 
 @app.route('/api/history', methods=['GET'])
 def get_all_history():
-    """Получить всю историю изменений с фильтрами"""
+    """
+    Получить историю изменений с фильтрами
+    
+    Админ видит всю историю, остальные - только по своим заказам (заказчик
+    или исполнитель) и без IP-адресов и User-Agent.
+    
+    Query: telegram_id, order_id, user_id, q - поиск по описанию и значениям
+    (order_history_fts), limit (по умолчанию 100), offset
+    """
     from order_logger import get_order_history
     
+    telegram_id = request_telegram_id()
     order_id = request.args.get('order_id', type=int)
     user_id = request.args.get('user_id', type=int)
     limit = request.args.get('limit', default=100, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    limit = min(max(limit, 0), MAX_PAGE_SIZE)
+    search = fts_query(request.args.get('q'))
+    
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
     
     conn = get_db_connection()
     
     try:
-        history = get_order_history(conn, order_id=order_id, user_id=user_id, limit=limit)
-        conn.close()
+        admin = is_admin(telegram_id)
+        user = None if admin else current_user(conn)
+        
+        if not admin and not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        history = get_order_history(conn, order_id=order_id, user_id=user_id, limit=limit,
+                                    search=search, offset=max(offset, 0),
+                                    participant_id=None if admin else user['id'])
+        if not admin:
+            for entry in history:
+                entry.pop('ip_address', None)
+                entry.pop('user_agent', None)
         return jsonify(history)
     except Exception as e:
-        conn.close()
         logger.error(f"Error fetching history: {e}")
         return jsonify({'error': 'Failed to fetch history'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/orders/search', methods=['GET'])
+def search_orders():
+    """
+    Поиск заказов по описанию груза и адресам (orders_fts)
+    
+    Админ ищет по всем заказам, остальные - по своим (заказчик или исполнитель).
+    С q заказы идут по релевантности, без него - новые сверху.
+    
+    Query: telegram_id, q, status, order_id, user_id (заказчик или исполнитель,
+    только для админа), limit (по умолчанию 20), offset
+    """
+    telegram_id = request_telegram_id()
+    status = request.args.get('status')
+    order_id = request.args.get('order_id', type=int)
+    user_id = request.args.get('user_id', type=int)
+    limit = request.args.get('limit', default=20, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    limit = min(max(limit, 0), MAX_PAGE_SIZE)
+    offset = max(offset, 0)
+    
+    if not telegram_id:
+        return jsonify({'error': 'telegram_id required'}), 400
+    
+    conn = get_db_connection()
+    
+    try:
+        admin = is_admin(telegram_id)
+        user = None if admin else current_user(conn)
+        
+        if not admin and not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        conditions = []
+        params = []
+        
+        match = fts_query(request.args.get('q'))
+        if match:
+            source = 'orders_fts f JOIN orders o ON o.id = f.rowid'
+            conditions.append('orders_fts MATCH ?')
+            params.append(match)
+            order_by = 'f.rank, o.created_at DESC'
+        else:
+            source = 'orders o'
+            order_by = 'o.created_at DESC, o.id DESC'
+        
+        if admin:
+            if user_id:
+                conditions.append('(o.customer_id = ? OR o.winner_driver_id = ?)')
+                params += [user_id, user_id]
+        else:
+            conditions.append('(o.customer_id = ? OR o.winner_driver_id = ?)')
+            params += [user['id'], user['id']]
+        if status:
+            conditions.append('o.status = ?')
+            params.append(status)
+        if order_id:
+            conditions.append('o.id = ?')
+            params.append(order_id)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        orders = conn.execute(
+            f'''SELECT o.*,
+                      customer.name as customer_name,
+                      customer.telegram_id as customer_telegram_id,
+                      driver.name as driver_name,
+                      driver.telegram_id as driver_telegram_id,
+                      (SELECT COUNT(*) FROM order_history h WHERE h.order_id = o.id) as history_count
+               FROM {source}
+               LEFT JOIN users customer ON o.customer_id = customer.id
+               LEFT JOIN users driver ON o.winner_driver_id = driver.id
+               {where}
+               ORDER BY {order_by}
+               LIMIT ? OFFSET ?''',
+            params + [limit, offset]
+        ).fetchall()
+        
+        total = conn.execute(f'SELECT COUNT(*) FROM {source} {where}', params).fetchone()[0]
+        
+        return jsonify({
+            'orders': [dict_from_row(order) for order in orders],
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'total': total
+            }
+        })
+    
+    finally:
+        conn.close()
 
 @app.route('/api/admin/orders/full', methods=['GET'])
 def get_all_orders_with_history():
@@ -1335,7 +1635,7 @@ def get_all_orders_with_history():
 def get_report_stats():
     """Получение статистики по заказам для отчёта"""
     try:
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         period = request.args.get('period', 'all')
         status = request.args.get('status', 'all')
         pickup_location = request.args.get('pickup_location', 'all')
@@ -1352,10 +1652,7 @@ def get_report_stats():
         cursor = conn.cursor()
 
         # Получаем ID пользователя по telegram_id
-        user = cursor.execute(
-            'SELECT id FROM users WHERE telegram_id = ?',
-            (telegram_id,)
-        ).fetchone()
+        user = current_user(conn)
         
         if not user:
             conn.close()
@@ -1465,7 +1762,7 @@ def export_report():
         from flask import send_file
         from io import BytesIO
 
-        telegram_id = request.args.get('telegram_id')
+        telegram_id = request_telegram_id()
         period = request.args.get('period', 'all')
         status = request.args.get('status', 'all')
         pickup_location = request.args.get('pickup_location', 'all')
@@ -1482,10 +1779,7 @@ def export_report():
         cursor = conn.cursor()
 
         # Получаем ID пользователя по telegram_id
-        user = cursor.execute(
-            'SELECT id FROM users WHERE telegram_id = ?',
-            (telegram_id,)
-        ).fetchone()
+        user = current_user(conn)
         
         if not user:
             conn.close()
@@ -1605,9 +1899,15 @@ def export_report():
         logger.error(f"Error exporting report: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# Подключаем проверку сессий (до остальных маршрутов API)
+setup_auth_routes(app, get_db_connection)
+
 # Подключаем расширенную систему отзывов
 setup_review_routes(app, get_db_connection)
 
+# Подключаем профиль пользователя
+setup_profile_routes(app, get_db_connection)
+
 # Подключаем систему фотофиксации этапов доставки
 setup_photo_routes(app, get_db_connection)
 
@@ -1617,6 +1917,9 @@ setup_chat_routes(app, get_db_connection)
 # Подключаем админ панель
 setup_admin_routes(app, get_db_connection)
 
+# Подключаем поток событий (SSE)
+setup_event_routes(app, get_db_connection)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,19 @@
+"""
+Подбор исполнителя (аукцион ставок)
+
+AuctionEngine - правила подбора, стратегии - выбор победителя,
+ranked_bids - список ставок для заказчика по композитной оценке.
+"""
+from .engine import (
+    ACCEPTING_BIDS_SQL, AUCTION_AUTO_AWARD, AUCTION_STRATEGY, AuctionEngine
+)
+from .ranking import MAX_PAGE_SIZE, RANKING_WEIGHTS, ranked_bids
+from .strategies import (
+    STRATEGIES, LowestPriceStrategy, WeightedScoreStrategy, WinnerStrategy, get_strategy
+)
+
+__all__ = [
+    'ACCEPTING_BIDS_SQL', 'AUCTION_AUTO_AWARD', 'AUCTION_STRATEGY', 'AuctionEngine',
+    'MAX_PAGE_SIZE', 'RANKING_WEIGHTS', 'ranked_bids',
+    'STRATEGIES', 'LowestPriceStrategy', 'WeightedScoreStrategy', 'WinnerStrategy', 'get_strategy'
+]
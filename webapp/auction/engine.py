@@ -0,0 +1,213 @@
+"""
+Движок подбора: приём ставок, завершение по времени, выбор победителя
+
+Раньше эта логика была продублирована в auction_checker.py и в боте
+(auction_timer, select_driver) и везде сводилась к ORDER BY price ASC.
+Теперь правила живут здесь, а победитель выбирается подключаемой
+стратегией (auction/strategies.py).
+"""
+import logging
+import os
+
+from geo import distance_km
+from identity import resolve_user_by_id
+from order_logger import (
+    ACTION_STATUS_CHANGED, ACTION_WINNER_SELECTED, history_row, insert_history_rows,
+    request_client_info
+)
+from .strategies import get_strategy
+
+logger = logging.getLogger(__name__)
+
+AUCTION_STRATEGY = os.environ.get('AUCTION_STRATEGY', 'lowest_price')
+# 1 - по истечении времени победитель назначается сам, иначе выбирает заказчик
+AUCTION_AUTO_AWARD = os.environ.get('AUCTION_AUTO_AWARD', '0') == '1'
+
+# Заказ принимает ставки (условие для запросов с алиасом o для orders)
+ACCEPTING_BIDS_SQL = "o.status = 'active' AND datetime(o.expires_at) > datetime('now')"
+
+# Статусы после завершения приёма ставок
+STATUS_AUCTION_COMPLETED = 'auction_completed'
+STATUS_NO_OFFERS = 'no_offers'
+STATUS_IN_PROGRESS = 'in_progress'
+
+
+class AuctionEngine:
+    """Правила подбора поверх общей БД (sqlite3, строки - sqlite3.Row)"""
+
+    def __init__(self, strategy=None, auto_award=AUCTION_AUTO_AWARD):
+        self.strategy = strategy or get_strategy(AUCTION_STRATEGY)
+        self.auto_award = auto_award
+
+    def ranked_bids(self, conn, order_id):
+        """
+        Все ставки заказа в порядке стратегии
+
+        Данные водителей и их рейтинг (driver_stats) загружаются одним
+        запросом, оценки считаются разом по всем ставкам. distance_km -
+        от базы водителя до точки подачи (geo.py), None без координат.
+        """
+        rows = conn.execute(
+            '''SELECT b.id, b.order_id, b.driver_id, b.price, b.created_at,
+                      d.name as driver_name, d.phone_number as driver_phone,
+                      d.telegram_id as driver_telegram_id, d.username as driver_username,
+                      COALESCE(s.rating_sum * 1.0 / NULLIF(s.review_count, 0), 0) as driver_rating,
+                      COALESCE(s.review_count, 0) as review_count,
+                      d.home_lat, d.home_lon, o.pickup_lat, o.pickup_lon
+               FROM bids b
+               JOIN orders o ON o.id = b.order_id
+               JOIN users d ON b.driver_id = d.id
+               LEFT JOIN driver_stats s ON s.driver_id = b.driver_id
+               WHERE b.order_id = ?''',
+            (order_id,)
+        ).fetchall()
+
+        bids = []
+        for row in rows:
+            bid = dict(row)
+            # Координаты базы водителя заказчику не отдаём - только расстояние
+            coords = [bid.pop(key) for key in ('home_lat', 'home_lon', 'pickup_lat', 'pickup_lon')]
+            bid['distance_km'] = (
+                round(distance_km(*coords), 1) if None not in coords else None
+            )
+            bids.append(bid)
+        return self.strategy.rank(bids)
+
+    def award(self, conn, order, bid, user_id=None):
+        """
+        Назначить исполнителя по ставке (заказ -> in_progress) и записать историю
+
+        Args:
+            order: Строка заказа (id, status)
+            bid: Ставка (driver_id, driver_name, price)
+            user_id: Кто выбрал (None - автоматически по истечении подбора)
+
+        Returns:
+            False, если заказ уже ушёл из active/auction_completed
+        """
+        updated = conn.execute(
+            '''UPDATE orders
+               SET status = ?,
+                   winner_driver_id = ?,
+                   winning_price = ?
+               WHERE id = ? AND status IN ('active', ?)''',
+            (STATUS_IN_PROGRESS, bid['driver_id'], bid['price'], order['id'], STATUS_AUCTION_COMPLETED)
+        ).rowcount
+        if not updated:
+            conn.rollback()
+            return False
+
+        chosen_by = 'Выбран' if user_id else 'Автоматически выбран'
+        user = resolve_user_by_id(conn, user_id)
+        user_fields = (user['telegram_id'], user['name'], user['role']) if user else (None, None, None)
+        ip_address, user_agent = request_client_info()
+
+        insert_history_rows(conn, [
+            history_row(
+                order['id'], user_id, *user_fields, ACTION_WINNER_SELECTED,
+                description=f"{chosen_by} исполнитель: {bid['driver_name']} (цена: {bid['price']} ₽)",
+                new_value=str(bid['driver_id']),
+                ip_address=ip_address, user_agent=user_agent
+            ),
+            history_row(
+                order['id'], user_id, *user_fields, ACTION_STATUS_CHANGED,
+                field_name='status', old_value=order['status'], new_value=STATUS_IN_PROGRESS,
+                ip_address=ip_address, user_agent=user_agent
+            )
+        ])
+        conn.commit()
+        return True
+
+    def notify_award(self, conn, order, bid):
+        """Уведомления о назначении исполнителя (бот + SSE)"""
+        from webhook_client import notify_auction_complete, notify_status_changed
+
+        customer = resolve_user_by_id(conn, order['customer_id'])
+
+        try:
+            notify_auction_complete(
+                order_id=order['id'],
+                winner_telegram_id=bid['driver_telegram_id'],
+                winner_user_id=bid['driver_id'],
+                winner_username=bid['driver_username'] or None,
+                winning_price=bid['price'],
+                cargo_description=order['cargo_description'],
+                delivery_address=order['delivery_address'],
+                customer_user_id=customer['telegram_id'],
+                customer_username=customer['username'] or None,
+                customer_phone=customer['phone_number'] or '',
+                driver_phone=bid['driver_phone']
+            )
+            notify_status_changed(
+                order_id=order['id'],
+                old_status=order['status'],
+                new_status=STATUS_IN_PROGRESS,
+                customer_telegram_id=customer['telegram_id'],
+                driver_telegram_id=bid['driver_telegram_id'],
+                cargo_description=order['cargo_description']
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки webhook для заказа {order['id']}: {e}")
+
+    def close_expired(self, conn):
+        """
+        Завершить подборы с истекшим временем
+
+        Без ставок - no_offers. Со ставками - auction_completed (выбирает
+        заказчик) или, при auto_award, сразу исполнитель по стратегии.
+        Возвращает количество обработанных заказов.
+        """
+        expired_orders = conn.execute(
+            '''SELECT o.id, o.customer_id, o.status, o.truck_type, o.cargo_description,
+                      o.delivery_address, c.telegram_id as customer_telegram_id
+               FROM orders o
+               JOIN users c ON o.customer_id = c.id
+               WHERE o.status = 'active'
+                 AND datetime(o.expires_at) <= datetime('now')'''
+        ).fetchall()
+
+        for order in expired_orders:
+            bids = self.ranked_bids(conn, order['id'])
+
+            if bids and self.auto_award:
+                if self.award(conn, order, bids[0]):
+                    self.notify_award(conn, order, bids[0])
+                    logger.info(f"🏆 Подбор завершен автоматически: заказ {order['id']}, "
+                                f"ставка {bids[0]['id']} ({self.strategy.name})")
+                continue
+
+            new_status = STATUS_AUCTION_COMPLETED if bids else STATUS_NO_OFFERS
+            # Условие на статус - заказ мог быть отменён или выбран вручную между запросами
+            updated = conn.execute(
+                "UPDATE orders SET status = ? WHERE id = ? AND status = 'active'",
+                (new_status, order['id'])
+            ).rowcount
+            conn.commit()
+            if not updated:
+                continue
+
+            try:
+                if bids:
+                    from webhook_client import notify_auction_bids_ready
+                    notify_auction_bids_ready(
+                        order_id=order['id'],
+                        customer_user_id=order['customer_telegram_id'],
+                        cargo_description=order['cargo_description'],
+                        bids_count=len(bids),
+                        min_price=min(bid['price'] for bid in bids),
+                        truck_type=order['truck_type']
+                    )
+                    logger.info(f"✅ Подбор завершен для ручного выбора: заказ {order['id']}, предложений: {len(bids)}")
+                else:
+                    from webhook_client import notify_auction_no_bids
+                    notify_auction_no_bids(
+                        order_id=order['id'],
+                        customer_user_id=order['customer_telegram_id'],
+                        cargo_description=order['cargo_description'],
+                        truck_type=order['truck_type']
+                    )
+                    logger.info(f"⚠️ Подбор без ставок: заказ {order['id']}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки webhook для заказа {order['id']}: {e}")
+
+        return len(expired_orders)
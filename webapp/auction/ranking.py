@@ -0,0 +1,114 @@
+"""
+Ранжированный список ставок заказа для заказчика
+
+Оценка считается в SQLite одним запросом по ставкам заказа и
+предрасчитанной статистике водителей (driver_stats): надбавка к лучшей
+цене, рейтинг, доля завершённых заказов и время отклика. Каждый признак
+приводится к [0, 1] (0 - лучше), оценка - взвешенная сумма. Сортировка
+и LIMIT/OFFSET - на стороне БД.
+"""
+from .strategies import MAX_RATING, RATING_PRIOR, RATING_PRIOR_WEIGHT
+
+RANKING_WEIGHTS = {
+    'price': 0.5,
+    'rating': 0.25,
+    'completion': 0.15,
+    'response': 0.1,
+}
+
+# Априорная доля завершённых заказов (водитель без назначений не штрафуется)
+COMPLETION_PRIOR = 0.8
+COMPLETION_PRIOR_WEIGHT = 3
+# Среднее время отклика, начиная с которого признак максимален (сек)
+RESPONSE_TIME_CAP = 600
+
+MAX_PAGE_SIZE = 100
+
+RANKED_BIDS_SQL = '''
+    SELECT *,
+           ROUND((:w_price * price_part + :w_rating * rating_part
+                  + :w_completion * completion_part + :w_response * response_part) / :w_total, 4) as score,
+           COUNT(*) OVER () as total
+    FROM (
+        SELECT b.id,
+               b.order_id,
+               b.driver_id,
+               b.price,
+               b.created_at,
+               u.name,
+               u.phone_number,
+               u.telegram_id as driver_telegram_id,
+               COALESCE(ROUND(s.rating_sum * 1.0 / NULLIF(s.review_count, 0), 2), 0) as driver_rating,
+               COALESCE(s.review_count, 0) as review_count,
+               ROUND(s.completed_count * 1.0 / NULLIF(s.awarded_count, 0), 2) as completion_rate,
+               CAST(s.response_seconds_sum / NULLIF(s.bid_count, 0) AS INTEGER) as avg_response_seconds,
+               CASE WHEN best.min_price > 0
+                    THEN MIN((b.price - best.min_price) / best.min_price, 1.0)
+                    ELSE 0 END as price_part,
+               1 - (COALESCE(s.rating_sum, 0) + :rating_prior * :rating_prior_weight)
+                   / (COALESCE(s.review_count, 0) + :rating_prior_weight) / :max_rating as rating_part,
+               1 - (COALESCE(s.completed_count, 0) + :completion_prior * :completion_prior_weight)
+                   / (COALESCE(s.awarded_count, 0) + :completion_prior_weight) as completion_part,
+               CASE WHEN COALESCE(s.bid_count, 0) = 0 THEN 0.5
+                    ELSE MIN(s.response_seconds_sum / s.bid_count / :response_cap, 1.0) END as response_part
+        FROM bids b
+        JOIN users u ON b.driver_id = u.id
+        LEFT JOIN driver_stats s ON s.driver_id = b.driver_id
+        CROSS JOIN (SELECT MIN(price) as min_price FROM bids WHERE order_id = :order_id) best
+        WHERE b.order_id = :order_id
+    )
+    ORDER BY score ASC, created_at ASC, id ASC
+    LIMIT :limit OFFSET :offset
+'''
+
+
+def ranked_bids(conn, order_id, limit=20, offset=0, weights=None):
+    """
+    Страница ставок заказа по композитной оценке
+
+    Args:
+        conn: Подключение к БД
+        order_id: ID заказа
+        limit: Размер страницы (не больше MAX_PAGE_SIZE)
+        offset: Смещение
+        weights: Веса признаков (по умолчанию RANKING_WEIGHTS)
+
+    Returns:
+        (список dict ставок с score и признаками, всего ставок)
+    """
+    weights = {**RANKING_WEIGHTS, **(weights or {})}
+    limit = max(0, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
+    rows = conn.execute(RANKED_BIDS_SQL, {
+        'order_id': order_id,
+        'limit': limit,
+        'offset': offset,
+        'w_price': weights['price'],
+        'w_rating': weights['rating'],
+        'w_completion': weights['completion'],
+        'w_response': weights['response'],
+        'w_total': sum(weights.values()) or 1,
+        'rating_prior': RATING_PRIOR,
+        'rating_prior_weight': RATING_PRIOR_WEIGHT,
+        'max_rating': MAX_RATING,
+        'completion_prior': COMPLETION_PRIOR,
+        'completion_prior_weight': COMPLETION_PRIOR_WEIGHT,
+        'response_cap': RESPONSE_TIME_CAP,
+    }).fetchall()
+
+    if rows:
+        total = rows[0]['total']
+    else:
+        # Смещение за концом списка - количество отдельным запросом
+        total = conn.execute(
+            'SELECT COUNT(*) FROM bids WHERE order_id = ?', (order_id,)
+        ).fetchone()[0] if offset else 0
+
+    bids = []
+    for row in rows:
+        bid = dict(row)
+        for key in ('price_part', 'rating_part', 'completion_part', 'response_part', 'total'):
+            del bid[key]
+        bids.append(bid)
+    return bids, total
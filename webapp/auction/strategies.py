@@ -0,0 +1,121 @@
+"""
+Стратегии выбора победителя подбора
+
+Стратегия получает все ставки заказа сразу и считает оценку для каждой
+одним проходом по столбцам (цены, рейтинги, расстояния): нормировка
+столбца в [0, 1], затем взвешенная сумма. Меньше оценка - лучше ставка.
+"""
+
+# Априорный рейтинг водителя без отзывов и вес этого априорного значения
+# (сглаживание: 1-2 отзыва не перевешивают цену)
+RATING_PRIOR = 4.0
+RATING_PRIOR_WEIGHT = 3
+MAX_RATING = 5.0
+# Расстояние от базы водителя до подачи, начиная с которого признак максимален (км)
+DISTANCE_CAP_KM = 300
+
+
+def _premium(values):
+    """Надбавка к минимуму столбца (0.1 = на 10% дороже лучшей), не больше 1"""
+    low = min(values)
+    if low <= 0:
+        return [0.0] * len(values)
+    return [min((v - low) / low, 1.0) for v in values]
+
+
+def _share_of_cap(values, cap, missing=0.5):
+    """
+    Доля от фиксированного предела, не больше 1; None (нет данных) -
+    нейтральное значение
+
+    Не от максимума столбца: иначе единственное известное расстояние,
+    даже в километре, было бы хуже неизвестного.
+    """
+    return [missing if v is None else min(v / cap, 1.0) for v in values]
+
+
+class WinnerStrategy:
+    """Базовая стратегия: оценка ставок и ранжирование"""
+
+    name = None
+
+    def scores(self, bids):
+        """Оценки ставок (список той же длины, меньше - лучше)"""
+        raise NotImplementedError
+
+    def rank(self, bids):
+        """
+        Ставки по убыванию привлекательности
+
+        Args:
+            bids: Список dict с price, created_at, id и полями, нужными стратегии
+
+        Returns:
+            Новый список dict с добавленным ключом score
+        """
+        bids = [dict(bid) for bid in bids]
+        for bid, score in zip(bids, self.scores(bids)):
+            bid['score'] = round(score, 4)
+        # При равной оценке выигрывает более ранняя ставка
+        return sorted(bids, key=lambda bid: (bid['score'], bid['created_at'] or '', bid['id']))
+
+
+class LowestPriceStrategy(WinnerStrategy):
+    """Побеждает минимальная цена (прежнее поведение)"""
+
+    name = 'lowest_price'
+
+    def scores(self, bids):
+        return [float(bid['price']) for bid in bids]
+
+
+class WeightedScoreStrategy(WinnerStrategy):
+    """
+    Цена с учётом рейтинга водителя и расстояния до точки загрузки
+
+    Ставка может содержать driver_rating/review_count и distance_km.
+    Если расстояние неизвестно ни для одной ставки, признак не учитывается,
+    веса остальных перенормируются.
+    """
+
+    name = 'weighted'
+
+    def __init__(self, price_weight=0.6, rating_weight=0.3, proximity_weight=0.1):
+        self.price_weight = price_weight
+        self.rating_weight = rating_weight
+        self.proximity_weight = proximity_weight
+
+    def scores(self, bids):
+        prices = _premium([float(bid['price']) for bid in bids])
+
+        ratings = []
+        for bid in bids:
+            count = bid.get('review_count') or 0
+            average = bid.get('driver_rating') or 0
+            smoothed = (average * count + RATING_PRIOR * RATING_PRIOR_WEIGHT) / (count + RATING_PRIOR_WEIGHT)
+            ratings.append(1 - smoothed / MAX_RATING)  # 0 - лучший рейтинг
+
+        columns = [(prices, self.price_weight), (ratings, self.rating_weight)]
+        distances = [bid.get('distance_km') for bid in bids]
+        if any(d is not None for d in distances):
+            columns.append((_share_of_cap(distances, DISTANCE_CAP_KM), self.proximity_weight))
+
+        weights = sum(weight for _, weight in columns) or 1
+        return [
+            sum(column[i] * weight for column, weight in columns) / weights
+            for i in range(len(bids))
+        ]
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (LowestPriceStrategy, WeightedScoreStrategy)
+}
+
+
+def get_strategy(name):
+    """Стратегия по имени (неизвестное имя - ValueError)"""
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown auction strategy: {name}")
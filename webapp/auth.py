@@ -0,0 +1,316 @@
+"""
+Аутентификация запросов Mini App
+
+Mini App один раз отправляет Telegram WebApp initData (POST /api/auth/session).
+Подпись initData проверяется по BOT_TOKEN (HMAC-SHA256, алгоритм Telegram),
+в ответ выдаётся короткоживущий токен сессии, подписанный SESSION_SECRET_KEY: id,
+telegram_id, имя, роль и организация пользователя. Дальше запросы идут с
+Authorization: Bearer <токен> и авторизуются без обращения к БД - данные
+токена лежат в g.user для всех обработчиков.
+
+Бот ходит в API от имени пользователей с Authorization: Bearer <WEBHOOK_SECRET>
+(тот же секрет, что у вебхуков бота) - такие запросы доверяют telegram_id
+из запроса. С пустым или стандартным WEBHOOK_SECRET этот путь выключен:
+запросы бота обрабатываются как запросы без сессии.
+
+Токен подделывается любым, кто знает ключ подписи, поэтому webapp не
+запускается без своего SECRET_KEY (check_secrets).
+
+EventSource не умеет заголовки, поэтому поток SSE авторизуется ?ticket=:
+билет (POST /api/auth/stream-ticket) живёт STREAM_TICKET_TTL и годится
+только для STREAM_PATHS - сам токен сессии в URL и логи не попадает.
+
+Пока WEBAPP_AUTH_REQUIRED не включён, запросы без токена обрабатываются
+по-старому (telegram_id из запроса) - для клиентов, не получивших токен.
+telegram_id в запросе с токеном обязан совпадать с пользователем сессии.
+"""
+from flask import g, jsonify, request
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from identity import resolve_user
+from truck_config import DEFAULT_SECRET_KEY, SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
+DEFAULT_WEBHOOK_SECRET = 'change-this-secret-key'
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+# Запросы бота от имени пользователей - только с настроенным секретом
+SERVICE_AUTH_ENABLED = WEBHOOK_SECRET not in ('', DEFAULT_WEBHOOK_SECRET)
+# Отдельный ключ подписи сессий; по умолчанию выводится из SECRET_KEY,
+# чтобы не совпадать с ключом подписи ссылок на фото
+SESSION_SECRET_KEY = os.environ.get('SESSION_SECRET_KEY') or hmac.new(
+    SECRET_KEY.encode(), b'webapp-session', hashlib.sha256
+).hexdigest()
+AUTH_REQUIRED = os.environ.get('WEBAPP_AUTH_REQUIRED', '0') == '1'
+
+INIT_DATA_MAX_AGE = 24 * 60 * 60  # initData старше суток не принимается
+SESSION_TTL = 60 * 60  # Время жизни токена сессии (сек)
+STREAM_TICKET_TTL = 60  # Билет потока SSE: только на подключение (сек)
+INIT_DATA_HEADER = 'X-Telegram-Init-Data'
+
+# Доступны без сессии и при WEBAPP_AUTH_REQUIRED
+PUBLIC_PATHS = (
+    '/api/auth/session',
+    '/api/truck-types',
+    '/api/reviews/badges',
+    '/api/debug/db-info',  # healthcheck docker-compose
+)
+# Маршруты, принимающие билет в query (?ticket=)
+STREAM_PATHS = (
+    '/api/events/stream',
+)
+PUBLIC_PREFIXES = (
+    '/api/photos/signed/',  # Ссылки уже подписаны (photos_api.sign_photo_path)
+)
+
+# Где старые клиенты передают telegram_id текущего пользователя
+CLAIM_HEADERS = ('Telegram-Id', 'telegram_id', 'telegram-id')
+CLAIM_FIELDS = ('telegram_id', 'reviewer_telegram_id')
+
+_serializer = URLSafeTimedSerializer(SESSION_SECRET_KEY, salt='webapp-session')
+_ticket_serializer = URLSafeTimedSerializer(SESSION_SECRET_KEY, salt='webapp-stream-ticket')
+
+class AuthError(Exception):
+    """Ошибка аутентификации (status - HTTP-код ответа)"""
+    
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.status = status
+
+def check_secrets():
+    """Отказ запуска со стандартным SECRET_KEY: им подписываются сессии и ссылки на фото"""
+    if SECRET_KEY in ('', DEFAULT_SECRET_KEY):
+        raise RuntimeError('SECRET_KEY is not set: session tokens and photo links would be forgeable')
+    if not SERVICE_AUTH_ENABLED:
+        logger.warning('WEBHOOK_SECRET is not set: bot requests on behalf of users are disabled')
+
+def validate_init_data(init_data, bot_token=None, max_age=INIT_DATA_MAX_AGE):
+    """
+    Проверить подпись Telegram WebApp initData
+    
+    https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+    
+    Returns:
+        dict пользователя Telegram (id, first_name, username, ...)
+    """
+    bot_token = bot_token or BOT_TOKEN
+    if not bot_token:
+        raise AuthError('BOT_TOKEN is not configured', 500)
+    
+    fields = dict(parse_qsl(init_data or '', keep_blank_values=True))
+    received_hash = fields.pop('hash', None)
+    if not received_hash:
+        raise AuthError('initData hash missing')
+    
+    data_check_string = '\n'.join(f'{key}={fields[key]}' for key in sorted(fields))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    expected_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise AuthError('initData signature mismatch')
+    
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields['user'])
+    except (KeyError, ValueError):
+        raise AuthError('initData has no user')
+    if time.time() - auth_date > max_age:
+        raise AuthError('initData expired')
+    return user
+
+def issue_session_token(user):
+    """Токен сессии для строки users (dict из identity)"""
+    return _serializer.dumps({
+        'id': user['id'],
+        'telegram_id': user['telegram_id'],
+        'name': user['name'],
+        'role': user['role'],
+        'organization_id': user.get('organization_id')
+    })
+
+def verify_session_token(token, max_age=SESSION_TTL):
+    """Данные токена сессии (dict как у issue_session_token) или AuthError"""
+    try:
+        return _serializer.loads(token, max_age=max_age)
+    except SignatureExpired:
+        raise AuthError('Session expired')
+    except BadSignature:
+        raise AuthError('Invalid session')
+
+def issue_stream_ticket(claims):
+    """Билет потока SSE с данными сессии (claims из verify_session_token)"""
+    return _ticket_serializer.dumps(claims)
+
+def verify_stream_ticket(ticket):
+    """Данные билета потока SSE или AuthError"""
+    try:
+        return _ticket_serializer.loads(ticket, max_age=STREAM_TICKET_TTL)
+    except SignatureExpired:
+        raise AuthError('Stream ticket expired')
+    except BadSignature:
+        raise AuthError('Invalid stream ticket')
+
+def claimed_telegram_ids():
+    """telegram_id, которые запрос указывает как свои (query, форма, JSON, заголовки)"""
+    values = [request.headers.get(header) for header in CLAIM_HEADERS]
+    body = request.get_json(silent=True) if request.is_json else None
+    for field in CLAIM_FIELDS:
+        values.append(request.args.get(field))
+        values.append(request.form.get(field))
+        if isinstance(body, dict):
+            values.append(body.get(field))
+    
+    claimed = set()
+    for value in values:
+        if value in (None, ''):
+            continue
+        try:
+            claimed.add(int(value))
+        except (TypeError, ValueError):
+            raise AuthError('Invalid telegram_id', 400)
+    return claimed
+
+def request_telegram_id():
+    """
+    telegram_id текущего пользователя
+    
+    Из сессии, иначе - из запроса (query, форма, JSON или заголовок,
+    как передают старые клиенты и бот).
+    """
+    user = g.get('user')
+    if user is not None:
+        return user['telegram_id']
+    claimed = claimed_telegram_ids()
+    return next(iter(claimed)) if len(claimed) == 1 else None
+
+def current_user(conn, telegram_id=None):
+    """
+    Пользователь, от имени которого выполняется запрос
+    
+    С сессией - данные токена (без обращения к БД), без неё - строка users
+    по telegram_id из запроса через кэш identity.
+    """
+    user = g.get('user')
+    if user is not None:
+        return user
+    return resolve_user(conn, telegram_id if telegram_id is not None else request_telegram_id())
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    return None
+
+def _is_public(path):
+    return path in PUBLIC_PATHS or path.startswith(PUBLIC_PREFIXES)
+
+def setup_auth_routes(app, get_db_connection):
+    """Проверка сессии перед каждым запросом API и выдача токенов"""
+    check_secrets()
+    
+    @app.errorhandler(AuthError)
+    def handle_auth_error(e):
+        # Неверный telegram_id в запросе без сессии (request_telegram_id в обработчиках)
+        return jsonify({'error': str(e)}), e.status
+    
+    @app.before_request
+    def authenticate_request():
+        g.user = None
+        g.service = False
+        if not request.path.startswith('/api/') or request.method == 'OPTIONS':
+            return None
+        
+        try:
+            token = _bearer_token()
+            init_data = request.headers.get(INIT_DATA_HEADER)
+            ticket = request.args.get('ticket') if request.path in STREAM_PATHS else None
+            
+            if token and SERVICE_AUTH_ENABLED and hmac.compare_digest(token, WEBHOOK_SECRET):
+                # Бот: действует от имени пользователя из запроса
+                g.service = True
+                return None
+            if token and not SERVICE_AUTH_ENABLED and token in (WEBHOOK_SECRET, DEFAULT_WEBHOOK_SECRET):
+                # Бот со стандартным секретом - не токен сессии, а запрос
+                # без сессии: telegram_id из запроса, пока не включён AUTH_REQUIRED
+                token = None
+            
+            if token:
+                g.user = verify_session_token(token)
+            elif ticket:
+                g.user = verify_stream_ticket(ticket)
+            elif init_data:
+                conn = get_db_connection()
+                try:
+                    user = resolve_user(conn, validate_init_data(init_data)['id'])
+                finally:
+                    conn.close()
+                if user is None:
+                    raise AuthError('User not registered', 404)
+                g.user = verify_session_token(issue_session_token(user))
+            elif AUTH_REQUIRED and not _is_public(request.path):
+                raise AuthError('Authentication required')
+            
+            if g.user is not None and claimed_telegram_ids() - {g.user['telegram_id']}:
+                raise AuthError('telegram_id does not match session', 403)
+        except AuthError as e:
+            g.user = None
+            return jsonify({'error': str(e)}), e.status
+        
+        return None
+    
+    @app.route('/api/auth/session', methods=['POST'])
+    def create_session():
+        """
+        Обменять Telegram initData на токен сессии
+        
+        Body: {"init_data": "<Telegram.WebApp.initData>"} или заголовок X-Telegram-Init-Data
+        """
+        data = request.get_json(silent=True) or {}
+        init_data = data.get('init_data') or request.headers.get(INIT_DATA_HEADER)
+        
+        try:
+            telegram_user = validate_init_data(init_data)
+        except AuthError as e:
+            return jsonify({'error': str(e)}), e.status
+        
+        conn = get_db_connection()
+        try:
+            user = resolve_user(conn, telegram_user.get('id'))
+        finally:
+            conn.close()
+        
+        if not user:
+            return jsonify({'error': 'User not found', 'hint': 'Register via Telegram bot first'}), 404
+        
+        return jsonify({
+            'token': issue_session_token(user),
+            'expires_in': SESSION_TTL,
+            'user': {
+                'id': user['id'],
+                'telegram_id': user['telegram_id'],
+                'name': user['name'],
+                'role': user['role'],
+                'organization_id': user.get('organization_id')
+            }
+        })
+    
+    @app.route('/api/auth/stream-ticket', methods=['POST'])
+    def create_stream_ticket():
+        """Билет для подключения EventSource (?ticket=), только по токену сессии"""
+        if g.user is None:
+            return jsonify({'error': 'Session required'}), 401
+        
+        return jsonify({
+            'ticket': issue_stream_ticket(g.user),
+            'expires_in': STREAM_TICKET_TTL
+        })
+    
+    return app
@@ -0,0 +1,211 @@
+"""
+Приём ставок с групповым коммитом
+
+В последние секунды аукциона ставки приходят пачкой, а каждая отдельная
+транзакция - это fsync и очередь за блокировкой записи SQLite. Здесь ставки
+из параллельных запросов воркера собираются в очередь, и первый запрос
+(лидер) записывает всю пачку одной транзакцией: ставки, строки истории
+и события SSE. Остальные запросы получают свой результат, не открывая
+собственных транзакций.
+
+Повторная ставка отсекается ограничением UNIQUE(order_id, driver_id)
+(INSERT ... ON CONFLICT DO NOTHING), без предварительного SELECT.
+"""
+import sqlite3
+import threading
+import time
+
+from auction import ACCEPTING_BIDS_SQL
+from events_api import EVENT_BID_CREATED, broadcaster, event_rows, insert_event_rows
+from order_book import order_books
+from order_logger import ACTION_BID_ADDED, history_row, insert_history_rows
+from truck_config import DATABASE_PATH
+
+BATCH_WINDOW = 0.005  # Сколько лидер ждёт ставки других запросов перед записью (сек)
+BATCH_MAX_SIZE = 200
+
+# Результаты ставки
+BID_CREATED = 'created'
+BID_EXISTS = 'exists'
+BID_ORDER_NOT_FOUND = 'order_not_found'
+BID_AUCTION_CLOSED = 'auction_closed'
+BID_FAILED = 'failed'
+
+
+def _connect():
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+class PendingBid:
+    """Ставка в очереди и её результат"""
+
+    def __init__(self, order_id, driver, price, ip_address=None, user_agent=None):
+        self.order_id = order_id
+        self.driver = driver  # Строка users: id, telegram_id, name, role
+        self.price = price
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+        self.status = None
+        self.bid_id = None
+
+    @property
+    def done(self):
+        return self.status is not None
+
+
+class BidIngestor:
+    """Очередь ставок воркера; запись - пачками одной транзакцией"""
+
+    def __init__(self, window=BATCH_WINDOW, max_batch=BATCH_MAX_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    def submit(self, order_id, driver, price, ip_address=None, user_agent=None):
+        """
+        Добавить ставку и дождаться записи
+
+        Returns:
+            PendingBid с status (BID_*) и bid_id
+        """
+        pending = PendingBid(order_id, driver, price, ip_address, user_agent)
+        with self._queue_lock:
+            self._queue.append(pending)
+
+        with self._commit_lock:
+            if not pending.done and self.window:
+                # Даём параллельным запросам (greenlet gevent) встать в очередь
+                time.sleep(self.window)
+            while not pending.done:
+                with self._queue_lock:
+                    batch = self._queue[:self.max_batch]
+                    del self._queue[:self.max_batch]
+                self._write_batch(batch)
+
+        return pending
+
+    def _write_batch(self, batch):
+        conn = None
+        created = {}  # order_id -> (версия до, версия после, [(bid_id, driver_id, price)])
+        try:
+            conn = _connect()
+            conn.execute('BEGIN IMMEDIATE')
+
+            order_ids = sorted({bid.order_id for bid in batch})
+            placeholders = ','.join('?' * len(order_ids))
+            orders = {row['id']: row for row in conn.execute(
+                f'''SELECT o.id, o.version, c.telegram_id as customer_telegram_id,
+                           ({ACCEPTING_BIDS_SQL}) as accepting
+                    FROM orders o
+                    JOIN users c ON o.customer_id = c.id
+                    WHERE o.id IN ({placeholders})''',
+                order_ids
+            ).fetchall()}
+
+            history = []
+            events = []
+            created_ids = []
+            created_bids = []  # (order_id, price) для событий SSE
+            for bid in batch:
+                order = orders.get(bid.order_id)
+                if not order:
+                    bid.status = BID_ORDER_NOT_FOUND
+                    continue
+                if not order['accepting']:
+                    bid.status = BID_AUCTION_CLOSED
+                    continue
+
+                # Ошибка одной ставки не должна откатывать остальные
+                conn.execute('SAVEPOINT bid')
+                try:
+                    cursor = conn.execute(
+                        '''INSERT INTO bids (order_id, driver_id, price)
+                           VALUES (?, ?, ?)
+                           ON CONFLICT(order_id, driver_id) DO NOTHING''',
+                        (bid.order_id, bid.driver['id'], bid.price)
+                    )
+                    conn.execute('RELEASE SAVEPOINT bid')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO SAVEPOINT bid')
+                    conn.execute('RELEASE SAVEPOINT bid')
+                    print(f"❌ Bid error (order {bid.order_id}, driver {bid.driver['id']}): {e}")
+                    bid.status = BID_FAILED
+                    continue
+
+                if not cursor.rowcount:
+                    bid.status = BID_EXISTS
+                    continue
+
+                bid.status = BID_CREATED
+                bid.bid_id = cursor.lastrowid
+                created_ids.append(bid.bid_id)
+                history.append(history_row(
+                    bid.order_id, bid.driver['id'], bid.driver['telegram_id'],
+                    bid.driver['name'], bid.driver['role'], ACTION_BID_ADDED,
+                    description=f"Добавлена ставка: {bid.price} ₽",
+                    new_value=str(bid.price),
+                    ip_address=bid.ip_address, user_agent=bid.user_agent
+                ))
+                created_bids.append((bid.order_id, bid.price))
+
+            # Push-событие заказчику и водителям, которые уже торгуются за заказ
+            # (включая новых): остальным водителям ставка не меняет ленту
+            if created_bids:
+                bid_order_ids = sorted({order_id for order_id, _ in created_bids})
+                placeholders = ','.join('?' * len(bid_order_ids))
+                bidders = {}
+                for row in conn.execute(
+                    f'''SELECT DISTINCT b.order_id, u.telegram_id
+                        FROM bids b
+                        JOIN users u ON u.id = b.driver_id
+                        WHERE b.order_id IN ({placeholders})''',
+                    bid_order_ids
+                ).fetchall():
+                    bidders.setdefault(row['order_id'], []).append(row['telegram_id'])
+                for order_id, price in created_bids:
+                    recipients = [orders[order_id]['customer_telegram_id']] + bidders.get(order_id, [])
+                    events += event_rows(EVENT_BID_CREATED, order_id, recipients, payload={'price': price})
+
+            insert_history_rows(conn, history)
+            insert_event_rows(conn, events)
+
+            # Ставки в том виде, как их сохранила БД, и версии заказов
+            # после них (триггер trg_bids_version_insert) - для книг ставок
+            if created_ids:
+                placeholders = ','.join('?' * len(created_ids))
+                for row in conn.execute(
+                    f'''SELECT b.order_id, b.id, b.driver_id, b.price, o.version
+                        FROM bids b
+                        JOIN orders o ON o.id = b.order_id
+                        WHERE b.id IN ({placeholders})''',
+                    created_ids
+                ).fetchall():
+                    entry = created.setdefault(row['order_id'], (orders[row['order_id']]['version'], row['version'], []))
+                    entry[2].append((row['id'], row['driver_id'], row['price']))
+            conn.commit()
+        except Exception as e:
+            print(f"❌ Bid batch error ({len(batch)} bids): {e}")
+            if conn is not None:
+                conn.rollback()
+            for bid in batch:
+                bid.status = BID_FAILED
+                bid.bid_id = None
+            created = {}
+        finally:
+            if conn is not None:
+                conn.close()
+
+        for order_id, (version_before, version_after, bids) in created.items():
+            order_books.apply_bids(order_id, version_before, version_after, bids)
+
+        if any(bid.status == BID_CREATED for bid in batch):
+            broadcaster.wake()
+
+
+bid_ingestor = BidIngestor()
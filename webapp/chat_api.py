@@ -3,30 +3,138 @@ API для системы чата между заказчиком и водит
 """
 from flask import jsonify, request
 import sqlite3
+import time
 from datetime import datetime
 
+from events_api import EVENT_CHAT_READ, broadcaster, event_rows, insert_event_rows
+from auth import current_user, request_telegram_id
+from identity import resolve_user_by_id
+
+LONG_POLL_TIMEOUT = 25  # Максимальное время ожидания long-poll (сек), меньше таймаута nginx
+
+def get_read_cursors(conn, order_id, user_id, other_id):
+    """Курсоры прочтения (id последнего прочитанного сообщения) - свой и собеседника"""
+    rows = conn.execute(
+        'SELECT user_id, last_read_id, unread_count FROM order_chat_reads WHERE order_id = ? AND user_id IN (?, ?)',
+        (order_id, user_id, other_id)
+    ).fetchall()
+    cursors = {row['user_id']: row for row in rows}
+    mine = cursors.get(user_id)
+    other = cursors.get(other_id)
+    return {
+        'mine': mine['last_read_id'] if mine else 0,
+        'other': other['last_read_id'] if other else 0,
+        'unread': mine['unread_count'] if mine else 0
+    }
+
+def increment_unread_counter(conn, order_id, recipient_id):
+    """Увеличить счётчик непрочитанных получателя (при отправке сообщения). Коммит - за вызывающим."""
+    conn.execute(
+        '''INSERT INTO order_chat_reads (order_id, user_id, last_read_id, unread_count)
+           VALUES (?, ?, 0, 1)
+           ON CONFLICT(order_id, user_id) DO UPDATE
+           SET unread_count = unread_count + 1''',
+        (order_id, recipient_id)
+    )
+
+def mark_order_messages_read(conn, order_id, user, other_id, up_to=None):
+    """
+    Отметить прочитанными сообщения заказа до up_to (None - до последнего)
+    
+    up_to - последнее сообщение, которое пользователь действительно получил:
+    пришедшее позже не должно давать собеседнику отметку о прочтении.
+    Флаги read_by_* обновляются только для сообщений после прежнего курсора,
+    поэтому стоимость не зависит от длины переписки. Если курсор сдвинулся,
+    собеседнику other_id (users.id) пишется событие chat_read - его long-poll
+    просыпается. Коммит - за вызывающим, после него - broadcaster.wake().
+    """
+    previous = conn.execute(
+        'SELECT last_read_id, unread_count FROM order_chat_reads WHERE order_id = ? AND user_id = ?',
+        (order_id, user['id'])
+    ).fetchone()
+    previous_id = previous['last_read_id'] if previous else 0
+    
+    last_id = conn.execute(
+        'SELECT MAX(id) FROM order_messages WHERE order_id = ?',
+        (order_id,)
+    ).fetchone()[0] or 0
+    if up_to is not None:
+        last_id = min(last_id, up_to)  # after_id от клиента - не дальше переписки
+    
+    if last_id <= previous_id and not (previous and previous['unread_count']):
+        return previous_id
+    last_id = max(last_id, previous_id)
+    
+    read_column = 'read_by_customer' if user['role'] == 'customer' else 'read_by_driver'
+    conn.execute(
+        f'''UPDATE order_messages 
+           SET {read_column} = TRUE 
+           WHERE order_id = ? AND id > ? AND id <= ? AND sender_id != ?''',
+        (order_id, previous_id, last_id, user['id'])
+    )
+    # UPDATE выше уже держит блокировку записи: сообщения после last_id
+    # остаются в счётчике непрочитанных
+    conn.execute(
+        '''INSERT INTO order_chat_reads (order_id, user_id, last_read_id, unread_count, read_at)
+           VALUES (?, ?, ?, (SELECT COUNT(*) FROM order_messages
+                             WHERE order_id = ? AND id > ? AND sender_id != ?),
+                   CURRENT_TIMESTAMP)
+           ON CONFLICT(order_id, user_id) DO UPDATE
+           SET last_read_id = excluded.last_read_id,
+               unread_count = excluded.unread_count,
+               read_at = excluded.read_at''',
+        (order_id, user['id'], last_id, order_id, last_id, user['id'])
+    )
+    
+    other = resolve_user_by_id(conn, other_id) if other_id else None
+    if other and last_id > previous_id:
+        insert_event_rows(conn, event_rows(
+            EVENT_CHAT_READ, order_id, [other['telegram_id']], payload={'read_up_to': last_id}
+        ))
+    return last_id
+
+def fetch_chat_messages(conn, order_id, user_id, after_id=0):
+    """Сообщения заказа с id > after_id в порядке отправки"""
+    messages = conn.execute(
+        '''SELECT m.id, m.sender_id, m.message_text, m.created_at,
+                  m.read_by_customer, m.read_by_driver,
+                  u.name as sender_name, u.role as sender_role
+           FROM order_messages m
+           JOIN users u ON m.sender_id = u.id
+           WHERE m.order_id = ? AND m.id > ?
+           ORDER BY m.id ASC''',
+        (order_id, after_id)
+    ).fetchall()
+    
+    return [{
+        'id': msg['id'],
+        'sender_id': msg['sender_id'],
+        'sender_name': msg['sender_name'],
+        'sender_role': msg['sender_role'],
+        'message_text': msg['message_text'],
+        'created_at': msg['created_at'],
+        'read_by_customer': bool(msg['read_by_customer']),
+        'read_by_driver': bool(msg['read_by_driver']),
+        'is_mine': msg['sender_id'] == user_id
+    } for msg in messages]
+
 def setup_chat_routes(app, get_db_connection):
     """Регистрация маршрутов для чата"""
     
     @app.route('/api/orders/<int:order_id>/messages', methods=['GET'])
     def get_order_messages(order_id):
         """Получение списка сообщений для заказа"""
-        telegram_id = (request.args.get('telegram_id') or
-                      request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         
         if not telegram_id:
             return jsonify({'error': 'telegram_id required'}), 400
         
-        telegram_id = int(telegram_id)
+        after_id = request.args.get('after_id', default=0, type=int)
         conn = get_db_connection()
         
         try:
             # Проверяем что пользователь - участник заказа
-            user = conn.execute(
-                'SELECT id, role FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -43,53 +151,112 @@ def setup_chat_routes(app, get_db_connection):
             if user['id'] != order['customer_id'] and user['id'] != order['winner_driver_id']:
                 return jsonify({'error': 'Access denied'}), 403
             
-            # Получаем сообщения
-            messages = conn.execute(
-                '''SELECT m.id, m.sender_id, m.message_text, m.created_at,
-                          m.read_by_customer, m.read_by_driver,
-                          u.name as sender_name, u.role as sender_role
-                   FROM order_messages m
-                   JOIN users u ON m.sender_id = u.id
-                   WHERE m.order_id = ?
-                   ORDER BY m.created_at ASC''',
-                (order_id,)
-            ).fetchall()
+            other_id = order['winner_driver_id'] if user['id'] == order['customer_id'] else order['customer_id']
             
-            result = []
-            for msg in messages:
-                result.append({
-                    'id': msg['id'],
-                    'sender_id': msg['sender_id'],
-                    'sender_name': msg['sender_name'],
-                    'sender_role': msg['sender_role'],
-                    'message_text': msg['message_text'],
-                    'created_at': msg['created_at'],
-                    'read_by_customer': bool(msg['read_by_customer']),
-                    'read_by_driver': bool(msg['read_by_driver']),
-                    'is_mine': msg['sender_id'] == user['id']
-                })
+            # Только новые сообщения после курсора after_id (0 - вся переписка)
+            result = fetch_chat_messages(conn, order_id, user['id'], after_id)
+            
+            # Отмечаем прочитанным в том же запросе (вместо отдельного POST .../read) -
+            # только то, что уходит в ответе или уже есть у клиента
+            if request.args.get('mark_read') in ('1', 'true'):
+                mark_order_messages_read(conn, order_id, user, other_id,
+                                         up_to=result[-1]['id'] if result else after_id)
+                conn.commit()
+                broadcaster.wake()
             
-            # Подсчитываем непрочитанные сообщения
-            unread_count = 0
-            if user['role'] == 'customer':
-                unread_count = sum(1 for msg in messages if not msg['read_by_customer'] and msg['sender_id'] != user['id'])
-            else:
-                unread_count = sum(1 for msg in messages if not msg['read_by_driver'] and msg['sender_id'] != user['id'])
+            reads = get_read_cursors(conn, order_id, user['id'], other_id)
             
             return jsonify({
                 'messages': result,
-                'unread_count': unread_count
+                'unread_count': reads['unread'],
+                # Курсор для следующего запроса ?after_id=
+                'last_id': result[-1]['id'] if result else after_id,
+                # Собеседник прочитал все мои сообщения с id <= read_up_to
+                'read_up_to': reads['other']
             })
             
         finally:
             conn.close()
     
+    @app.route('/api/orders/<int:order_id>/messages/poll', methods=['GET'])
+    def poll_order_messages(order_id):
+        """
+        Long-poll: ждать новые сообщения после after_id
+        
+        Запрос держится до timeout секунд и завершается, как только появятся
+        сообщения с id > after_id или собеседник прочитает что-то после
+        read_up_to. Пробуждение - через общий EventBroadcaster воркера по
+        событиям этого пользователя и заказа (chat_message пишет send_message,
+        chat_read - mark_order_messages_read); события других заказов БД
+        не трогают, подключение между пробуждениями не удерживается.
+        """
+        telegram_id = request_telegram_id()
+        
+        if not telegram_id:
+            return jsonify({'error': 'telegram_id required'}), 400
+        
+        after_id = request.args.get('after_id', default=0, type=int)
+        known_read_up_to = request.args.get('read_up_to', default=0, type=int)
+        timeout = min(max(request.args.get('timeout', default=LONG_POLL_TIMEOUT, type=int), 0), LONG_POLL_TIMEOUT)
+        mark_read = request.args.get('mark_read') in ('1', 'true')
+        
+        conn = get_db_connection()
+        try:
+            user = current_user(conn)
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            
+            order = conn.execute(
+                'SELECT customer_id, winner_driver_id FROM orders WHERE id = ?',
+                (order_id,)
+            ).fetchone()
+            
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+            
+            if user['id'] != order['customer_id'] and user['id'] != order['winner_driver_id']:
+                return jsonify({'error': 'Access denied'}), 403
+        finally:
+            conn.close()
+        
+        other_id = order['winner_driver_id'] if user['id'] == order['customer_id'] else order['customer_id']
+        
+        broadcaster.start()
+        deadline = time.monotonic() + timeout
+        
+        while True:
+            # Запоминаем id события до выборки, чтобы не пропустить сообщение между ними
+            event_id = broadcaster.last_id
+            
+            conn = get_db_connection()
+            try:
+                result = fetch_chat_messages(conn, order_id, user['id'], after_id)
+                
+                if result and mark_read:
+                    mark_order_messages_read(conn, order_id, user, other_id, up_to=result[-1]['id'])
+                    conn.commit()
+                    broadcaster.wake()
+                
+                reads = get_read_cursors(conn, order_id, user['id'], other_id)
+            finally:
+                conn.close()
+            
+            remaining = deadline - time.monotonic()
+            if result or reads['other'] > known_read_up_to or remaining <= 0:
+                return jsonify({
+                    'messages': result,
+                    'unread_count': reads['unread'],
+                    'last_id': result[-1]['id'] if result else after_id,
+                    'read_up_to': reads['other']
+                })
+            
+            broadcaster.wait_for(user['telegram_id'], order_id, event_id, remaining)
+    
     @app.route('/api/orders/<int:order_id>/messages', methods=['POST'])
     def send_message(order_id):
         """Отправка сообщения в чат"""
-        telegram_id = (request.json.get('telegram_id') or
-                      request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         
         if not telegram_id:
             return jsonify({'error': 'telegram_id required'}), 400
@@ -103,15 +270,11 @@ def setup_chat_routes(app, get_db_connection):
         if len(message_text) > 2000:
             return jsonify({'error': 'Message too long (max 2000 characters)'}), 400
         
-        telegram_id = int(telegram_id)
         conn = get_db_connection()
         
         try:
             # Проверяем пользователя
-            user = conn.execute(
-                'SELECT id, role, name FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -147,6 +310,12 @@ def setup_chat_routes(app, get_db_connection):
             )
             
             message_id = cursor.lastrowid
+            
+            # Счётчик непрочитанных собеседника - в той же транзакции
+            recipient_id = order['winner_driver_id'] if user['id'] == order['customer_id'] else order['customer_id']
+            if recipient_id:
+                increment_unread_counter(conn, order_id, recipient_id)
+            
             conn.commit()
             
             # Получаем созданное сообщение
@@ -213,22 +382,16 @@ def setup_chat_routes(app, get_db_connection):
     @app.route('/api/orders/<int:order_id>/messages/read', methods=['POST'])
     def mark_messages_read(order_id):
         """Отметить сообщения как прочитанные"""
-        telegram_id = (request.json.get('telegram_id') or
-                      request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         
         if not telegram_id:
             return jsonify({'error': 'telegram_id required'}), 400
         
-        telegram_id = int(telegram_id)
         conn = get_db_connection()
         
         try:
             # Проверяем пользователя
-            user = conn.execute(
-                'SELECT id, role FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -246,24 +409,13 @@ def setup_chat_routes(app, get_db_connection):
                 return jsonify({'error': 'Access denied'}), 403
             
             # Отмечаем сообщения как прочитанные
-            if user['role'] == 'customer':
-                conn.execute(
-                    '''UPDATE order_messages 
-                       SET read_by_customer = TRUE 
-                       WHERE order_id = ? AND sender_id != ?''',
-                    (order_id, user['id'])
-                )
-            else:
-                conn.execute(
-                    '''UPDATE order_messages 
-                       SET read_by_driver = TRUE 
-                       WHERE order_id = ? AND sender_id != ?''',
-                    (order_id, user['id'])
-                )
+            other_id = order['winner_driver_id'] if user['id'] == order['customer_id'] else order['customer_id']
+            last_read_id = mark_order_messages_read(conn, order_id, user, other_id)
             
             conn.commit()
+            broadcaster.wake()
             
-            return jsonify({'success': True})
+            return jsonify({'success': True, 'last_read_id': last_read_id})
             
         except Exception as e:
             conn.rollback()
@@ -274,51 +426,30 @@ def setup_chat_routes(app, get_db_connection):
     @app.route('/api/orders/unread-messages-count', methods=['GET'])
     def get_unread_messages_count():
         """Получить общее количество непрочитанных сообщений по всем заказам"""
-        telegram_id = (request.args.get('telegram_id') or
-                      request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         
         if not telegram_id:
             return jsonify({'error': 'telegram_id required'}), 400
         
-        telegram_id = int(telegram_id)
         conn = get_db_connection()
         
         try:
             # Проверяем пользователя
-            user = conn.execute(
-                'SELECT id, role FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
             
-            # Подсчитываем непрочитанные сообщения
-            if user['role'] == 'customer':
-                # Для заказчика - непрочитанные сообщения в его заказах
-                result = conn.execute(
-                    '''SELECT order_id, COUNT(*) as unread_count
-                       FROM order_messages m
-                       JOIN orders o ON m.order_id = o.id
-                       WHERE o.customer_id = ? 
-                       AND m.read_by_customer = FALSE
-                       AND m.sender_id != ?
-                       GROUP BY order_id''',
-                    (user['id'], user['id'])
-                ).fetchall()
-            else:
-                # Для водителя - непрочитанные сообщения в заказах где он исполнитель
-                result = conn.execute(
-                    '''SELECT order_id, COUNT(*) as unread_count
-                       FROM order_messages m
-                       JOIN orders o ON m.order_id = o.id
-                       WHERE o.winner_driver_id = ? 
-                       AND m.read_by_driver = FALSE
-                       AND m.sender_id != ?
-                       GROUP BY order_id''',
-                    (user['id'], user['id'])
-                ).fetchall()
+            # Готовые счётчики из order_chat_reads - один индексный запрос
+            # (учитываем только заказы, где пользователь всё ещё участник)
+            result = conn.execute(
+                '''SELECT r.order_id, r.unread_count
+                   FROM order_chat_reads r
+                   JOIN orders o ON r.order_id = o.id
+                   WHERE r.user_id = ? AND r.unread_count > 0
+                   AND (o.customer_id = r.user_id OR o.winner_driver_id = r.user_id)''',
+                (user['id'],)
+            ).fetchall()
             
             unread_by_order = {row['order_id']: row['unread_count'] for row in result}
             total_unread = sum(unread_by_order.values())
@@ -3,6 +3,23 @@ set -e
 
 echo "Применение миграций..."
 python3 migrations/apply_admin_features.py || echo "Миграция уже применена или произошла ошибка"
+python3 migrations/apply_order_versions_migration.py || echo "Миграция версий заказов не применена"
+python3 migrations/apply_user_events_migration.py || echo "Миграция событий SSE не применена"
+python3 migrations/apply_chat_reads_migration.py || echo "Миграция курсоров чата не применена"
+python3 migrations/apply_chat_unread_counters_migration.py || echo "Миграция счётчиков непрочитанных не применена"
+python3 migrations/apply_photo_variants_migration.py || echo "Миграция вариантов фото не применена"
+python3 migrations/apply_photo_ingest_jobs_migration.py || echo "Миграция очереди обработки фото не применена"
+python3 migrations/apply_photo_blobs_migration.py || echo "Миграция хранилища фото не применена"
+python3 migrations/apply_photo_archive_migration.py || echo "Миграция архива фото не применена"
+python3 migrations/apply_driver_stats_migration.py || echo "Миграция статистики водителей не применена"
+python3 migrations/apply_review_badges_migration.py || echo "Миграция комплиментов отзывов не применена"
+python3 migrations/apply_profile_versions_migration.py || echo "Миграция версий профилей не применена"
+python3 migrations/apply_users_version_migration.py || echo "Миграция версий пользователей не применена"
+python3 migrations/apply_organization_stats_migration.py || echo "Миграция счётчиков организаций не применена"
+python3 migrations/apply_users_search_migration.py || echo "Миграция поиска пользователей не применена"
+python3 migrations/apply_orders_search_migration.py || echo "Миграция поиска по заказам не применена"
+python3 migrations/apply_geo_migration.py || echo "Миграция геокодирования адресов не применена"
 
 echo "Запуск webapp..."
-exec gunicorn -w 4 -b 0.0.0.0:5000 app:app
+# gevent: долгоживущие SSE-соединения не занимают воркеры
+exec gunicorn -w 4 -k gevent --worker-connections 1000 -b 0.0.0.0:5000 app:app
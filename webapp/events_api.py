@@ -0,0 +1,287 @@
+"""
+Server-Sent Events: push-уведомления Mini App об изменениях заказов,
+новых ставках и сообщениях чата (вместо опроса каждые 3-30 секунд)
+
+События пишутся в таблицу user_events из тех же мест, что вызывают
+webhook_client, поэтому их видят все воркеры gunicorn, бот и auction_checker.
+В каждом воркере один фоновый поток следит за MAX(id) и будит все
+открытые потоки SSE - БД не опрашивается отдельно для каждого клиента.
+"""
+from flask import Response, jsonify, request, stream_with_context
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from auth import current_user, request_telegram_id
+from truck_config import DATABASE_PATH
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.25  # Как часто воркер проверяет новые события (сек)
+KEEPALIVE_INTERVAL = 15  # Комментарий-пинг, чтобы nginx не рвал соединение
+EVENTS_TTL_MINUTES = 60  # Сколько хранить события для переподключений
+PRUNE_INTERVAL = 600
+MAX_TRACKED_RECIPIENTS = 10000  # Пары (telegram_id, order_id) с последним событием в памяти воркера
+
+# Типы событий
+EVENT_ORDER_CREATED = 'order_created'
+EVENT_ORDER_STATUS = 'order_status'
+EVENT_ORDER_CONFIRMED = 'order_confirmed'
+EVENT_ORDER_CANCELLED = 'order_cancelled'
+EVENT_BID_CREATED = 'bid_created'
+EVENT_PHOTO_UPLOADED = 'photo_uploaded'
+EVENT_CHAT_MESSAGE = 'chat_message'
+EVENT_CHAT_READ = 'chat_read'
+
+
+def _connect():
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def event_rows(event_type, order_id=None, telegram_ids=None, truck_type=None, payload=None):
+    """Строки user_events для события (аргументы - как у publish_event)"""
+    data = json.dumps(payload or {}, ensure_ascii=False)
+
+    if telegram_ids is None:
+        return [(None, event_type, order_id, truck_type, data)]
+
+    recipients = {int(tid) for tid in telegram_ids if tid}
+    return [(tid, event_type, order_id, truck_type, data) for tid in recipients]
+
+
+def insert_event_rows(conn, rows):
+    """Записать строки event_rows без commit (в транзакции вызывающего)"""
+    conn.executemany(
+        '''INSERT INTO user_events (telegram_id, event_type, order_id, truck_type, payload)
+           VALUES (?, ?, ?, ?, ?)''',
+        rows
+    )
+
+
+def publish_event(event_type, order_id=None, telegram_ids=None, truck_type=None, payload=None, conn=None):
+    """
+    Записать событие для SSE
+
+    Args:
+        event_type: Тип события (EVENT_*)
+        order_id: ID заказа
+        telegram_ids: Получатели; None - рассылка всем водителям
+                      (с фильтром по truck_type, если он указан)
+        truck_type: Тип машины для рассылки водителям
+        payload: Дополнительные данные (dict)
+        conn: Открытое подключение (иначе открывается своё)
+    """
+    rows = event_rows(event_type, order_id, telegram_ids, truck_type, payload)
+    if not rows:
+        return
+
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect()
+    try:
+        insert_event_rows(conn, rows)
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+    # События из этого же воркера доставляем сразу, не дожидаясь опроса
+    broadcaster.wake()
+
+
+class EventBroadcaster:
+    """
+    Один опрос MAX(id) на воркер, пробуждение всех ожидающих потоков
+
+    Для новых событий запоминается последний id по паре (telegram_id, order_id):
+    long-poll чата ждёт событий своего заказа и не ходит в БД из-за чужих.
+    Пары сверх MAX_TRACKED_RECIPIENTS вытесняются; ждущие вытесненной пары
+    просыпаются, как при общем пробуждении.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.last_id = 0
+        self._last_by_recipient = {}  # (telegram_id, order_id) -> id последнего события
+        self._evicted_id = 0  # Наибольший id среди вытесненных из _last_by_recipient
+        self._cond = threading.Condition()
+        self._poke = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='sse-broadcaster', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Проверить новые события сейчас, не дожидаясь интервала опроса"""
+        self._poke.set()
+
+    def wait(self, after_id, timeout):
+        """Ждать событие с id > after_id; возвращает последний известный id"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.last_id <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.last_id
+
+    def wait_for(self, telegram_id, order_id, after_id, timeout):
+        """
+        Ждать событие получателя telegram_id по заказу order_id с id > after_id
+
+        Пары нет в _last_by_recipient - событие могло быть вытеснено,
+        поэтому сравниваем с наибольшим вытесненным id (лишнее пробуждение
+        вместо потерянного).
+        """
+        key = (telegram_id, order_id)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._last_by_recipient.get(key, self._evicted_id) <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _track(self, rows):
+        """Запомнить получателей новых событий (под self._cond)"""
+        for row in rows:
+            key = (row['telegram_id'], row['order_id'])
+            self._last_by_recipient.pop(key, None)  # В конец - самые свежие
+            self._last_by_recipient[key] = row['id']
+        excess = len(self._last_by_recipient) - MAX_TRACKED_RECIPIENTS
+        if excess > 0:
+            for key in list(self._last_by_recipient)[:excess]:
+                self._evicted_id = max(self._evicted_id, self._last_by_recipient.pop(key))
+
+    def _run(self):
+        conn = None
+        last_prune = 0
+        while True:
+            try:
+                if conn is None:
+                    conn = _connect()
+                latest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM user_events').fetchone()[0]
+                if latest != self.last_id:
+                    rows = conn.execute(
+                        '''SELECT id, telegram_id, order_id FROM user_events
+                           WHERE id > ? AND id <= ? AND telegram_id IS NOT NULL''',
+                        (self.last_id, latest)
+                    ).fetchall()
+                    with self._cond:
+                        self._track(rows)
+                        self.last_id = latest
+                        self._cond.notify_all()
+
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    conn.execute(
+                        "DELETE FROM user_events WHERE created_at < datetime('now', ?)",
+                        (f'-{EVENTS_TTL_MINUTES} minutes',)
+                    )
+                    conn.commit()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                logger.error(f"[SSE] Broadcaster error: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                time.sleep(5)
+            self._poke.wait(self.interval)
+            self._poke.clear()
+
+
+broadcaster = EventBroadcaster()
+
+
+def format_sse(event_id, data):
+    """Сериализация события в формат text/event-stream"""
+    return f"id: {event_id}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def setup_event_routes(app, get_db_connection):
+    """Регистрация маршрутов SSE"""
+
+    @app.route('/api/events/stream', methods=['GET'])
+    def stream_events():
+        """Поток событий пользователя (EventSource)"""
+        telegram_id = request_telegram_id()
+
+        if not telegram_id:
+            return jsonify({'error': 'telegram_id required'}), 400
+
+        conn = get_db_connection()
+
+        try:
+            user = current_user(conn)
+
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+
+            truck_types = []
+            if user['role'] == 'driver':
+                truck_types = [row['truck_type'] for row in conn.execute(
+                    'SELECT truck_type FROM driver_vehicles WHERE driver_id = ?',
+                    (user['id'],)
+                ).fetchall()]
+
+            # При переподключении EventSource сам присылает Last-Event-ID
+            last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+            if last_event_id and last_event_id.isdigit():
+                cursor_id = int(last_event_id)
+            else:
+                cursor_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM user_events').fetchone()[0]
+        finally:
+            conn.close()
+
+        query = '''SELECT id, event_type, order_id, payload FROM user_events
+                   WHERE id > ? AND id <= ? AND (telegram_id = ?'''
+        if user['role'] == 'driver':
+            query += ' OR (telegram_id IS NULL AND (truck_type IS NULL'
+            if truck_types:
+                query += f" OR truck_type IN ({','.join('?' * len(truck_types))})"
+            query += '))'
+        query += ') ORDER BY id'
+
+        broadcaster.start()
+
+        def generate(cursor_id):
+            yield 'retry: 3000\n\n'
+            while True:
+                latest = broadcaster.wait(cursor_id, KEEPALIVE_INTERVAL)
+                if latest <= cursor_id:
+                    yield ': keepalive\n\n'
+                    continue
+
+                conn = get_db_connection()
+                try:
+                    rows = conn.execute(query, (cursor_id, latest, telegram_id, *truck_types)).fetchall()
+                finally:
+                    conn.close()
+
+                for row in rows:
+                    data = json.loads(row['payload']) if row['payload'] else {}
+                    data.update({'type': row['event_type'], 'order_id': row['order_id']})
+                    yield format_sse(row['id'], data)
+
+                cursor_id = latest
+
+        return Response(
+            stream_with_context(generate(cursor_id)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # nginx не должен буферизовать поток
+            }
+        )
@@ -0,0 +1,190 @@
+"""
+Нормализация адресов, геокодирование по локальному справочнику и сетка ячеек
+
+Адреса в заказах - свободный текст. Координаты берутся без внешних сервисов:
+из адреса выделяется населённый пункт и ищется в справочнике GAZETTEER.
+Результаты сохраняются в geocode_cache по нормализованному адресу; запись в
+кэше главнее справочника, поэтому частые адреса можно уточнить вручную.
+
+Подбор водителей сужается сеткой: ячейка - квадрат CELL_DEG x CELL_DEG
+градусов, заказ видят водители, чья база в той же или соседней ячейке.
+Лента "рядом" берёт кандидатов из ячеек вокруг точки и сортирует их
+по расстоянию.
+"""
+import math
+import re
+
+CELL_DEG = 0.5  # Размер ячейки в градусах (~55 км по широте)
+GRID_COLS = int(360 / CELL_DEG)
+MATCH_RADIUS_CELLS = 1  # Соседние ячейки вокруг базы водителя / точки подачи
+MAX_NEAR_RADIUS_CELLS = 3  # Предел для ленты "рядом": не больше 7x7 ячеек
+EARTH_RADIUS_KM = 6371.0
+
+WORD_RE = re.compile(r'\w+')
+HYPHENATED_RE = re.compile(r'\b(?:пр-т|б-р|р-н)\b')  # Сокращения с дефисом - до разбора на слова
+MAX_PLACE_WORDS = 3  # Самое длинное название в справочнике ("ростов на дону")
+
+# Служебные слова адреса: тип улицы, дома, региона
+STOP_WORDS = {
+    'г', 'гор', 'город', 'пгт', 'п', 'пос', 'поселок', 'с', 'село', 'дер', 'деревня',
+    'ул', 'улица', 'пр', 'просп', 'проспект', 'пер', 'переулок', 'ш', 'шоссе',
+    'наб', 'набережная', 'бул', 'бульвар', 'пл', 'площадь', 'проезд', 'мкр', 'микрорайон',
+    'д', 'дом', 'к', 'корп', 'корпус', 'стр', 'строение', 'кв', 'квартира', 'оф', 'офис',
+    'обл', 'область', 'район', 'край', 'респ', 'республика', 'россия', 'рф',
+}
+
+# Населённые пункты: нормализованное название -> (широта, долгота)
+GAZETTEER = {
+    'москва': (55.7558, 37.6173),
+    'мск': (55.7558, 37.6173),
+    'санкт петербург': (59.9343, 30.3351),
+    'спб': (59.9343, 30.3351),
+    'питер': (59.9343, 30.3351),
+    'новосибирск': (55.0084, 82.9357),
+    'екатеринбург': (56.8389, 60.6057),
+    'казань': (55.7961, 49.1064),
+    'нижний новгород': (56.2965, 43.9361),
+    'челябинск': (55.1644, 61.4368),
+    'самара': (53.1959, 50.1002),
+    'омск': (54.9885, 73.3242),
+    'ростов на дону': (47.2357, 39.7015),
+    'уфа': (54.7388, 55.9721),
+    'красноярск': (56.0153, 92.8932),
+    'воронеж': (51.6608, 39.2003),
+    'пермь': (58.0105, 56.2502),
+    'волгоград': (48.7080, 44.5133),
+    'краснодар': (45.0355, 38.9753),
+    'саратов': (51.5336, 46.0343),
+    'тюмень': (57.1522, 65.5272),
+    'тольятти': (53.5078, 49.4204),
+    'ижевск': (56.8526, 53.2045),
+    'барнаул': (53.3548, 83.7698),
+    'ульяновск': (54.3142, 48.4031),
+    'иркутск': (52.2869, 104.3050),
+    'хабаровск': (48.4827, 135.0838),
+    'ярославль': (57.6261, 39.8845),
+    'владивосток': (43.1198, 131.8869),
+    'махачкала': (42.9849, 47.5047),
+    'томск': (56.4846, 84.9476),
+    'оренбург': (51.7682, 55.0970),
+    'кемерово': (55.3547, 86.0873),
+    'новокузнецк': (53.7557, 87.1099),
+    'рязань': (54.6269, 39.6916),
+    'астрахань': (46.3479, 48.0336),
+    'набережные челны': (55.7436, 52.3958),
+    'пенза': (53.1959, 45.0183),
+    'липецк': (52.6031, 39.5708),
+    'киров': (58.6036, 49.6680),
+    'чебоксары': (56.1322, 47.2519),
+    'тула': (54.1931, 37.6173),
+    'калининград': (54.7104, 20.4522),
+    'курск': (51.7304, 36.1926),
+    'ставрополь': (45.0428, 41.9734),
+    'сочи': (43.5855, 39.7231),
+    'тверь': (56.8587, 35.9176),
+    'белгород': (50.5997, 36.5983),
+    'брянск': (53.2521, 34.3717),
+    'иваново': (57.0004, 40.9739),
+    'владимир': (56.1290, 40.4066),
+    'архангельск': (64.5393, 40.5170),
+    'смоленск': (54.7826, 32.0453),
+    'калуга': (54.5293, 36.2754),
+    'мурманск': (68.9585, 33.0827),
+    'сургут': (61.2540, 73.3962),
+    'вологда': (59.2181, 39.8886),
+    'новороссийск': (44.7239, 37.7688),
+    'якутск': (62.0355, 129.6755),
+    'подольск': (55.4312, 37.5447),
+    'химки': (55.8887, 37.4304),
+    'балашиха': (55.7963, 37.9382),
+    'мытищи': (55.9116, 37.7308),
+    'королев': (55.9162, 37.8545),
+    'люберцы': (55.6783, 37.8931),
+    'красногорск': (55.8204, 37.3302),
+    'одинцово': (55.6789, 37.2639),
+}
+
+def normalize_address(text):
+    """
+    Адрес в каноническом виде: нижний регистр, ё -> е, без знаков препинания
+    и служебных слов ("г. Москва, ул. Ленина, д. 10" -> "москва ленина 10")
+    """
+    text = HYPHENATED_RE.sub(' ', (text or '').lower().replace('ё', 'е')).replace('-', ' ')
+    words = [word for word in WORD_RE.findall(text) if word not in STOP_WORDS]
+    return ' '.join(words)
+
+def find_place(address_norm):
+    """
+    Населённый пункт из нормализованного адреса
+
+    Сначала ищутся самые длинные названия ("нижний новгород" раньше
+    "новгород"), при равной длине - первое по порядку в адресе.
+
+    Returns:
+        Ключ GAZETTEER или None
+    """
+    words = address_norm.split()
+    for size in range(min(MAX_PLACE_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            name = ' '.join(words[start:start + size])
+            if name in GAZETTEER:
+                return name
+    return None
+
+def grid_cell(lat, lon):
+    """Номер ячейки сетки для координат"""
+    row = int((lat + 90) // CELL_DEG)
+    col = int((lon + 180) // CELL_DEG) % GRID_COLS
+    return row * GRID_COLS + col
+
+def nearby_cells(cell, radius=MATCH_RADIUS_CELLS):
+    """Ячейка и соседние в пределах radius (по долготе - через 180-й меридиан)"""
+    row, col = divmod(cell, GRID_COLS)
+    return [
+        (row + d_row) * GRID_COLS + (col + d_col) % GRID_COLS
+        for d_row in range(-radius, radius + 1)
+        for d_col in range(-radius, radius + 1)
+    ]
+
+def lon_scale(lat):
+    """Множитель градуса долготы на широте lat (плоская проекция для сортировки)"""
+    return math.cos(math.radians(lat))
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу в километрах"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def geocode(conn, address):
+    """
+    Координаты адреса: из geocode_cache, иначе по справочнику (с записью в кэш)
+
+    Не найденные адреса не кэшируются - после пополнения справочника они
+    найдутся без чистки кэша. Коммит - на вызывающем.
+
+    Returns:
+        dict с lat, lon, cell, place или None
+    """
+    address_norm = normalize_address(address)
+    if not address_norm:
+        return None
+
+    row = conn.execute(
+        'SELECT lat, lon, place FROM geocode_cache WHERE address_norm = ?',
+        (address_norm,)
+    ).fetchone()
+    if row:
+        lat, lon, place = row[0], row[1], row[2]
+    else:
+        place = find_place(address_norm)
+        if place is None:
+            return None
+        lat, lon = GAZETTEER[place]
+        conn.execute(
+            'INSERT OR IGNORE INTO geocode_cache (address_norm, lat, lon, place) VALUES (?, ?, ?, ?)',
+            (address_norm, lat, lon, place)
+        )
+
+    return {'lat': lat, 'lon': lon, 'cell': grid_cell(lat, lon), 'place': place}
@@ -0,0 +1,122 @@
+"""
+Кэш пользователей по telegram_id (и по users.id) в памяти воркера
+
+Почти каждый обработчик начинается с поиска пользователя по telegram_id.
+Здесь найденные строки users хранятся в LRU воркера. Изменения видны всем
+процессам через users_version: триггеры увеличивают счётчик при любом
+изменении или удалении пользователя (админка, бан, бот), и воркер, заметив
+новое значение, сбрасывает кэш. Счётчик проверяется не чаще раза в
+VERSION_CHECK_INTERVAL; свои изменения воркер сбрасывает сразу (invalidate).
+
+Отсутствующие пользователи не кэшируются - регистрация в боте видна сразу.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+IDENTITY_CACHE_SIZE = 10000
+VERSION_CHECK_INTERVAL = 1.0  # Сек; дольше этого чужое изменение не живёт в кэше
+
+# Меняются часто и не нужны для идентификации
+UNCACHED_COLUMNS = ('profile_version',)
+
+
+class IdentityCache:
+    """LRU строк users (dict) по telegram_id с индексом по id"""
+
+    def __init__(self, max_size=IDENTITY_CACHE_SIZE, check_interval=VERSION_CHECK_INTERVAL):
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._by_telegram_id = OrderedDict()
+        self._telegram_ids = {}  # users.id -> telegram_id
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _sync(self, conn):
+        """Сбросить кэш, если users_version изменился (не чаще check_interval)"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        try:
+            row = conn.execute('SELECT version FROM users_version WHERE id = 1').fetchone()
+            version = row[0] if row else None
+        except sqlite3.OperationalError:
+            version = None  # Миграция не применена - без кэша
+        with self._lock:
+            if version is None or version != self._version:
+                self._by_telegram_id.clear()
+                self._telegram_ids.clear()
+            self._version = version
+            self._checked_at = now
+
+    def _lookup(self, conn, column, value):
+        row = conn.execute(f'SELECT * FROM users WHERE {column} = ?', (value,)).fetchone()
+        if row is None:
+            return None
+        user = {key: row[key] for key in row.keys() if key not in UNCACHED_COLUMNS}
+        with self._lock:
+            if self._version is not None:
+                self._by_telegram_id[user['telegram_id']] = user
+                self._by_telegram_id.move_to_end(user['telegram_id'])
+                self._telegram_ids[user['id']] = user['telegram_id']
+                while len(self._by_telegram_id) > self.max_size:
+                    _, evicted = self._by_telegram_id.popitem(last=False)
+                    self._telegram_ids.pop(evicted['id'], None)
+        return dict(user)
+
+    def get(self, conn, telegram_id):
+        """
+        Пользователь по telegram_id
+
+        Returns:
+            dict со столбцами users или None
+        """
+        try:
+            telegram_id = int(telegram_id)
+        except (TypeError, ValueError):
+            return None
+        self._sync(conn)
+        with self._lock:
+            user = self._by_telegram_id.get(telegram_id)
+            if user is not None:
+                self._by_telegram_id.move_to_end(telegram_id)
+                return dict(user)
+        return self._lookup(conn, 'telegram_id', telegram_id)
+
+    def get_by_id(self, conn, user_id):
+        """Пользователь по users.id (dict или None)"""
+        if user_id is None:
+            return None
+        self._sync(conn)
+        with self._lock:
+            user = self._by_telegram_id.get(self._telegram_ids.get(user_id))
+            if user is not None:
+                self._by_telegram_id.move_to_end(user['telegram_id'])
+                return dict(user)
+        return self._lookup(conn, 'id', user_id)
+
+    def invalidate(self, telegram_id):
+        """Забыть пользователя (после изменения в этом воркере)"""
+        try:
+            telegram_id = int(telegram_id)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            user = self._by_telegram_id.pop(telegram_id, None)
+            if user is not None:
+                self._telegram_ids.pop(user['id'], None)
+
+
+identity_cache = IdentityCache()
+
+
+def resolve_user(conn, telegram_id):
+    """Строка users по telegram_id через кэш воркера (dict или None)"""
+    return identity_cache.get(conn, telegram_id)
+
+
+def resolve_user_by_id(conn, user_id):
+    """Строка users по id через кэш воркера (dict или None)"""
+    return identity_cache.get_by_id(conn, user_id)
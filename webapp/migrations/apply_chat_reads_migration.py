@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Миграция: курсоры прочтения чата (order_chat_reads)
+
+Вместо пересчёта флагов read_by_* по всей переписке храним для каждого
+участника id последнего прочитанного сообщения в заказе.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для курсоров прочтения чата...")
+
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='table' AND name='order_chat_reads'
+        """)
+
+        if cursor.fetchone():
+            print("ℹ️  Таблица order_chat_reads уже существует")
+        else:
+            cursor.execute("""
+                CREATE TABLE order_chat_reads (
+                    order_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    last_read_id INTEGER NOT NULL DEFAULT 0,
+                    read_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (order_id, user_id),
+                    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+            print("✅ Таблица order_chat_reads создана")
+
+            # Переносим уже прочитанное из флагов read_by_customer / read_by_driver
+            cursor.execute("""
+                INSERT INTO order_chat_reads (order_id, user_id, last_read_id)
+                SELECT m.order_id, o.customer_id, MAX(m.id)
+                FROM order_messages m
+                JOIN orders o ON m.order_id = o.id
+                WHERE m.read_by_customer = 1 AND m.sender_id != o.customer_id
+                GROUP BY m.order_id
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO order_chat_reads (order_id, user_id, last_read_id)
+                SELECT m.order_id, o.winner_driver_id, MAX(m.id)
+                FROM order_messages m
+                JOIN orders o ON m.order_id = o.id
+                WHERE m.read_by_driver = 1 AND m.sender_id != o.winner_driver_id
+                  AND o.winner_driver_id IS NOT NULL
+                GROUP BY m.order_id
+            """)
+            print("✅ Курсоры заполнены из существующих флагов")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
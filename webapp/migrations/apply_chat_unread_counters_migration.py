@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Миграция: счётчики непрочитанных сообщений в order_chat_reads
+
+Счётчик участника увеличивается при отправке ему сообщения и обнуляется
+при прочтении, поэтому бейдж непрочитанных - один индексный запрос.
+Требует apply_chat_reads_migration.py.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для счётчиков непрочитанных сообщений...")
+
+        # ALTER TABLE и пересчёт счётчиков - в одной транзакции: повтор
+        # после сбоя пересчёта увидел бы колонку и оставил нули
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("PRAGMA table_info(order_chat_reads)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if not columns:
+            print("❌ Таблица order_chat_reads не найдена - сначала apply_chat_reads_migration.py")
+            sys.exit(1)
+
+        if 'unread_count' in columns:
+            print("ℹ️  Колонка unread_count уже существует")
+        else:
+            cursor.execute("ALTER TABLE order_chat_reads ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0")
+            print("✅ Добавлена колонка unread_count")
+
+            # Строки для участников, у которых ещё нет курсора
+            cursor.execute("""
+                INSERT OR IGNORE INTO order_chat_reads (order_id, user_id, last_read_id)
+                SELECT DISTINCT m.order_id, o.customer_id, 0
+                FROM order_messages m
+                JOIN orders o ON m.order_id = o.id
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO order_chat_reads (order_id, user_id, last_read_id)
+                SELECT DISTINCT m.order_id, o.winner_driver_id, 0
+                FROM order_messages m
+                JOIN orders o ON m.order_id = o.id
+                WHERE o.winner_driver_id IS NOT NULL
+            """)
+
+            # Начальные значения - по курсорам прочтения
+            cursor.execute("""
+                UPDATE order_chat_reads
+                SET unread_count = (
+                    SELECT COUNT(*) FROM order_messages m
+                    WHERE m.order_id = order_chat_reads.order_id
+                      AND m.id > order_chat_reads.last_read_id
+                      AND m.sender_id != order_chat_reads.user_id
+                )
+            """)
+            print("✅ Счётчики заполнены")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_order_chat_reads_unread
+            ON order_chat_reads(user_id, unread_count)
+        """)
+        print("✅ Индексы созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
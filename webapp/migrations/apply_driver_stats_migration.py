@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Миграция: предрасчитанная статистика водителей (driver_stats)
+
+Одна строка на водителя: сумма и количество оценок, назначенные и
+завершённые заказы, количество ставок и суммарное время отклика (от
+публикации заказа до ставки). Триггеры на reviews, bids и orders обновляют
+строку при любой записи (из webapp, бота или auction_checker), поэтому
+ранжирование ставок - один JOIN вместо подзапросов по reviews на каждую ставку.
+"""
+import sqlite3
+import sys
+import os
+
+FINISHED_STATUSES = "('closed', 'completed')"
+
+# Секунды от публикации заказа до ставки (не меньше 0)
+RESPONSE_SECONDS = """MAX(0, (julianday(NEW.created_at) - julianday(
+    (SELECT created_at FROM orders WHERE id = NEW.order_id)
+)) * 86400)"""
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для статистики водителей...")
+
+        # CREATE TABLE сам по себе фиксируется сразу: без явной транзакции сбой
+        # заполнения оставил бы пустую driver_stats, которую повтор не заполнит
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='driver_stats'")
+        if cursor.fetchone():
+            print("ℹ️  Таблица driver_stats уже существует")
+        else:
+            cursor.execute("""
+                CREATE TABLE driver_stats (
+                    driver_id INTEGER PRIMARY KEY,
+                    review_count INTEGER NOT NULL DEFAULT 0,
+                    rating_sum INTEGER NOT NULL DEFAULT 0,
+                    awarded_count INTEGER NOT NULL DEFAULT 0,
+                    completed_count INTEGER NOT NULL DEFAULT 0,
+                    bid_count INTEGER NOT NULL DEFAULT 0,
+                    response_seconds_sum REAL NOT NULL DEFAULT 0,
+                    FOREIGN KEY (driver_id) REFERENCES users (id)
+                )
+            """)
+            print("✅ Создана таблица driver_stats")
+
+            # Начальные значения - по существующим данным
+            cursor.execute("""
+                INSERT INTO driver_stats (driver_id) SELECT id FROM users
+            """)
+            cursor.execute("""
+                UPDATE driver_stats SET
+                    review_count = (SELECT COUNT(*) FROM reviews r WHERE r.reviewee_id = driver_stats.driver_id),
+                    rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews r WHERE r.reviewee_id = driver_stats.driver_id),
+                    awarded_count = (SELECT COUNT(*) FROM orders o WHERE o.winner_driver_id = driver_stats.driver_id),
+                    completed_count = (
+                        SELECT COUNT(*) FROM orders o
+                        WHERE o.winner_driver_id = driver_stats.driver_id AND o.status IN """ + FINISHED_STATUSES + """
+                    ),
+                    bid_count = (SELECT COUNT(*) FROM bids b WHERE b.driver_id = driver_stats.driver_id),
+                    response_seconds_sum = (
+                        SELECT COALESCE(SUM(MAX(0, (julianday(b.created_at) - julianday(o.created_at)) * 86400)), 0)
+                        FROM bids b
+                        JOIN orders o ON o.id = b.order_id
+                        WHERE b.driver_id = driver_stats.driver_id
+                    )
+            """)
+            # Строки без единой записи не нужны - их создадут триггеры
+            cursor.execute("""
+                DELETE FROM driver_stats
+                WHERE review_count = 0 AND awarded_count = 0 AND bid_count = 0
+            """)
+            print("✅ Статистика заполнена")
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_review_insert
+            AFTER INSERT ON reviews
+            BEGIN
+                INSERT INTO driver_stats (driver_id, review_count, rating_sum)
+                VALUES (NEW.reviewee_id, 1, NEW.rating)
+                ON CONFLICT(driver_id) DO UPDATE SET
+                    review_count = review_count + 1,
+                    rating_sum = rating_sum + NEW.rating;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_review_update
+            AFTER UPDATE OF rating ON reviews
+            WHEN NEW.rating IS NOT OLD.rating
+            BEGIN
+                UPDATE driver_stats SET rating_sum = rating_sum - OLD.rating + NEW.rating
+                WHERE driver_id = NEW.reviewee_id;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_review_delete
+            AFTER DELETE ON reviews
+            BEGIN
+                UPDATE driver_stats SET
+                    review_count = review_count - 1,
+                    rating_sum = rating_sum - OLD.rating
+                WHERE driver_id = OLD.reviewee_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_bid_insert
+            AFTER INSERT ON bids
+            BEGIN
+                INSERT INTO driver_stats (driver_id, bid_count, response_seconds_sum)
+                VALUES (NEW.driver_id, 1, {RESPONSE_SECONDS})
+                ON CONFLICT(driver_id) DO UPDATE SET
+                    bid_count = bid_count + 1,
+                    response_seconds_sum = response_seconds_sum + excluded.response_seconds_sum;
+            END
+        """)
+        # Назначение исполнителя (в т.ч. повторное после отказа водителя)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_award
+            AFTER UPDATE OF winner_driver_id ON orders
+            WHEN NEW.winner_driver_id IS NOT NULL
+             AND NEW.winner_driver_id IS NOT OLD.winner_driver_id
+            BEGIN
+                INSERT INTO driver_stats (driver_id, awarded_count)
+                VALUES (NEW.winner_driver_id, 1)
+                ON CONFLICT(driver_id) DO UPDATE SET awarded_count = awarded_count + 1;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_driver_stats_complete
+            AFTER UPDATE OF status ON orders
+            WHEN NEW.winner_driver_id IS NOT NULL
+             AND NEW.status IN {FINISHED_STATUSES}
+             AND OLD.status NOT IN {FINISHED_STATUSES}
+            BEGIN
+                UPDATE driver_stats SET completed_count = completed_count + 1
+                WHERE driver_id = NEW.winner_driver_id;
+            END
+        """)
+        print("✅ Триггеры статистики созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Миграция: координаты заказов и баз водителей, кэш геокодирования
+
+geocode_cache - нормализованный адрес -> координаты (заполняет geo.geocode
+по локальному справочнику, записи можно править вручную).
+orders: координаты и ячейка сетки точки подачи и доставки.
+users: адрес базы водителя, её координаты и ячейка.
+Индексы по ячейкам - для выборки водителей и открытых заказов рядом.
+"""
+import sqlite3
+import sys
+import os
+
+ORDER_COLUMNS = [
+    ('pickup_lat', 'REAL'),
+    ('pickup_lon', 'REAL'),
+    ('pickup_cell', 'INTEGER'),
+    ('delivery_lat', 'REAL'),
+    ('delivery_lon', 'REAL'),
+    ('delivery_cell', 'INTEGER'),
+]
+USER_COLUMNS = [
+    ('home_address', 'TEXT'),
+    ('home_lat', 'REAL'),
+    ('home_lon', 'REAL'),
+    ('home_cell', 'INTEGER'),
+]
+
+
+def add_columns(cursor, table, columns):
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns:
+        if name in existing:
+            print(f"ℹ️  Колонка {table}.{name} уже существует")
+        else:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            print(f"✅ Добавлена колонка {table}.{name}")
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для геокодирования адресов...")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                address_norm TEXT PRIMARY KEY,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                place TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        print("✅ Таблица geocode_cache готова")
+
+        add_columns(cursor, 'orders', ORDER_COLUMNS)
+        add_columns(cursor, 'users', USER_COLUMNS)
+
+        # Открытые заказы рядом с базой водителя
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_pickup_cell ON orders(status, pickup_cell)")
+        # Водители рядом с точкой подачи (рассылка о новом заказе)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role_home_cell ON users(role, home_cell)")
+        print("✅ Индексы по ячейкам созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
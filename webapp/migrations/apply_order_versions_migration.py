@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Миграция: версия заказа для условных GET-запросов (ETag) по лентам заказов
+
+orders.version - глобально возрастающий счётчик. Триггеры увеличивают его при
+любом изменении заказа или ставок по нему (из webapp, бота или auction_checker),
+поэтому MAX(version) по индексу - дешёвый признак "лента изменилась".
+"""
+import sqlite3
+import sys
+import os
+
+NEXT_VERSION = "(SELECT COALESCE(MAX(version), 0) + 1 FROM orders)"
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для версий заказов...")
+
+        cursor.execute("PRAGMA table_info(orders)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'version' not in columns:
+            cursor.execute("ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            # Начальные версии - по порядку id
+            cursor.execute("UPDATE orders SET version = id")
+            print("✅ Добавлена колонка orders.version")
+        else:
+            print("ℹ️  Колонка orders.version уже существует")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_version ON orders(version)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer_version ON orders(customer_id, version)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_reviews_reviewer ON reviews(reviewer_id)")
+        print("✅ Индексы созданы")
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_version_insert
+            AFTER INSERT ON orders
+            BEGIN
+                UPDATE orders SET version = {NEXT_VERSION} WHERE id = NEW.id;
+            END
+        """)
+        # WHEN защищает от повторного срабатывания на собственный UPDATE
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_version_update
+            AFTER UPDATE ON orders
+            WHEN NEW.version IS OLD.version
+            BEGIN
+                UPDATE orders SET version = {NEXT_VERSION} WHERE id = NEW.id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_bids_version_insert
+            AFTER INSERT ON bids
+            BEGIN
+                UPDATE orders SET version = {NEXT_VERSION} WHERE id = NEW.order_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_bids_version_update
+            AFTER UPDATE ON bids
+            BEGIN
+                UPDATE orders SET version = {NEXT_VERSION} WHERE id = NEW.order_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_bids_version_delete
+            AFTER DELETE ON bids
+            BEGIN
+                UPDATE orders SET version = {NEXT_VERSION} WHERE id = OLD.order_id;
+            END
+        """)
+        print("✅ Триггеры версий созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
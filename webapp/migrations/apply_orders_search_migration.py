@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Миграция: полнотекстовый поиск по заказам и истории изменений
+
+orders_fts (rowid = orders.id) - описание груза и адреса,
+order_history_fts (rowid = order_history.id) - описание действия, старое
+и новое значение поля. Триггеры поддерживают индексы при любой записи
+(webapp, бот, auction_checker), поиск - /api/orders/search и /api/history?q=.
+"""
+import sqlite3
+import sys
+import os
+
+
+def table_exists(cursor, name):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (name,))
+    return cursor.fetchone() is not None
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для поиска по заказам...")
+
+        # Индексы создаются и заполняются в одной транзакции - иначе после
+        # ошибки заполнения повторный запуск пропустил бы уже созданную таблицу
+        cursor.execute("BEGIN IMMEDIATE")
+
+        if table_exists(cursor, 'orders_fts'):
+            print("ℹ️  Таблица orders_fts уже существует")
+        else:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE orders_fts USING fts5(
+                    cargo_description, pickup_address, delivery_address,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO orders_fts (rowid, cargo_description, pickup_address, delivery_address)
+                SELECT id, cargo_description, pickup_address, delivery_address FROM orders
+            """)
+            print("✅ Создана и заполнена таблица orders_fts")
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_insert
+            AFTER INSERT ON orders
+            BEGIN
+                INSERT INTO orders_fts (rowid, cargo_description, pickup_address, delivery_address)
+                VALUES (NEW.id, NEW.cargo_description, NEW.pickup_address, NEW.delivery_address);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_update
+            AFTER UPDATE OF cargo_description, pickup_address, delivery_address ON orders
+            BEGIN
+                DELETE FROM orders_fts WHERE rowid = OLD.id;
+                INSERT INTO orders_fts (rowid, cargo_description, pickup_address, delivery_address)
+                VALUES (NEW.id, NEW.cargo_description, NEW.pickup_address, NEW.delivery_address);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_delete
+            AFTER DELETE ON orders
+            BEGIN
+                DELETE FROM orders_fts WHERE rowid = OLD.id;
+            END
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at DESC, id DESC)")
+        print("✅ Триггеры и индексы заказов созданы")
+
+        if not table_exists(cursor, 'order_history'):
+            print("⚠️  Таблица order_history не найдена - поиск по истории не создан")
+        else:
+            if table_exists(cursor, 'order_history_fts'):
+                print("ℹ️  Таблица order_history_fts уже существует")
+            else:
+                cursor.execute("""
+                    CREATE VIRTUAL TABLE order_history_fts USING fts5(
+                        description, old_value, new_value,
+                        tokenize = 'unicode61 remove_diacritics 2',
+                        prefix = '2 3'
+                    )
+                """)
+                cursor.execute("""
+                    INSERT INTO order_history_fts (rowid, description, old_value, new_value)
+                    SELECT id, description, old_value, new_value FROM order_history
+                """)
+                print("✅ Создана и заполнена таблица order_history_fts")
+
+            # История только дописывается; удаляется вместе с заказом
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_order_history_fts_insert
+                AFTER INSERT ON order_history
+                BEGIN
+                    INSERT INTO order_history_fts (rowid, description, old_value, new_value)
+                    VALUES (NEW.id, NEW.description, NEW.old_value, NEW.new_value);
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_order_history_fts_delete
+                AFTER DELETE ON order_history
+                BEGIN
+                    DELETE FROM order_history_fts WHERE rowid = OLD.id;
+                END
+            """)
+            print("✅ Триггеры истории созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
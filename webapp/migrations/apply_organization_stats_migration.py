@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Миграция: счётчики организаций для админ панели (organization_stats)
+
+Одна строка на организацию: пользователи, выданные и использованные
+инвайт-коды. Триггеры на users, invite_codes и organizations обновляют
+строку при любой записи (регистрация в боте, генерация кодов, админка),
+поэтому список организаций - один JOIN вместо произведения
+пользователи x коды с COUNT(DISTINCT).
+Запускать после apply_admin_features.py (users.organization_id).
+"""
+import sqlite3
+import sys
+import os
+
+# Вклад строки в счётчики: {row} - NEW или OLD, {sign} - + или -
+USER_DELTA = """
+    UPDATE organization_stats SET users_count = users_count {sign} 1
+    WHERE organization_id = {row}.organization_id;
+"""
+CODE_DELTA = """
+    UPDATE organization_stats SET
+        total_codes = total_codes {sign} 1,
+        used_codes = used_codes {sign} ({row}.used_by_telegram_id IS NOT NULL)
+    WHERE organization_id = {row}.organization_id;
+"""
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для счётчиков организаций...")
+
+        # Таблица и её заполнение - одной транзакцией: sqlite3 не открывает
+        # её перед DDL сам, и после ошибки заполнения осталась бы пустая таблица
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='organization_stats'")
+        if cursor.fetchone():
+            print("ℹ️  Таблица organization_stats уже существует")
+        else:
+            cursor.execute("""
+                CREATE TABLE organization_stats (
+                    organization_id INTEGER PRIMARY KEY,
+                    users_count INTEGER NOT NULL DEFAULT 0,
+                    total_codes INTEGER NOT NULL DEFAULT 0,
+                    used_codes INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY (organization_id) REFERENCES organizations (id)
+                )
+            """)
+            print("✅ Создана таблица organization_stats")
+
+            # Начальные значения - независимыми группировками по существующим данным
+            cursor.execute("""
+                INSERT INTO organization_stats (organization_id, users_count, total_codes, used_codes)
+                SELECT o.id,
+                       COALESCE(u.users_count, 0),
+                       COALESCE(c.total_codes, 0),
+                       COALESCE(c.used_codes, 0)
+                FROM organizations o
+                LEFT JOIN (
+                    SELECT organization_id, COUNT(*) as users_count
+                    FROM users WHERE organization_id IS NOT NULL
+                    GROUP BY organization_id
+                ) u ON u.organization_id = o.id
+                LEFT JOIN (
+                    SELECT organization_id, COUNT(*) as total_codes,
+                           COUNT(used_by_telegram_id) as used_codes
+                    FROM invite_codes
+                    GROUP BY organization_id
+                ) c ON c.organization_id = o.id
+            """)
+            print("✅ Счётчики заполнены")
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_org_insert
+            AFTER INSERT ON organizations
+            BEGIN
+                INSERT OR IGNORE INTO organization_stats (organization_id) VALUES (NEW.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_org_delete
+            AFTER DELETE ON organizations
+            BEGIN
+                DELETE FROM organization_stats WHERE organization_id = OLD.id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_user_insert
+            AFTER INSERT ON users
+            WHEN NEW.organization_id IS NOT NULL
+            BEGIN
+                {USER_DELTA.format(sign='+', row='NEW')}
+            END
+        """)
+        # Привязка к другой организации в админке
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_user_update
+            AFTER UPDATE OF organization_id ON users
+            WHEN NEW.organization_id IS NOT OLD.organization_id
+            BEGIN
+                {USER_DELTA.format(sign='-', row='OLD')}
+                {USER_DELTA.format(sign='+', row='NEW')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_user_delete
+            AFTER DELETE ON users
+            WHEN OLD.organization_id IS NOT NULL
+            BEGIN
+                {USER_DELTA.format(sign='-', row='OLD')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_code_insert
+            AFTER INSERT ON invite_codes
+            BEGIN
+                {CODE_DELTA.format(sign='+', row='NEW')}
+            END
+        """)
+        # Использование кода при регистрации
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_code_update
+            AFTER UPDATE OF organization_id, used_by_telegram_id ON invite_codes
+            WHEN NEW.organization_id IS NOT OLD.organization_id
+              OR (NEW.used_by_telegram_id IS NULL) != (OLD.used_by_telegram_id IS NULL)
+            BEGIN
+                {CODE_DELTA.format(sign='-', row='OLD')}
+                {CODE_DELTA.format(sign='+', row='NEW')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_organization_stats_code_delete
+            AFTER DELETE ON invite_codes
+            BEGIN
+                {CODE_DELTA.format(sign='-', row='OLD')}
+            END
+        """)
+        print("✅ Триггеры счётчиков организаций созданы")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_organizations_created ON organizations(created_at DESC, id DESC)")
+        print("✅ Индекс списка организаций создан")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Миграция: архив фото закрытых заказов (photo_archive.py)
+
+photo_blobs.archive_pack - месяц pack-файла (YYYY-MM), в который перенесён
+блоб; отдельный файл блоба после переноса удаляется.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для архива фото...")
+
+        cursor.execute("PRAGMA table_info(photo_blobs)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if not columns:
+            print("❌ Таблица photo_blobs не найдена - сначала apply_photo_blobs_migration.py")
+            sys.exit(1)
+
+        if 'archive_pack' not in columns:
+            cursor.execute("ALTER TABLE photo_blobs ADD COLUMN archive_pack TEXT")
+            cursor.execute("ALTER TABLE photo_blobs ADD COLUMN archive_offset INTEGER")
+            print("✅ Добавлены колонки archive_pack, archive_offset")
+        else:
+            print("ℹ️  Колонки архива уже существуют")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
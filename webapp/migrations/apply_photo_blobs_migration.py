@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Миграция: контентно-адресуемое хранилище фото (photo_blobs)
+
+Файлы вариантов хранятся под именем SHA-256 содержимого в
+/app/data/photos/blobs/ab/cd/<sha256>.webp. Одинаковые файлы (повторная
+отправка того же фото) хранятся один раз; ref_count считает ссылки из
+order_photo_variants и поддерживается триггерами. Блобы без ссылок удаляет
+сборщик мусора photo_worker.py.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для хранилища фото по SHA-256...")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS photo_blobs (
+                sha256 TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                released_at TIMESTAMP
+            )
+        """)
+        # Частичный индекс - сборщику мусора нужны только блобы без ссылок
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_photo_blobs_unreferenced
+            ON photo_blobs(released_at) WHERE ref_count = 0
+        """)
+        print("✅ Таблица photo_blobs создана/проверена")
+
+        cursor.execute("PRAGMA table_info(order_photo_variants)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'blob_sha256' not in columns:
+            cursor.execute("ALTER TABLE order_photo_variants ADD COLUMN blob_sha256 TEXT")
+            print("✅ Добавлена колонка order_photo_variants.blob_sha256")
+        else:
+            print("ℹ️  Колонка blob_sha256 уже существует")
+
+        # Поиск уже загруженного фото по контрольной сумме исходника
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_photos_checksum ON order_photos(checksum)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_photo_variants_blob ON order_photo_variants(blob_sha256)")
+        print("✅ Индексы созданы")
+
+        # Счётчики ссылок
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_photo_variants_blob_insert
+            AFTER INSERT ON order_photo_variants
+            WHEN NEW.blob_sha256 IS NOT NULL
+            BEGIN
+                UPDATE photo_blobs SET ref_count = ref_count + 1, released_at = NULL
+                WHERE sha256 = NEW.blob_sha256;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_photo_variants_blob_delete
+            AFTER DELETE ON order_photo_variants
+            WHEN OLD.blob_sha256 IS NOT NULL
+            BEGIN
+                UPDATE photo_blobs
+                SET ref_count = ref_count - 1,
+                    released_at = CASE WHEN ref_count = 1 THEN CURRENT_TIMESTAMP ELSE released_at END
+                WHERE sha256 = OLD.blob_sha256;
+            END
+        """)
+        # foreign_keys в подключениях не включены, поэтому ON DELETE CASCADE
+        # не срабатывает - удаляем варианты вместе с фото явно
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_order_photos_delete_variants
+            AFTER DELETE ON order_photos
+            BEGIN
+                DELETE FROM order_photo_variants WHERE photo_id = OLD.id;
+            END
+        """)
+        print("✅ Триггеры счётчиков ссылок созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Миграция: очередь обработки загруженных фото (photo_ingest_jobs)
+
+Запрос загрузки только сохраняет файлы во временный каталог и ставит
+задачу; декодирование, варианты, запись в order_photos и уведомление
+выполняет photo_worker.py. Также добавляется order_photos.checksum (SHA-256).
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для очереди обработки фото...")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS photo_ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                photo_type TEXT NOT NULL CHECK(photo_type IN ('loading', 'unloading')),
+                uploaded_by INTEGER NOT NULL,
+                incoming_dir TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued'
+                    CHECK(status IN ('queued', 'processing', 'done', 'failed')),
+                total_files INTEGER NOT NULL,
+                processed_files INTEGER NOT NULL DEFAULT 0,
+                photo_ids TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+                FOREIGN KEY (uploaded_by) REFERENCES users(id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_photo_ingest_jobs_status ON photo_ingest_jobs(status, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_photo_ingest_jobs_order ON photo_ingest_jobs(order_id, id)")
+        print("✅ Таблица photo_ingest_jobs создана/проверена")
+
+        cursor.execute("PRAGMA table_info(order_photos)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'checksum' not in columns:
+            cursor.execute("ALTER TABLE order_photos ADD COLUMN checksum TEXT")
+            print("✅ Добавлена колонка order_photos.checksum")
+        else:
+            print("ℹ️  Колонка order_photos.checksum уже существует")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Миграция: варианты размеров фотографий (order_photo_variants)
+
+Для каждой фотографии хранятся файлы thumb / medium / original
+(см. photo_processing.py). Фото, загруженные до миграции, вариантов
+не имеют и отдаются из order_photos.file_path как есть.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для вариантов фотографий...")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS order_photo_variants (
+                photo_id INTEGER NOT NULL,
+                variant TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                size_bytes INTEGER,
+                PRIMARY KEY (photo_id, variant),
+                FOREIGN KEY (photo_id) REFERENCES order_photos(id) ON DELETE CASCADE
+            )
+        """)
+        print("✅ Таблица order_photo_variants создана/проверена")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Миграция: версия профиля пользователя для кэша /api/profile
+
+users.profile_version увеличивается триггерами при любом изменении, видимом
+в профиле: данные пользователя, отзывы о нём, новые заказы заказчика,
+завершённые заказы водителя. Кэш профиля проверяется по одной строке users.
+Требует apply_driver_stats_migration.py (завершённые заказы водителя).
+"""
+import sqlite3
+import sys
+import os
+
+BUMP = "UPDATE users SET profile_version = profile_version + 1 WHERE id = {user_id};"
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для версий профилей...")
+
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'profile_version' not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN profile_version INTEGER NOT NULL DEFAULT 0")
+            print("✅ Добавлена колонка users.profile_version")
+        else:
+            print("ℹ️  Колонка users.profile_version уже существует")
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_user
+            AFTER UPDATE OF name, phone_number, role, username ON users
+            BEGIN
+                {BUMP.format(user_id='NEW.id')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_review_insert
+            AFTER INSERT ON reviews
+            BEGIN
+                {BUMP.format(user_id='NEW.reviewee_id')}
+            END
+        """)
+        # Ответ на отзыв, оценки полезности и т.п.
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_review_update
+            AFTER UPDATE ON reviews
+            BEGIN
+                {BUMP.format(user_id='NEW.reviewee_id')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_review_delete
+            AFTER DELETE ON reviews
+            BEGIN
+                {BUMP.format(user_id='OLD.reviewee_id')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_order_insert
+            AFTER INSERT ON orders
+            BEGIN
+                {BUMP.format(user_id='NEW.customer_id')}
+            END
+        """)
+        # Счётчик завершённых заказов водителя (driver_stats.completed_count)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_profile_version_order_complete
+            AFTER UPDATE OF status ON orders
+            WHEN NEW.winner_driver_id IS NOT NULL
+             AND NEW.status IN ('closed', 'completed')
+             AND OLD.status NOT IN ('closed', 'completed')
+            BEGIN
+                {BUMP.format(user_id='NEW.winner_driver_id')}
+            END
+        """)
+        print("✅ Триггеры версий профилей созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
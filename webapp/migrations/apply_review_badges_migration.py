@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Миграция: комплименты отзывов в отдельной таблице
+
+review_badges - по строке на комплимент отзыва, user_badge_counts - сколько
+раз пользователь получил каждый комплимент в публичных отзывах. Счётчики
+обновляет триггер при добавлении комплимента, поэтому топ комплиментов
+в профиле - индексный запрос без разбора JSON из reviews.badges.
+Требует apply_detailed_reviews_migration.py.
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для комплиментов отзывов...")
+
+        cursor.execute("PRAGMA table_info(reviews)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'badges' not in columns:
+            print("❌ Колонка reviews.badges не найдена - сначала apply_detailed_reviews_migration.py")
+            sys.exit(1)
+
+        # Явная транзакция: CREATE TABLE иначе фиксируется сразу, и после
+        # ошибки переноса повторный запуск счёл бы таблицу уже заполненной
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='review_badges'")
+        created = cursor.fetchone() is None
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS review_badges (
+                review_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                badge TEXT NOT NULL,
+                PRIMARY KEY (review_id, badge),
+                FOREIGN KEY (review_id) REFERENCES reviews (id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_badge_counts (
+                user_id INTEGER NOT NULL,
+                badge TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, badge),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        print("✅ Таблицы review_badges и user_badge_counts созданы")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_badge_counts_top ON user_badge_counts(user_id, count DESC)")
+        # Страница отзывов профиля: публичные отзывы пользователя по дате
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_reviews_reviewee_public_created
+            ON reviews(reviewee_id, is_public, created_at DESC)
+        """)
+        print("✅ Индексы созданы")
+
+        # В счётчики попадают только комплименты публичных отзывов
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_review_badges_insert
+            AFTER INSERT ON review_badges
+            WHEN (SELECT is_public FROM reviews WHERE id = NEW.review_id)
+            BEGIN
+                INSERT INTO user_badge_counts (user_id, badge, count)
+                VALUES (NEW.user_id, NEW.badge, 1)
+                ON CONFLICT(user_id, badge) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_review_badges_delete
+            AFTER DELETE ON review_badges
+            WHEN (SELECT is_public FROM reviews WHERE id = OLD.review_id)
+            BEGIN
+                UPDATE user_badge_counts SET count = count - 1
+                WHERE user_id = OLD.user_id AND badge = OLD.badge;
+            END
+        """)
+        print("✅ Триггеры счётчиков созданы")
+
+        if created:
+            # Перенос комплиментов из JSON (счётчики заполнит триггер)
+            cursor.execute("""
+                INSERT OR IGNORE INTO review_badges (review_id, user_id, badge)
+                SELECT r.id, r.reviewee_id, j.value
+                FROM reviews r, json_each(r.badges) j
+                WHERE r.badges IS NOT NULL AND json_valid(r.badges)
+            """)
+            print(f"✅ Перенесено комплиментов: {cursor.rowcount}")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
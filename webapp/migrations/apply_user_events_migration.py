@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Миграция: таблица событий для Server-Sent Events (events_api.py)
+"""
+import sqlite3
+import sys
+import os
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для таблицы user_events...")
+
+        # telegram_id = NULL - рассылка всем водителям (с фильтром по truck_type)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER,
+                event_type TEXT NOT NULL,
+                order_id INTEGER,
+                truck_type TEXT,
+                payload TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_events_telegram_id ON user_events(telegram_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_events_created_at ON user_events(created_at)")
+        print("✅ Таблица user_events создана/проверена")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Миграция: полнотекстовый поиск пользователей для админ панели (users_fts)
+
+users_fts (FTS5, rowid = users.id) индексирует имя, username и телефон -
+телефон только цифрами, чтобы "+7 (999) 123" находился по "7999123".
+Префиксные индексы ускоряют поиск по началу слова. Триггеры на users
+поддерживают индекс при регистрации, правке в админке и удалении.
+Индексы по created_at - для постраничного списка без сортировки всей таблицы.
+Запускать после apply_admin_features.py (users.organization_id).
+"""
+import sqlite3
+import sys
+import os
+
+# Телефон без форматирования: только цифры
+PHONE_DIGITS = """replace(replace(replace(replace(replace(
+    COALESCE({row}.phone_number, ''), '+', ''), ' ', ''), '-', ''), '(', ''), ')', '')"""
+
+INSERT_FTS = """
+    INSERT INTO users_fts (rowid, name, username, phone)
+    VALUES ({row}.id, {row}.name, {row}.username, {phone});
+"""
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для поиска пользователей...")
+
+        # Индекс создаётся и заполняется атомарно - иначе после сбоя
+        # заполнения остался бы пустой users_fts, и повтор его пропустил бы
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users_fts'")
+        if cursor.fetchone():
+            print("ℹ️  Таблица users_fts уже существует")
+        else:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE users_fts USING fts5(
+                    name, username, phone,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            """)
+            print("✅ Создана таблица users_fts")
+
+            cursor.execute(f"""
+                INSERT INTO users_fts (rowid, name, username, phone)
+                SELECT u.id, u.name, u.username, {PHONE_DIGITS.format(row='u')}
+                FROM users u
+            """)
+            print("✅ Индекс заполнен")
+
+        insert_new = INSERT_FTS.format(row='NEW', phone=PHONE_DIGITS.format(row='NEW'))
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_insert
+            AFTER INSERT ON users
+            BEGIN
+                {insert_new}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_update
+            AFTER UPDATE OF name, username, phone_number ON users
+            BEGIN
+                DELETE FROM users_fts WHERE rowid = OLD.id;
+                {insert_new}
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_users_fts_delete
+            AFTER DELETE ON users
+            BEGIN
+                DELETE FROM users_fts WHERE rowid = OLD.id;
+            END
+        """)
+        print("✅ Триггеры поиска созданы")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at DESC, id DESC)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_users_organization_created
+            ON users(organization_id, created_at DESC, id DESC)
+        """)
+        print("✅ Индексы списка пользователей созданы")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Миграция: счётчик изменений пользователей для кэша identity.py
+
+users_version - одна строка. Триггеры увеличивают её при изменении данных
+пользователя (имя, роль, бан, организация...) и при удалении, из webapp,
+бота или админки. Воркеры webapp сверяют счётчик и сбрасывают кэш.
+Запускать после apply_admin_features.py (колонки is_banned, organization_id).
+"""
+import sqlite3
+import sys
+import os
+
+# Столбцы, изменение которых сбрасывает кэш (если есть в таблице)
+IDENTITY_COLUMNS = (
+    'telegram_id', 'phone_number', 'role', 'truck_type', 'name', 'username',
+    'is_banned', 'organization_id', 'invite_code_id'
+)
+
+BUMP = "UPDATE users_version SET version = version + 1 WHERE id = 1;"
+
+
+def apply_migration(db_path='/app/data/delivery.db'):
+    """Применить миграцию"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    cursor = conn.cursor()
+
+    try:
+        print("🔄 Начинаем миграцию для версий пользователей...")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO users_version (id, version) VALUES (1, 0)")
+        print("✅ Таблица users_version создана")
+
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [row[1] for row in cursor.fetchall() if row[1] in IDENTITY_COLUMNS]
+        changed = ' OR '.join(f"NEW.{column} IS NOT OLD.{column}" for column in columns)
+
+        # Набор столбцов мог измениться (apply_admin_features) - пересоздаём
+        cursor.execute("DROP TRIGGER IF EXISTS trg_users_version_update")
+        cursor.execute(f"""
+            CREATE TRIGGER trg_users_version_update
+            AFTER UPDATE ON users
+            WHEN {changed}
+            BEGIN
+                {BUMP}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_users_version_delete
+            AFTER DELETE ON users
+            BEGIN
+                {BUMP}
+            END
+        """)
+        print(f"✅ Триггеры созданы (столбцы: {', '.join(columns)})")
+
+        conn.commit()
+        print("✅ Миграция успешно применена!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ошибка при применении миграции: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_PATH', '/app/data/delivery.db')
+    apply_migration(db_path)
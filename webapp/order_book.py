@@ -0,0 +1,151 @@
+"""
+Книга ставок активных заказов в памяти воркера
+
+Для каждого активного заказа - ставки, отсортированные по цене. Топ-5,
+минимальная цена и количество ставок берутся отсюда без пересортировки
+в SQLite. Источник истины - по-прежнему таблица bids: книга помнит
+orders.version (триггеры меняют её при любой ставке), и при расхождении
+с версией из запроса перечитывается. Так видны и ставки, принятые другим
+воркером gunicorn или ботом.
+
+Ставки, записанные этим воркером (bid_ingest.py), применяются к книге сразу.
+Книга удаляется, как только заказ виден не в статусе 'active'.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+MAX_BOOKS = 2000  # Книг в памяти воркера (давно не читавшиеся вытесняются)
+TOP_BIDS = 5  # Сколько ставок видит заказчик во время подбора
+
+
+class OrderBook:
+    """Ставки одного заказа по возрастанию цены"""
+
+    def __init__(self, order_id, version, bids=()):
+        self.order_id = order_id
+        self.version = version
+        self._entries = []  # (price, bid_id, driver_id)
+        self._by_driver = {}
+        for bid_id, driver_id, price in bids:
+            self.apply(bid_id, driver_id, price)
+
+    def apply(self, bid_id, driver_id, price):
+        """Добавить ставку или заменить прежнюю ставку водителя"""
+        entry = (price, bid_id, driver_id)
+        previous = self._by_driver.get(driver_id)
+        if previous == entry:
+            return
+        if previous:
+            del self._entries[bisect.bisect_left(self._entries, previous)]
+        bisect.insort(self._entries, entry)
+        self._by_driver[driver_id] = entry
+
+    @property
+    def count(self):
+        return len(self._entries)
+
+    @property
+    def min_price(self):
+        return self._entries[0][0] if self._entries else None
+
+    def top(self, limit=TOP_BIDS):
+        """Лучшие ставки: список dict bid_id, driver_id, price"""
+        return [
+            {'bid_id': bid_id, 'driver_id': driver_id, 'price': price}
+            for price, bid_id, driver_id in self._entries[:limit]
+        ]
+
+
+class OrderBooks:
+    """Книги активных заказов воркера по order_id"""
+
+    def __init__(self, max_books=MAX_BOOKS):
+        self.max_books = max_books
+        self._books = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, conn, orders):
+        """
+        Актуальные книги заказов
+
+        Args:
+            conn: Подключение к БД (для перечитывания устаревших книг)
+            orders: Строки заказов с id, status, version
+
+        Returns:
+            dict order_id -> OrderBook (только для активных заказов)
+        """
+        books = {}
+        stale = {}
+        with self._lock:
+            for order in orders:
+                order_id = order['id']
+                if order['status'] != 'active':
+                    self._books.pop(order_id, None)
+                    continue
+                book = self._books.get(order_id)
+                if book and book.version == order['version']:
+                    self._books.move_to_end(order_id)
+                    books[order_id] = book
+                else:
+                    stale[order_id] = order['version']
+
+        if stale:
+            placeholders = ','.join('?' * len(stale))
+            bids = {order_id: [] for order_id in stale}
+            for row in conn.execute(
+                f'''SELECT order_id, id, driver_id, price FROM bids
+                    WHERE order_id IN ({placeholders})''',
+                list(stale)
+            ).fetchall():
+                bids[row['order_id']].append((row['id'], row['driver_id'], row['price']))
+
+            with self._lock:
+                for order_id, version in stale.items():
+                    book = OrderBook(order_id, version, bids[order_id])
+                    self._books[order_id] = book
+                    self._books.move_to_end(order_id)
+                    books[order_id] = book
+                while len(self._books) > self.max_books:
+                    self._books.popitem(last=False)
+
+        return books
+
+    def get(self, conn, order):
+        """Книга одного заказа (строка с id, status, version) или None"""
+        return self.get_many(conn, [order]).get(order['id'])
+
+    def apply_bids(self, order_id, version_before, version_after, bids):
+        """
+        Применить ставки, только что записанные этим воркером
+
+        Книга обновляется, только если она была актуальна до записи
+        (version_before) - иначе её перечитает следующий запрос.
+        bids: список (bid_id, driver_id, price)
+        """
+        with self._lock:
+            book = self._books.get(order_id)
+            if book is None:
+                return
+            if book.version != version_before:
+                del self._books[order_id]
+                return
+            for bid_id, driver_id, price in bids:
+                book.apply(bid_id, driver_id, price)
+            book.version = version_after
+
+    def drop(self, order_id):
+        """Забыть книгу (подбор завершён или заказ отменён)"""
+        with self._lock:
+            self._books.pop(order_id, None)
+
+
+def book_stats(book):
+    """(количество ставок, минимальная цена) для ответа ленты"""
+    if book is None:
+        return 0, None
+    return book.count, book.min_price
+
+
+order_books = OrderBooks()
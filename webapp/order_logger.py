@@ -5,6 +5,8 @@ import sqlite3
 from datetime import datetime
 from flask import request
 
+from identity import resolve_user_by_id
+
 def log_order_change(conn, order_id, user_id, action, description=None, 
                      field_name=None, old_value=None, new_value=None):
     """
@@ -26,40 +28,60 @@ def log_order_change(conn, order_id, user_id, action, description=None,
     user_role = None
     
     if user_id:
-        user = conn.execute(
-            'SELECT telegram_id, name, role FROM users WHERE id = ?',
-            (user_id,)
-        ).fetchone()
+        user = resolve_user_by_id(conn, user_id)
         
         if user:
-            user_telegram_id = user[0]
-            user_name = user[1]
-            user_role = user[2]
+            user_telegram_id = user['telegram_id']
+            user_name = user['name']
+            user_role = user['role']
+    
+    ip_address, user_agent = request_client_info()
     
-    # Получаем IP адрес и User-Agent из запроса (если доступен)
+    # Сохраняем запись в историю
+    insert_history_rows(conn, [history_row(
+        order_id, user_id, user_telegram_id, user_name, user_role,
+        action, description, field_name, old_value, new_value,
+        ip_address, user_agent
+    )])
+    conn.commit()
+
+def request_client_info():
+    """IP адрес и User-Agent из запроса (если доступен)"""
     try:
         ip_address = request.remote_addr if request else None
         user_agent = request.headers.get('User-Agent') if request else None
     except:
         ip_address = None
         user_agent = None
+    return ip_address, user_agent
+
+def history_row(order_id, user_id, user_telegram_id, user_name, user_role, action,
+                description=None, field_name=None, old_value=None, new_value=None,
+                ip_address=None, user_agent=None):
+    """Кортеж значений для insert_history_rows"""
+    return (
+        order_id, user_id, user_telegram_id, user_name, user_role,
+        action, field_name, old_value, new_value, description,
+        ip_address, user_agent, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
+
+def insert_history_rows(conn, rows):
+    """
+    Записать строки истории (history_row) без commit
     
-    # Сохраняем запись в историю
-    conn.execute(
+    Для записи истории в одной транзакции с самим изменением
+    """
+    conn.executemany(
         '''INSERT INTO order_history (
             order_id, user_id, user_telegram_id, user_name, user_role,
             action, field_name, old_value, new_value, description,
             ip_address, user_agent, created_at
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-        (
-            order_id, user_id, user_telegram_id, user_name, user_role,
-            action, field_name, old_value, new_value, description,
-            ip_address, user_agent, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
+        rows
     )
-    conn.commit()
 
-def get_order_history(conn, order_id=None, user_id=None, limit=100):
+def get_order_history(conn, order_id=None, user_id=None, limit=100, search=None, offset=0,
+                      participant_id=None):
     """
     Получить историю изменений
     
@@ -68,23 +90,40 @@ def get_order_history(conn, order_id=None, user_id=None, limit=100):
         order_id: Фильтр по ID заказа (опционально)
         user_id: Фильтр по ID пользователя (опционально)
         limit: Максимальное количество записей
+        search: MATCH-выражение по order_history_fts (search.fts_query);
+            записи идут по релевантности, иначе - новые сверху
+        offset: Сколько записей пропустить
+        participant_id: Только заказы, где пользователь - заказчик или
+            исполнитель (опционально)
         
     Returns:
         Список записей истории
     """
-    query = 'SELECT * FROM v_order_history WHERE 1=1'
-    params = []
+    if search:
+        query = '''SELECT v.* FROM order_history_fts f
+                   JOIN v_order_history v ON v.id = f.rowid
+                   WHERE order_history_fts MATCH ?'''
+        params = [search]
+        order_by = 'f.rank, v.created_at DESC'
+    else:
+        query = 'SELECT v.* FROM v_order_history v WHERE 1=1'
+        params = []
+        order_by = 'v.created_at DESC'
     
     if order_id:
-        query += ' AND order_id = ?'
+        query += ' AND v.order_id = ?'
         params.append(order_id)
     
     if user_id:
-        query += ' AND user_id = ?'
+        query += ' AND v.user_id = ?'
         params.append(user_id)
     
-    query += ' ORDER BY created_at DESC LIMIT ?'
-    params.append(limit)
+    if participant_id:
+        query += ' AND v.order_id IN (SELECT id FROM orders WHERE customer_id = ? OR winner_driver_id = ?)'
+        params += [participant_id, participant_id]
+    
+    query += f' ORDER BY {order_by} LIMIT ? OFFSET ?'
+    params += [limit, offset]
     
     rows = conn.execute(query, params).fetchall()
     
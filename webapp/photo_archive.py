@@ -0,0 +1,180 @@
+"""
+Архив фото закрытых заказов: помесячные pack-файлы с индексом
+
+Блобы medium/original заказов, закрытых давно, переносятся из отдельных
+файлов в archive/YYYY-MM.pack (файлы подряд) с индексом YYYY-MM.idx -
+отсортированными записями (sha256, смещение, длина) фиксированного размера.
+Индекс читается через mmap двоичным поиском, само фото - одним seek + read.
+Thumb остаются отдельными файлами. Меньше inode и быстрее резервное копирование.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+INDEX_RECORD = struct.Struct('>32sQQ')  # sha256 (raw), offset, length
+INDEX_REFRESH_INTERVAL = 60  # Как часто проверять новые/обновлённые индексы (сек)
+
+
+class PackIndex:
+    """Отсортированный индекс одного pack-файла, отображённый в память"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = os.stat(path)
+        self.count = self.stat.st_size // INDEX_RECORD.size
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def _key(self, i):
+        start = i * INDEX_RECORD.size
+        return self._mmap[start:start + 32]
+
+    def find(self, digest):
+        """(offset, length) по raw sha256 или None"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == digest:
+            _, offset, length = INDEX_RECORD.unpack_from(self._mmap, lo * INDEX_RECORD.size)
+            return offset, length
+        return None
+
+    def records(self):
+        if not self.count:
+            return []
+        return [INDEX_RECORD.unpack_from(self._mmap, i * INDEX_RECORD.size) for i in range(self.count)]
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+
+class PhotoArchive:
+    """Чтение и пополнение помесячных pack-файлов"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self._indexes = {}  # month -> PackIndex
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def pack_path(self, month):
+        return os.path.join(self.archive_dir, f'{month}.pack')
+
+    def index_path(self, month):
+        return os.path.join(self.archive_dir, f'{month}.idx')
+
+    def _refresh(self, force=False):
+        """Переоткрыть индексы, изменённые другим процессом (photo_worker)"""
+        if not force and time.monotonic() - self._checked_at < INDEX_REFRESH_INTERVAL:
+            return
+        with self._lock:
+            try:
+                names = os.listdir(self.archive_dir)
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                if not name.endswith('.idx'):
+                    continue
+                month = name[:-4]
+                path = os.path.join(self.archive_dir, name)
+                current = self._indexes.get(month)
+                stat = os.stat(path)
+                if current and (current.stat.st_mtime_ns, current.stat.st_size) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                self._indexes[month] = PackIndex(path)
+                if current:
+                    current.close()
+            self._checked_at = time.monotonic()
+
+    def lookup(self, sha256, month=None, refresh=False):
+        """
+        (month, offset, length) блоба в архиве или None
+
+        month - pack из photo_blobs.archive_pack: ищем только в его индексе
+        (индекс перечитывается, если блоб дописан после последней проверки).
+        Без month - перебор индексов всех месяцев.
+        """
+        self._refresh(force=refresh)
+        digest = bytes.fromhex(sha256)
+        if month is not None:
+            index = self._indexes.get(month)
+            found = index.find(digest) if index else None
+            if not found and not refresh:
+                return self.lookup(sha256, month, refresh=True)
+            return (month,) + found if found else None
+        for month, index in list(self._indexes.items()):
+            found = index.find(digest)
+            if found:
+                return (month,) + found
+        return None
+
+    def read(self, sha256, month=None, refresh=False):
+        """
+        Содержимое блоба из архива или None
+
+        refresh=True - перечитать индексы сразу: отдельный файл блоба уже
+        удалён, а индекс этого процесса мог ещё не обновиться.
+        """
+        found = self.lookup(sha256, month, refresh)
+        if not found:
+            return None
+        month, offset, length = found
+        with open(self.pack_path(month), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def append(self, month, blobs):
+        """
+        Дописать блобы в pack месяца и перестроить его индекс
+
+        Args:
+            month: 'YYYY-MM'
+            blobs: Список (sha256, путь к отдельному файлу)
+
+        Returns:
+            dict sha256 -> смещение в pack-файле
+
+        Порядок записи: данные + fsync, затем индекс (атомарная замена).
+        Сбой между ними оставляет в pack лишние байты, но не битый индекс.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._refresh(force=True)
+
+        existing = self._indexes.get(month)
+        records = {rec[0]: rec for rec in existing.records()} if existing else {}
+        offsets = {}
+
+        with open(self.pack_path(month), 'ab') as pack:
+            for sha256, file_path in blobs:
+                digest = bytes.fromhex(sha256)
+                if digest in records:
+                    offsets[sha256] = records[digest][1]
+                    continue
+                with open(file_path, 'rb') as f:
+                    data = f.read()
+                offset = pack.tell()
+                pack.write(data)
+                records[digest] = (digest, offset, len(data))
+                offsets[sha256] = offset
+            pack.flush()
+            os.fsync(pack.fileno())
+
+        keys = sorted(records)
+        tmp_path = f'{self.index_path(month)}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for key in keys:
+                f.write(INDEX_RECORD.pack(*records[key]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path(month))
+
+        self._refresh(force=True)
+        return offsets
@@ -0,0 +1,154 @@
+"""
+Обработка фотографий заказов: нормализация и варианты размеров
+
+Из исходного файла с камеры (JPEG, PNG, WebP, HEIC) строятся варианты
+thumb / medium / original в WebP. Ориентация из EXIF применяется к пикселям,
+сами метаданные (EXIF, GPS, ICC) в варианты не попадают.
+
+Варианты сохраняются в контентно-адресуемом хранилище: имя файла - SHA-256
+содержимого, поэтому одинаковые файлы хранятся один раз.
+"""
+import hashlib
+import os
+import uuid
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+try:
+    # HEIC с iPhone - через pillow-heif, без него такие файлы отклоняются
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORTED = True
+except ImportError:
+    HEIC_SUPPORTED = False
+
+# Вариант -> (максимальная сторона в px, качество WebP)
+PHOTO_VARIANTS = {
+    'thumb': (320, 70),     # Сетка в карточке заказа
+    'medium': (1280, 80),   # Просмотр на телефоне
+    'original': (4096, 88)  # Полный размер (для споров по грузу)
+}
+DEFAULT_VARIANT = 'original'
+
+VARIANT_FORMAT = 'WEBP'
+VARIANT_MIME_TYPE = 'image/webp'
+VARIANT_EXTENSION = 'webp'
+
+# Защита от "decompression bomb" - заведомо больше любой камеры телефона
+Image.MAX_IMAGE_PIXELS = 64_000_000
+
+
+class PhotoProcessingError(Exception):
+    """Файл не удалось прочитать как изображение"""
+    pass
+
+
+def load_image(source):
+    """
+    Открыть изображение и привести к RGB/RGBA с учётом ориентации
+
+    Args:
+        source: Путь или файловый объект
+    """
+    try:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном масштабе, если он больше самого крупного варианта
+        max_side = max(size for size, _ in PHOTO_VARIANTS.values())
+        image.draft('RGB', (max_side, max_side))
+        image.load()
+    except Exception as e:
+        raise PhotoProcessingError(f'Cannot decode image: {e}')
+
+    image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    target_mode = 'RGBA' if has_alpha else 'RGB'
+    if image.mode != target_mode:
+        image = image.convert(target_mode)
+
+    return image
+
+
+def render_variant(image, variant):
+    """Закодировать один вариант; возвращает (bytes, width, height)"""
+    max_side, quality = PHOTO_VARIANTS[variant]
+
+    resized = image.copy()
+    resized.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = BytesIO()
+    # exif/icc_profile не передаём - метаданные в вариант не попадают
+    resized.save(buffer, VARIANT_FORMAT, quality=quality, method=4)
+    return buffer.getvalue(), resized.width, resized.height
+
+
+def write_file_atomic(path, data):
+    """Запись через временный файл, чтобы не отдать наполовину записанное фото"""
+    tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def blob_path(blobs_dir, sha256, extension=VARIANT_EXTENSION):
+    """Путь блоба: два уровня каталогов по первым байтам хеша (ab/cd/<sha256>.ext)"""
+    return os.path.join(blobs_dir, sha256[:2], sha256[2:4], f'{sha256}.{extension}')
+
+
+def store_blob(blobs_dir, data):
+    """
+    Сохранить содержимое под его SHA-256; возвращает (sha256, путь)
+
+    Уже существующий файл не перезаписывается - только обновляется mtime,
+    чтобы сборщик мусора не удалил его, пока на него создаётся ссылка.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(blobs_dir, sha256)
+
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomic(path, data)
+
+    return sha256, path
+
+
+def store_photo_variants(source, blobs_dir):
+    """
+    Построить все варианты фотографии и сохранить их в хранилище блобов
+
+    Args:
+        source: Путь или файловый объект с исходным изображением
+        blobs_dir: Корень контентно-адресуемого хранилища
+
+    Returns:
+        Список dict: variant, sha256, file_path, mime_type, width, height, size_bytes
+    """
+    image = load_image(source)
+
+    variants = []
+    for variant in PHOTO_VARIANTS:
+        data, width, height = render_variant(image, variant)
+        sha256, file_path = store_blob(blobs_dir, data)
+        variants.append({
+            'variant': variant,
+            'sha256': sha256,
+            'file_path': file_path,
+            'mime_type': VARIANT_MIME_TYPE,
+            'width': width,
+            'height': height,
+            'size_bytes': len(data)
+        })
+
+    return variants
+
+
+def file_sha256(path):
+    """SHA-256 файла (читается блоками)"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,437 @@
+"""
+Фоновая обработка загруженных фотографий заказов
+Запускается как отдельный процесс (сервис photo-worker в docker-compose)
+
+Запрос загрузки (photos_api.upload_photos) только сохраняет файлы в
+PHOTOS_INCOMING_DIR и ставит задачу в photo_ingest_jobs. Здесь задачи
+берутся по очереди, файлы задачи декодируются параллельно в пуле процессов
+(варианты размеров в хранилище блобов), после чего одной транзакцией
+создаются записи order_photos, подтверждается этап и отправляется уведомление.
+
+Фото, уже загруженное раньше (та же SHA-256 исходника), повторно не
+декодируется - новые записи ссылаются на существующие блобы. Блобы без
+ссылок периодически удаляет сборщик мусора.
+
+Раз в сутки medium/original давно закрытых заказов переносятся в помесячные
+pack-файлы архива (photo_archive.py), отдельные файлы блобов удаляются.
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from config import DATABASE_PATH
+from photo_processing import DEFAULT_VARIANT, PHOTO_VARIANTS, store_photo_variants, file_sha256
+from photos_api import PHOTOS_BLOBS_DIR, photo_archive
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1  # Проверка очереди (сек)
+POOL_SIZE = int(os.environ.get('PHOTO_WORKERS', os.cpu_count() or 2))
+
+GC_INTERVAL = 6 * 60 * 60  # Сборка мусора в хранилище блобов (сек)
+GC_GRACE_HOURS = 24  # Блоб без ссылок удаляется не раньше, чем через сутки
+GC_BATCH_SIZE = 500
+
+ARCHIVE_INTERVAL = 24 * 60 * 60  # Перенос фото закрытых заказов в архив (сек)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('PHOTO_ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = 1000
+CLOSED_ORDER_STATUSES = ('closed', 'completed', 'cancelled')
+
+
+def get_connection():
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def ingest_file(source_path):
+    """Декодирование и варианты одного файла (выполняется в пуле процессов)"""
+    return store_photo_variants(source_path, PHOTOS_BLOBS_DIR)
+
+
+def find_existing_variants(conn, checksum):
+    """Варианты ранее загруженного фото с той же SHA-256 исходника (или None)"""
+    rows = conn.execute(
+        '''SELECT v.variant, v.blob_sha256 as sha256, b.file_path, b.mime_type,
+                  v.width, v.height, b.size_bytes, b.archive_pack
+           FROM order_photos p
+           JOIN order_photo_variants v ON v.photo_id = p.id
+           JOIN photo_blobs b ON b.sha256 = v.blob_sha256
+           WHERE p.id = (SELECT id FROM order_photos WHERE checksum = ? ORDER BY id DESC LIMIT 1)''',
+        (checksum,)
+    ).fetchall()
+
+    variants = [dict(row) for row in rows]
+    if {v['variant'] for v in variants} != set(PHOTO_VARIANTS):
+        return None
+
+    for variant in variants:
+        if variant.pop('archive_pack'):
+            continue  # Блоб в архиве - отдельного файла нет
+        if not os.path.exists(variant['file_path']):
+            return None
+        # Защищаем от сборщика мусора на время создания ссылки
+        os.utime(variant['file_path'])
+    return variants
+
+
+def claim_next_job(conn):
+    """Взять следующую задачу из очереди (status queued -> processing)"""
+    job = conn.execute(
+        "SELECT * FROM photo_ingest_jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+    ).fetchone()
+    if not job:
+        return None
+
+    claimed = conn.execute(
+        '''UPDATE photo_ingest_jobs SET status = 'processing', started_at = CURRENT_TIMESTAMP
+           WHERE id = ? AND status = 'queued' ''',
+        (job['id'],)
+    ).rowcount
+    conn.commit()
+    return job if claimed else None
+
+
+def fail_job(conn, job_id, error):
+    conn.execute(
+        '''UPDATE photo_ingest_jobs
+           SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+           WHERE id = ?''',
+        (error, job_id)
+    )
+    conn.commit()
+
+
+def process_job(conn, pool, job):
+    """Обработать все файлы задачи и сохранить результат"""
+    job_id = job['id']
+    order_id = job['order_id']
+    photo_type = job['photo_type']
+    files = sorted(os.listdir(job['incoming_dir']))
+
+    results = [None] * len(files)
+    futures = {}
+    for index, name in enumerate(files):
+        source_path = os.path.join(job['incoming_dir'], name)
+        checksum = file_sha256(source_path)
+        existing = find_existing_variants(conn, checksum)
+        if existing:
+            results[index] = {'checksum': checksum, 'variants': existing}
+        else:
+            futures[pool.submit(ingest_file, source_path)] = (index, checksum)
+
+    reused = len(files) - len(futures)
+    if reused:
+        conn.execute(
+            'UPDATE photo_ingest_jobs SET processed_files = processed_files + ? WHERE id = ?',
+            (reused, job_id)
+        )
+        conn.commit()
+
+    errors = []
+    for future in as_completed(futures):
+        index, checksum = futures[future]
+        try:
+            results[index] = {'checksum': checksum, 'variants': future.result()}
+        except Exception as e:
+            errors.append(f'{files[index]}: {e}')
+        # Прогресс для /api/orders/<id>/photos/status
+        conn.execute(
+            'UPDATE photo_ingest_jobs SET processed_files = processed_files + 1 WHERE id = ?',
+            (job_id,)
+        )
+        conn.commit()
+
+    # Уже записанные блобы не удаляем: они могут быть общими,
+    # а неиспользуемые уберёт сборщик мусора
+    if errors or not files:
+        fail_job(conn, job_id, 'Invalid image file' if files else 'No photos provided')
+        logger.warning(f"⚠️ Задача {job_id} (заказ {order_id}) не обработана: {'; '.join(errors)}")
+        return
+
+    try:
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        photo_ids = []
+        for result in results:
+            variants = result['variants']
+            file_path = next(v['file_path'] for v in variants if v['variant'] == DEFAULT_VARIANT)
+
+            cursor = conn.execute(
+                '''INSERT INTO order_photos
+                   (order_id, photo_type, file_path, uploaded_by, uploaded_at, checksum)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (order_id, photo_type, file_path, job['uploaded_by'], now, result['checksum'])
+            )
+            photo_id = cursor.lastrowid
+            conn.executemany(
+                '''INSERT OR IGNORE INTO photo_blobs (sha256, file_path, mime_type, size_bytes)
+                   VALUES (?, ?, ?, ?)''',
+                [(v['sha256'], v['file_path'], v['mime_type'], v['size_bytes']) for v in variants]
+            )
+            # ref_count блобов увеличивает триггер trg_photo_variants_blob_insert
+            conn.executemany(
+                '''INSERT INTO order_photo_variants
+                   (photo_id, variant, file_path, mime_type, width, height, size_bytes, blob_sha256)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(photo_id, v['variant'], v['file_path'], v['mime_type'],
+                  v['width'], v['height'], v['size_bytes'], v['sha256']) for v in variants]
+            )
+            photo_ids.append(photo_id)
+
+        # Этап подтверждается, только когда фото действительно сохранены
+        confirmed_column = 'loading_confirmed_at' if photo_type == 'loading' else 'unloading_confirmed_at'
+        conn.execute(
+            f'UPDATE orders SET {confirmed_column} = ? WHERE id = ?',
+            (now, order_id)
+        )
+        conn.execute(
+            '''UPDATE photo_ingest_jobs
+               SET status = 'done', photo_ids = ?, finished_at = CURRENT_TIMESTAMP
+               WHERE id = ?''',
+            (json.dumps(photo_ids), job_id)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.info(f"📷 Задача {job_id}: заказ {order_id}, {photo_type}, фото: {len(photo_ids)}, без повторной обработки: {reused}")
+
+    # Уведомление - уже после коммита, блокировка записи не держится на время HTTP
+    try:
+        from webhook_client import notify_photo_uploaded
+
+        order = conn.execute(
+            '''SELECT c.telegram_id as customer_telegram_id, d.telegram_id as driver_telegram_id
+               FROM orders o
+               JOIN users c ON o.customer_id = c.id
+               LEFT JOIN users d ON o.winner_driver_id = d.id
+               WHERE o.id = ?''',
+            (order_id,)
+        ).fetchone()
+
+        notify_photo_uploaded(
+            order_id=order_id,
+            photo_type=photo_type,
+            uploader_role='driver',
+            customer_telegram_id=order['customer_telegram_id'],
+            driver_telegram_id=order['driver_telegram_id']
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки уведомления о фото заказа {order_id}: {e}")
+
+
+def run_pending_jobs(conn, pool):
+    """Обработать все задачи из очереди; возвращает их количество"""
+    count = 0
+    while True:
+        job = claim_next_job(conn)
+        if not job:
+            return count
+
+        try:
+            process_job(conn, pool, job)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки задачи {job['id']}: {e}", exc_info=True)
+            fail_job(conn, job['id'], str(e))
+        finally:
+            shutil.rmtree(job['incoming_dir'], ignore_errors=True)
+        count += 1
+
+
+def collect_garbage(conn, grace_hours=GC_GRACE_HOURS):
+    """
+    Удалить блобы без ссылок и файлы-сироты в хранилище
+
+    Блоб удаляется, только если ref_count = 0 дольше grace_hours и файл
+    не трогали столько же (mtime обновляется при повторном использовании).
+    Возвращает количество удалённых файлов.
+    """
+    cutoff = time.time() - grace_hours * 3600
+    removed = 0
+
+    while True:
+        blobs = conn.execute(
+            '''SELECT sha256, file_path FROM photo_blobs
+               WHERE ref_count = 0 AND released_at < datetime('now', ?)
+               LIMIT ?''',
+            (f'-{grace_hours} hours', GC_BATCH_SIZE)
+        ).fetchall()
+        if not blobs:
+            break
+
+        for blob in blobs:
+            try:
+                if os.path.getmtime(blob['file_path']) > cutoff:
+                    continue
+            except OSError:
+                pass  # Файла уже нет - удаляем только запись
+
+            deleted = conn.execute(
+                'DELETE FROM photo_blobs WHERE sha256 = ? AND ref_count = 0',
+                (blob['sha256'],)
+            ).rowcount
+            conn.commit()
+            if deleted:
+                try:
+                    os.remove(blob['file_path'])
+                    removed += 1
+                except OSError:
+                    pass
+
+        if len(blobs) < GC_BATCH_SIZE:
+            break
+
+    # Файлы без записи в photo_blobs: упавшие задачи, незавершённые .tmp.
+    # Известные SHA-256 - одним запросом на каталог шарда (пачками по GC_BATCH_SIZE)
+    for root, _, names in os.walk(PHOTOS_BLOBS_DIR):
+        candidates = {}  # путь -> sha256 (None для .tmp)
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            candidates[path] = None if name.endswith('.tmp') else name.split('.', 1)[0]
+
+        hashes = sorted({sha256 for sha256 in candidates.values() if sha256})
+        known = set()
+        for start in range(0, len(hashes), GC_BATCH_SIZE):
+            chunk = hashes[start:start + GC_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(row[0] for row in conn.execute(
+                f'SELECT sha256 FROM photo_blobs WHERE sha256 IN ({placeholders})',
+                chunk
+            ))
+
+        for path, sha256 in candidates.items():
+            if sha256 not in known:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+
+    return removed
+
+
+def archive_closed_orders(conn, days=ARCHIVE_AFTER_DAYS):
+    """
+    Перенести блобы давно закрытых заказов в помесячные pack-файлы
+
+    Переносятся medium/original, на которые ссылаются только заказы в
+    CLOSED_ORDER_STATUSES, закрытые больше days дней назад. Месяц pack-файла -
+    месяц закрытия (последнего из заказов, если блоб общий). Thumb остаются
+    отдельными файлами - их запрашивают чаще всего.
+
+    Порядок: запись в pack и индекс, затем ссылка в photo_blobs (commit),
+    и только после этого удаление отдельного файла.
+    Возвращает количество перенесённых блобов.
+    """
+    statuses = ', '.join('?' * len(CLOSED_ORDER_STATUSES))
+    closed_at = 'COALESCE(o.driver_completed_at, o.unloading_confirmed_at, o.cancelled_at, o.created_at)'
+    archived = 0
+
+    while True:
+        rows = conn.execute(
+            f'''SELECT b.sha256, b.file_path, MAX(strftime('%Y-%m', {closed_at})) as month
+                FROM photo_blobs b
+                JOIN order_photo_variants v ON v.blob_sha256 = b.sha256
+                JOIN order_photos p ON p.id = v.photo_id
+                JOIN orders o ON o.id = p.order_id
+                WHERE b.archive_pack IS NULL AND b.ref_count > 0
+                GROUP BY b.sha256
+                HAVING SUM(v.variant = 'thumb') = 0
+                   AND SUM(o.status NOT IN ({statuses})) = 0
+                   AND MAX({closed_at}) < datetime('now', ?)
+                LIMIT ?''',
+            (*CLOSED_ORDER_STATUSES, f'-{days} days', ARCHIVE_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        by_month = {}
+        for row in rows:
+            if os.path.exists(row['file_path']):
+                by_month.setdefault(row['month'], []).append((row['sha256'], row['file_path']))
+            else:
+                logger.warning(f"⚠️ Файл блоба {row['sha256']} не найден, в архив не перенесён")
+
+        for month, blobs in by_month.items():
+            offsets = photo_archive.append(month, blobs)
+            conn.executemany(
+                'UPDATE photo_blobs SET archive_pack = ?, archive_offset = ? WHERE sha256 = ?',
+                [(month, offsets[sha256], sha256) for sha256, _ in blobs]
+            )
+            conn.commit()
+
+            for _, file_path in blobs:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            archived += len(blobs)
+
+        # Без переносимых файлов та же выборка повторилась бы бесконечно
+        if len(rows) < ARCHIVE_BATCH_SIZE or not by_month:
+            break
+
+    return archived
+
+
+def requeue_interrupted_jobs(conn):
+    """Задачи, прерванные перезапуском воркера, возвращаем в очередь"""
+    requeued = conn.execute(
+        '''UPDATE photo_ingest_jobs SET status = 'queued', processed_files = 0
+           WHERE status = 'processing' '''
+    ).rowcount
+    conn.commit()
+    if requeued:
+        logger.info(f"🔁 Возвращено в очередь задач: {requeued}")
+
+
+if __name__ == '__main__':
+    """
+    Запуск обработки очереди в цикле
+    """
+    logger.info(f"🚀 Запуск обработки фото (процессов: {POOL_SIZE})...")
+
+    conn = get_connection()
+    requeue_interrupted_jobs(conn)
+
+    last_gc = 0
+    last_archive = 0
+    with ProcessPoolExecutor(max_workers=POOL_SIZE) as pool:
+        while True:
+            try:
+                run_pending_jobs(conn, pool)
+
+                if time.monotonic() - last_gc > GC_INTERVAL:
+                    removed = collect_garbage(conn)
+                    if removed:
+                        logger.info(f"🧹 Удалено неиспользуемых файлов фото: {removed}")
+                    last_gc = time.monotonic()
+
+                if time.monotonic() - last_archive > ARCHIVE_INTERVAL:
+                    archived = archive_closed_orders(conn)
+                    if archived:
+                        logger.info(f"📦 Перенесено в архив фото: {archived}")
+                    last_archive = time.monotonic()
+
+                time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки очереди фото: {e}", exc_info=True)
+                time.sleep(10)  # При ошибке ждем дольше
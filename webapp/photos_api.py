@@ -2,17 +2,43 @@
 API для работы с фотографиями заказов
 Фотофиксация этапов загрузки и выгрузки груза
 """
-from flask import jsonify, request, send_file
+from flask import Response, jsonify, request, send_file
+import hashlib
+import hmac
+import json
+import mimetypes
 import os
+import shutil
 import sqlite3
-from datetime import datetime
+import time
 from werkzeug.utils import secure_filename
 import uuid
+from io import BytesIO
+
+from auth import current_user, request_telegram_id
+from photo_archive import PhotoArchive
+from photo_processing import PHOTO_VARIANTS, DEFAULT_VARIANT, HEIC_SUPPORTED
+from truck_config import SECRET_KEY
 
 # Разрешенные расширения файлов
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'heic', 'webp'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 PHOTOS_DIR = '/app/data/photos'
+PHOTOS_INCOMING_DIR = os.path.join(PHOTOS_DIR, 'incoming')  # Файлы, ожидающие photo_worker.py
+PHOTOS_BLOBS_DIR = os.path.join(PHOTOS_DIR, 'blobs')  # Варианты по SHA-256 (ab/cd/<sha256>.webp)
+PHOTOS_ARCHIVE_DIR = os.path.join(PHOTOS_DIR, 'archive')  # Pack-файлы закрытых заказов (YYYY-MM.pack/.idx)
+
+# Отдача файлов через nginx: internal-location, указывающий на PHOTOS_DIR
+# (например /protected-photos/). Пусто - файлы отдаёт Flask.
+PHOTOS_ACCEL_REDIRECT_PREFIX = os.environ.get('PHOTOS_ACCEL_REDIRECT_PREFIX', '')
+PHOTO_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # Для блобов по SHA-256 (содержимое не меняется)
+PHOTO_URL_TTL = 60 * 60  # Подписанные ссылки на фото (сек)
+
+photo_archive = PhotoArchive(PHOTOS_ARCHIVE_DIR)
+
+# В python:3.9-slim нет /etc/mime.types - регистрируем форматы фото явно
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/heic', '.heic')
 
 def allowed_file(filename):
     """Проверка допустимости файла"""
@@ -23,6 +49,77 @@ def allowed_file(filename):
     ext = filename.rsplit('.', 1)[1].lower()
     return ext in ALLOWED_EXTENSIONS
 
+def photo_file_response(file_path, mimetype, blob_sha256=None, archive_pack=None):
+    """
+    Ответ с файлом фото (доступ уже проверен)
+
+    Блоб из контентно-адресуемого хранилища не меняется никогда: SHA-256 -
+    строгий ETag, кэш - immutable. Если задан PHOTOS_ACCEL_REDIRECT_PREFIX,
+    файл отдаёт nginx (X-Accel-Redirect), иначе - send_file с поддержкой Range.
+    Архивированный блоб (archive_pack из photo_blobs) читается из pack-файла
+    этого месяца (seek + read по индексу в памяти).
+    """
+    if blob_sha256:
+        etag = blob_sha256
+        cache_control = f'private, max-age={PHOTO_CACHE_MAX_AGE}, immutable'
+    else:
+        etag = True  # werkzeug: по mtime и размеру файла
+        cache_control = 'private, max-age=3600'
+    
+    if blob_sha256 and blob_sha256 in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(blob_sha256)
+        response.headers['Cache-Control'] = cache_control
+        return response
+    
+    # Блоб перенесён в помесячный pack закрытых заказов (photo_archive.py)
+    archived = None
+    if archive_pack:
+        archived = photo_archive.read(blob_sha256, archive_pack)
+    elif blob_sha256 and not os.path.exists(file_path):
+        # Перенесён после чтения строки или ссылка без строки photo_blobs -
+        # ищем по индексам всех месяцев
+        archived = photo_archive.read(blob_sha256, refresh=True)
+    
+    photos_root = PHOTOS_DIR + os.sep
+    if archived is not None:
+        response = send_file(BytesIO(archived), mimetype=mimetype, conditional=True, etag=etag)
+    elif PHOTOS_ACCEL_REDIRECT_PREFIX and file_path.startswith(photos_root):
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = PHOTOS_ACCEL_REDIRECT_PREFIX + file_path[len(photos_root):]
+        if blob_sha256:
+            response.set_etag(blob_sha256)
+    else:
+        try:
+            response = send_file(file_path, mimetype=mimetype, conditional=True, etag=etag)
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found'}), 404
+    
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def photo_url_expires():
+    """
+    Срок действия подписанных ссылок
+
+    Округляется вверх до часа, поэтому в пределах часа ссылки не меняются
+    и браузер берёт фото из кэша. Ссылка живёт от PHOTO_URL_TTL до 2 * PHOTO_URL_TTL.
+    """
+    return (int(time.time()) // PHOTO_URL_TTL + 2) * PHOTO_URL_TTL
+
+def sign_photo_path(rel_path, expires):
+    """HMAC-SHA256 пути файла (относительно PHOTOS_DIR) и срока действия"""
+    message = f'{rel_path}:{expires}'.encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def signed_photo_url(file_path, expires):
+    """Подписанная ссылка на файл фото; None - файл вне PHOTOS_DIR"""
+    photos_root = PHOTOS_DIR + os.sep
+    if not file_path.startswith(photos_root):
+        return None
+    rel_path = file_path[len(photos_root):]
+    return f'/api/photos/signed/{rel_path}?expires={expires}&sig={sign_photo_path(rel_path, expires)}'
+
 def setup_photo_routes(app, get_db_connection):
     """Регистрация маршрутов для фотографий"""
     
@@ -42,31 +139,21 @@ def setup_photo_routes(app, get_db_connection):
     def upload_photos(order_id, photo_type):
         """Общая функция загрузки фото"""
         print(f"[PHOTO UPLOAD] Order: {order_id}, Type: {photo_type}")
-        print(f"[PHOTO UPLOAD] Headers: {dict(request.headers)}")
         print(f"[PHOTO UPLOAD] Files: {request.files}")
         print(f"[PHOTO UPLOAD] Form: {request.form}")
         
         # Пытаемся получить telegram_id из заголовков или FormData
-        telegram_id = request.headers.get('telegram_id') or request.form.get('telegram_id')
+        telegram_id = request_telegram_id()
         if not telegram_id:
             print("[PHOTO UPLOAD] ERROR: No telegram_id in headers or form")
             return jsonify({'error': 'telegram_id header required'}), 400
         
-        try:
-            telegram_id = int(telegram_id)
-            print(f"[PHOTO UPLOAD] Telegram ID: {telegram_id}")
-        except (ValueError, TypeError) as e:
-            print(f"[PHOTO UPLOAD] ERROR: Invalid telegram_id: {telegram_id}, error: {e}")
-            return jsonify({'error': 'Invalid telegram_id format'}), 400
-        
         conn = get_db_connection()
+        incoming_dir = None  # Удаляется, если задача не будет поставлена
         
         try:
             # Получаем пользователя
-            user = conn.execute(
-                'SELECT id, role FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -110,11 +197,12 @@ def setup_photo_routes(app, get_db_connection):
             if len(files) > 5:
                 return jsonify({'error': 'Maximum 5 photos allowed'}), 400
             
-            # Создаем директорию для заказа
-            order_dir = os.path.join(PHOTOS_DIR, str(order_id), photo_type)
-            os.makedirs(order_dir, exist_ok=True)
+            # Сохраняем файлы во временный каталог задачи - обработку
+            # (варианты, контрольная сумма, записи в БД, уведомление) выполнит photo_worker.py
+            incoming_dir = os.path.join(PHOTOS_INCOMING_DIR, uuid.uuid4().hex)
+            os.makedirs(incoming_dir, exist_ok=True)
             
-            photo_ids = []
+            saved_count = 0
             
             for file in files:
                 if not file:
@@ -138,97 +226,126 @@ def setup_photo_routes(app, get_db_connection):
                     ext = ext_map.get(content_type, 'jpg')
                 
                 if ext not in ALLOWED_EXTENSIONS:
+                    shutil.rmtree(incoming_dir, ignore_errors=True)
                     return jsonify({'error': f'Invalid file type: {ext}'}), 400
                 
-                # Генерируем уникальное имя файла
-                filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{ext}"
-                filepath = os.path.join(order_dir, filename)
-                
-                # Сохраняем файл
-                file.save(filepath)
+                if ext == 'heic' and not HEIC_SUPPORTED:
+                    shutil.rmtree(incoming_dir, ignore_errors=True)
+                    return jsonify({'error': 'HEIC photos are not supported'}), 400
                 
-                # Сохраняем запись в БД
-                cursor = conn.execute(
-                    '''INSERT INTO order_photos 
-                       (order_id, photo_type, file_path, uploaded_by, uploaded_at)
-                       VALUES (?, ?, ?, ?, ?)''',
-                    (order_id, photo_type, filepath, user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                )
-                photo_ids.append(cursor.lastrowid)
-            
-            # Обновляем временную метку подтверждения в заказе
-            if photo_type == 'loading':
-                conn.execute(
-                    'UPDATE orders SET loading_confirmed_at = ? WHERE id = ?',
-                    (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), order_id)
-                )
-            elif photo_type == 'unloading':
-                conn.execute(
-                    'UPDATE orders SET unloading_confirmed_at = ? WHERE id = ?',
-                    (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), order_id)
-                )
+                # Номер в имени сохраняет порядок фото в задаче
+                file.save(os.path.join(incoming_dir, f'{saved_count:02d}.{ext}'))
+                saved_count += 1
+            
+            if saved_count == 0:
+                shutil.rmtree(incoming_dir, ignore_errors=True)
+                return jsonify({'error': 'At least one photo required'}), 400
             
+            cursor = conn.execute(
+                '''INSERT INTO photo_ingest_jobs
+                   (order_id, photo_type, uploaded_by, incoming_dir, total_files)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (order_id, photo_type, user_id, incoming_dir, saved_count)
+            )
+            job_id = cursor.lastrowid
             conn.commit()
             
-            # Отправляем push-уведомление заказчику о загрузке фото
-            try:
-                from webhook_client import notify_photo_uploaded
-                
-                # Получаем telegram_id водителя
-                driver = conn.execute(
-                    'SELECT telegram_id FROM users WHERE id = ?',
-                    (order['winner_driver_id'],)
-                ).fetchone()
-                
-                driver_telegram_id = driver['telegram_id'] if driver else None
-                
-                notify_photo_uploaded(
-                    order_id=order_id,
-                    photo_type=photo_type,
-                    uploader_role='driver',
-                    customer_telegram_id=order['customer_telegram_id'],
-                    driver_telegram_id=driver_telegram_id
-                )
-            except Exception as e:
-                print(f"[PHOTO UPLOAD] Failed to send notification: {e}")
+            print(f"[PHOTO UPLOAD] Queued job {job_id}: {saved_count} file(s)")
             
             return jsonify({
                 'success': True,
-                'photo_ids': photo_ids,
-                'count': len(photo_ids),
-                'type': photo_type
-            })
+                'job_id': job_id,
+                'status': 'queued',
+                'count': saved_count,
+                'type': photo_type,
+                'status_url': f'/api/orders/{order_id}/photos/status?job_id={job_id}'
+            }), 202
             
         except Exception as e:
             conn.rollback()
+            if incoming_dir:
+                shutil.rmtree(incoming_dir, ignore_errors=True)
             return jsonify({'error': str(e)}), 500
         finally:
             conn.close()
     
+    @app.route('/api/orders/<int:order_id>/photos/status', methods=['GET'])
+    def get_photo_ingest_status(order_id):
+        """Состояние обработки загруженных фото заказа (?job_id= - одна задача)"""
+        telegram_id = request_telegram_id()
+        
+        if not telegram_id:
+            return jsonify({'error': 'telegram_id required'}), 400
+        
+        job_id = request.args.get('job_id', type=int)
+        conn = get_db_connection()
+        
+        try:
+            user = current_user(conn)
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            
+            order = conn.execute(
+                'SELECT customer_id, winner_driver_id FROM orders WHERE id = ?',
+                (order_id,)
+            ).fetchone()
+            
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+            
+            if user['id'] != order['customer_id'] and user['id'] != order['winner_driver_id']:
+                return jsonify({'error': 'Access denied'}), 403
+            
+            query = '''SELECT id, photo_type, status, total_files, processed_files,
+                              photo_ids, error, created_at, finished_at
+                       FROM photo_ingest_jobs WHERE order_id = ?'''
+            params = [order_id]
+            if job_id:
+                query += ' AND id = ?'
+                params.append(job_id)
+            query += ' ORDER BY id DESC LIMIT 20'
+            
+            jobs = [{
+                'job_id': job['id'],
+                'type': job['photo_type'],
+                'status': job['status'],
+                'total': job['total_files'],
+                'processed': job['processed_files'],
+                'photo_ids': json.loads(job['photo_ids']) if job['photo_ids'] else [],
+                'error': job['error'],
+                'created_at': job['created_at'],
+                'finished_at': job['finished_at']
+            } for job in conn.execute(query, params).fetchall()]
+            
+            if job_id and not jobs:
+                return jsonify({'error': 'Job not found'}), 404
+            
+            return jsonify({
+                'jobs': jobs,
+                'pending': sum(1 for job in jobs if job['status'] in ('queued', 'processing'))
+            })
+            
+        finally:
+            conn.close()
+    
     @app.route('/api/orders/<int:order_id>/photos', methods=['GET'])
     def get_order_photos(order_id):
         """Получение списка фотографий заказа"""
         print(f"[GET PHOTOS] Order: {order_id}")
         # Try multiple header formats for compatibility (Flask may normalize differently)
-        telegram_id = (request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram_id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         print(f"[GET PHOTOS] telegram_id from header: {telegram_id}")
-        print(f"[GET PHOTOS] All headers: {dict(request.headers)}")
         
         if not telegram_id:
             print("[GET PHOTOS] ERROR: No telegram_id")
             return jsonify({'error': 'telegram_id header required'}), 400
         
-        telegram_id = int(telegram_id)
         conn = get_db_connection()
         
         try:
             # Проверяем что пользователь - участник заказа
-            user = conn.execute(
-                'SELECT id FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = current_user(conn)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -245,14 +362,16 @@ def setup_photo_routes(app, get_db_connection):
             if user['id'] != order['customer_id'] and user['id'] != order['winner_driver_id']:
                 return jsonify({'error': 'Access denied'}), 403
             
-            # Получаем фотографии
-            photos = conn.execute(
+            # Фотографии вместе с вариантами - одним запросом
+            rows = conn.execute(
                 '''SELECT p.id, p.photo_type, p.file_path, p.uploaded_at,
-                          u.name as uploaded_by_name
+                          u.name as uploaded_by_name,
+                          v.variant, v.file_path as variant_path, v.width, v.height
                    FROM order_photos p
                    JOIN users u ON p.uploaded_by = u.id
+                   LEFT JOIN order_photo_variants v ON v.photo_id = p.id
                    WHERE p.order_id = ?
-                   ORDER BY p.uploaded_at ASC''',
+                   ORDER BY p.uploaded_at ASC, p.id ASC''',
                 (order_id,)
             ).fetchall()
             
@@ -262,65 +381,117 @@ def setup_photo_routes(app, get_db_connection):
                 'unloading': []
             }
             
-            for photo in photos:
-                photo_data = {
-                    'id': photo['id'],
-                    'url': f'/api/photos/{photo["id"]}',
-                    'uploaded_at': photo['uploaded_at'],
-                    'uploaded_by': photo['uploaded_by_name']
-                }
-                result[photo['photo_type']].append(photo_data)
+            # Подписанные ссылки проверяются без обращения к БД (get_signed_photo)
+            expires = photo_url_expires()
+            photos = {}
+            
+            for row in rows:
+                photo_data = photos.get(row['id'])
+                if not photo_data:
+                    photo_data = {
+                        'id': row['id'],
+                        'url': signed_photo_url(row['file_path'], expires) or f'/api/photos/{row["id"]}',
+                        # Для сетки - thumb, для просмотра - medium
+                        'variants': {},
+                        'uploaded_at': row['uploaded_at'],
+                        'uploaded_by': row['uploaded_by_name']
+                    }
+                    photos[row['id']] = photo_data
+                    result[row['photo_type']].append(photo_data)
+                
+                if row['variant']:
+                    photo_data['variants'][row['variant']] = {
+                        'url': (signed_photo_url(row['variant_path'], expires) or
+                                f'/api/photos/{row["id"]}?variant={row["variant"]}'),
+                        'width': row['width'],
+                        'height': row['height']
+                    }
+            
+            # Фото, загруженные до появления вариантов: все варианты - исходный файл
+            for photo_data in photos.values():
+                for variant in PHOTO_VARIANTS:
+                    photo_data['variants'].setdefault(variant, {
+                        'url': photo_data['url'], 'width': None, 'height': None
+                    })
             
             return jsonify(result)
             
         finally:
             conn.close()
     
+    @app.route('/api/photos/signed/<path:rel_path>', methods=['GET'])
+    def get_signed_photo(rel_path):
+        """
+        Файл фото по подписанной ссылке из /api/orders/<id>/photos
+        
+        Доступ проверен при выдаче ссылки, здесь - только подпись и срок,
+        без обращения к БД.
+        """
+        expires = request.args.get('expires', type=int)
+        signature = request.args.get('sig', '')
+        
+        if not expires or expires < time.time():
+            return jsonify({'error': 'Link expired'}), 403
+        
+        if not hmac.compare_digest(signature, sign_photo_path(rel_path, expires)):
+            return jsonify({'error': 'Invalid signature'}), 403
+        
+        file_path = os.path.join(PHOTOS_DIR, rel_path)
+        mimetype = mimetypes.guess_type(file_path)[0] or 'image/jpeg'
+        
+        # Блобы хранилища: имя файла - SHA-256 содержимого
+        blob_sha256 = None
+        if rel_path.startswith('blobs/'):
+            blob_sha256 = os.path.basename(rel_path).split('.', 1)[0]
+        
+        return photo_file_response(file_path, mimetype, blob_sha256)
+    
     @app.route('/api/photos/<int:photo_id>', methods=['GET'])
     def get_photo(photo_id):
         """Получение файла фотографии"""
         # Try to get telegram_id from query params (for <img> tags) or headers
-        telegram_id = (request.args.get('telegram_id') or
-                      request.headers.get('Telegram-Id') or 
-                      request.headers.get('telegram_id') or 
-                      request.headers.get('telegram-id'))
+        telegram_id = request_telegram_id()
         if not telegram_id:
             return jsonify({'error': 'telegram_id required (query param or header)'}), 400
         
-        telegram_id = int(telegram_id)
+        variant = request.args.get('variant', DEFAULT_VARIANT)
+        if variant not in PHOTO_VARIANTS:
+            return jsonify({'error': f'Unknown variant: {variant}'}), 400
+        
         conn = get_db_connection()
         
         try:
-            # Получаем информацию о фото
+            # Фото, вариант и пользователь - одним запросом
             photo = conn.execute(
-                '''SELECT p.*, o.customer_id, o.winner_driver_id
+                '''SELECT p.file_path, o.customer_id, o.winner_driver_id,
+                          v.file_path as variant_path, v.mime_type as variant_mime_type,
+                          v.blob_sha256, b.archive_pack, u.id as user_id
                    FROM order_photos p
                    JOIN orders o ON p.order_id = o.id
+                   LEFT JOIN order_photo_variants v ON v.photo_id = p.id AND v.variant = ?
+                   LEFT JOIN photo_blobs b ON b.sha256 = v.blob_sha256
+                   LEFT JOIN users u ON u.telegram_id = ?
                    WHERE p.id = ?''',
-                (photo_id,)
-            ).fetchone()
-            
-            if not photo:
-                return jsonify({'error': 'Photo not found'}), 404
-            
-            # Проверяем пользователя
-            user = conn.execute(
-                'SELECT id FROM users WHERE telegram_id = ?',
-                (telegram_id,)
+                (variant, telegram_id, photo_id)
             ).fetchone()
-            
-            if not user:
-                return jsonify({'error': 'User not found'}), 404
-            
-            # Проверяем доступ
-            if user['id'] != photo['customer_id'] and user['id'] != photo['winner_driver_id']:
-                return jsonify({'error': 'Access denied'}), 403
-            
-            # Проверяем существование файла
-            if not os.path.exists(photo['file_path']):
-                return jsonify({'error': 'File not found'}), 404
-            
-            return send_file(photo['file_path'], mimetype='image/jpeg')
-            
         finally:
             conn.close()
+        
+        if not photo:
+            return jsonify({'error': 'Photo not found'}), 404
+        
+        if not photo['user_id']:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Проверяем доступ
+        if photo['user_id'] != photo['customer_id'] and photo['user_id'] != photo['winner_driver_id']:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        # Фото, загруженные до появления вариантов, отдаём как есть
+        if photo['variant_path']:
+            return photo_file_response(photo['variant_path'], photo['variant_mime_type'],
+                                       photo['blob_sha256'], photo['archive_pack'])
+        
+        file_path = photo['file_path']
+        return photo_file_response(file_path, mimetypes.guess_type(file_path)[0] or 'image/jpeg')
+
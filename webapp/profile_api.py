@@ -0,0 +1,176 @@
+"""
+Профиль пользователя одним запросом: данные, рейтинг, статистика,
+комплименты и страница отзывов
+
+Раньше Mini App открывала профиль пятью запросами, каждый со своим
+подключением и поиском пользователя по telegram_id. Здесь сводки берутся
+из предрасчитанных таблиц (driver_stats, user_badge_counts), а готовый
+ответ кэшируется в памяти воркера по (пользователь, users.profile_version,
+страница). Версию увеличивают триггеры при любом изменении профиля, поэтому
+проверка кэша - одна строка users.
+"""
+from flask import jsonify, request
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+from reviews_api import get_review_badges, get_review_statistics, get_top_badges
+
+PROFILE_CACHE_SIZE = 1000  # Профилей (страниц) в памяти воркера
+REVIEWS_PAGE_SIZE = 10
+MAX_REVIEWS_PAGE_SIZE = 50
+
+def encode_cursor(review):
+    """Курсор следующей страницы - позиция последнего отзыва (created_at, id)"""
+    token = f"{review['created_at']}|{review['id']}"
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора; ValueError, если курсор испорчен"""
+    created_at, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return created_at, int(review_id)
+
+class ProfileCache:
+    """LRU готовых ответов профиля; ключ содержит версию профиля"""
+    
+    def __init__(self, max_size=PROFILE_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+profile_cache = ProfileCache()
+
+def build_profile(conn, user, limit, cursor=None):
+    """
+    Собрать профиль пользователя
+    
+    Args:
+        user: Строка users (id, telegram_id, name, phone_number, role)
+        limit: Отзывов на странице
+        cursor: Результат decode_cursor или None (первая страница)
+    """
+    stats = conn.execute(
+        'SELECT review_count, rating_sum, completed_count FROM driver_stats WHERE driver_id = ?',
+        (user['id'],)
+    ).fetchone()
+    review_count = stats['review_count'] if stats else 0
+    
+    if user['role'] == 'customer':
+        total_orders = conn.execute(
+            'SELECT COUNT(*) as count FROM orders WHERE customer_id = ?',
+            (user['id'],)
+        ).fetchone()['count']
+    else:
+        total_orders = stats['completed_count'] if stats else 0
+    
+    # Публичные отзывы после курсора (на один больше - признак следующей страницы)
+    cursor_filter = ''
+    params = [user['id']]
+    if cursor:
+        cursor_filter = 'AND (r.created_at, r.id) < (?, ?)'
+        params += list(cursor)
+    reviews = conn.execute(
+        f'''SELECT r.*, u.name as reviewer_name, u.telegram_id as reviewer_telegram_id
+            FROM reviews r
+            JOIN users u ON r.reviewer_id = u.id
+            WHERE r.reviewee_id = ? AND r.is_public = 1 {cursor_filter}
+            ORDER BY r.created_at DESC, r.id DESC
+            LIMIT ?''',
+        params + [limit + 1]
+    ).fetchall()
+    
+    next_cursor = encode_cursor(reviews[limit - 1]) if len(reviews) > limit and limit else None
+    reviews = reviews[:limit]
+    review_badges = get_review_badges(conn, [review['id'] for review in reviews])
+    
+    reviews_list = []
+    for review in reviews:
+        review_dict = dict(review)
+        review_dict['badges'] = review_badges[review['id']] or None
+        reviews_list.append(review_dict)
+    
+    return {
+        'user': {
+            'telegram_id': user['telegram_id'],
+            'name': user['name'],
+            'phone_number': user['phone_number'],
+            'role': user['role']
+        },
+        'rating': {
+            'average': round(stats['rating_sum'] / review_count, 1) if review_count else 0,
+            'count': review_count
+        },
+        'stats': {
+            'total_orders': total_orders
+        },
+        'criteria_averages': get_review_statistics(conn, user['id'])['criteria_averages'],
+        'top_badges': get_top_badges(conn, user['id']),
+        'reviews': reviews_list,
+        'next_cursor': next_cursor
+    }
+
+def setup_profile_routes(app, get_db_connection):
+    """Регистрация маршрутов профиля"""
+    
+    @app.route('/api/profile/<int:telegram_id>', methods=['GET'])
+    def get_profile(telegram_id):
+        """
+        Профиль пользователя: данные, рейтинг, статистика, комплименты, отзывы
+        
+        Query: limit (по умолчанию 10), cursor - next_cursor предыдущей страницы
+        """
+        limit = request.args.get('limit', default=REVIEWS_PAGE_SIZE, type=int)
+        limit = min(max(limit, 0), MAX_REVIEWS_PAGE_SIZE)
+        raw_cursor = request.args.get('cursor') or None
+        
+        try:
+            cursor = decode_cursor(raw_cursor) if raw_cursor else None
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        conn = get_db_connection()
+        
+        try:
+            user = conn.execute(
+                '''SELECT id, telegram_id, name, phone_number, role, profile_version
+                   FROM users WHERE telegram_id = ?''',
+                (telegram_id,)
+            ).fetchone()
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            
+            key = (user['id'], user['profile_version'], limit, raw_cursor)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+            if etag in request.if_none_match:
+                response = app.response_class(status=304)
+            else:
+                profile = profile_cache.get(key)
+                if profile is None:
+                    profile = build_profile(conn, user, limit, cursor)
+                    profile_cache.put(key, profile)
+                response = jsonify(profile)
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        
+        finally:
+            conn.close()
+    
+    return app
@@ -6,6 +6,9 @@ from flask import jsonify, request
 import json
 from datetime import datetime
 
+from identity import resolve_user
+from auth import current_user, request_telegram_id
+
 # Доступные значки/комплименты
 AVAILABLE_BADGES = {
     'professional': 'Профессионализм',
@@ -15,6 +18,67 @@ AVAILABLE_BADGES = {
     'reliable': 'Надёжный'
 }
 
+TOP_BADGES = 3  # Комплиментов в статистике профиля
+REVIEWS_PAGE_SIZE = 20
+MAX_REVIEWS_PAGE_SIZE = 100
+
+def get_review_statistics(conn, user_id):
+    """Количество публичных отзывов, средняя оценка и средние по критериям"""
+    stats = conn.execute(
+        '''SELECT 
+            COUNT(*) as total_reviews,
+            AVG(rating) as avg_rating,
+            AVG(punctuality_rating) as avg_punctuality,
+            AVG(quality_rating) as avg_quality,
+            AVG(professionalism_rating) as avg_professionalism,
+            AVG(communication_rating) as avg_communication,
+            AVG(vehicle_condition_rating) as avg_vehicle_condition
+        FROM reviews
+        WHERE reviewee_id = ? AND is_public = 1''',
+        (user_id,)
+    ).fetchone()
+    return {
+        'total_reviews': stats['total_reviews'],
+        'average_rating': round(stats['avg_rating'], 1) if stats['avg_rating'] else 0,
+        'criteria_averages': {
+            'punctuality': round(stats['avg_punctuality'], 1) if stats['avg_punctuality'] else None,
+            'quality': round(stats['avg_quality'], 1) if stats['avg_quality'] else None,
+            'professionalism': round(stats['avg_professionalism'], 1) if stats['avg_professionalism'] else None,
+            'communication': round(stats['avg_communication'], 1) if stats['avg_communication'] else None,
+            'vehicle_condition': round(stats['avg_vehicle_condition'], 1) if stats['avg_vehicle_condition'] else None
+        }
+    }
+
+def get_top_badges(conn, user_id, limit=TOP_BADGES):
+    """Самые частые комплименты пользователя (из user_badge_counts)"""
+    rows = conn.execute(
+        '''SELECT badge, count FROM user_badge_counts
+        WHERE user_id = ? AND count > 0
+        ORDER BY count DESC, badge
+        LIMIT ?''',
+        (user_id, limit)
+    ).fetchall()
+    return [
+        {
+            'badge': row['badge'],
+            'label': AVAILABLE_BADGES.get(row['badge'], row['badge']),
+            'count': row['count']
+        }
+        for row in rows
+    ]
+
+def get_review_badges(conn, review_ids):
+    """Комплименты отзывов: dict review_id -> список значков"""
+    badges = {review_id: [] for review_id in review_ids}
+    if badges:
+        placeholders = ','.join('?' * len(badges))
+        for row in conn.execute(
+            f'SELECT review_id, badge FROM review_badges WHERE review_id IN ({placeholders})',
+            list(badges)
+        ).fetchall():
+            badges[row['review_id']].append(row['badge'])
+    return badges
+
 def setup_review_routes(app, get_db_connection):
     """Регистрация маршрутов для отзывов"""
     
@@ -32,15 +96,9 @@ def setup_review_routes(app, get_db_connection):
         
         try:
             # Получаем ID пользователей
-            reviewer = conn.execute(
-                'SELECT id FROM users WHERE telegram_id = ?',
-                (data['reviewer_telegram_id'],)
-            ).fetchone()
+            reviewer = current_user(conn, data['reviewer_telegram_id'])
             
-            reviewee = conn.execute(
-                'SELECT id FROM users WHERE telegram_id = ?',
-                (data['reviewee_telegram_id'],)
-            ).fetchone()
+            reviewee = resolve_user(conn, data['reviewee_telegram_id'])
             
             if not reviewer or not reviewee:
                 return jsonify({'error': 'User not found'}), 404
@@ -69,6 +127,7 @@ def setup_review_routes(app, get_db_connection):
                 invalid_badges = [b for b in badges if b not in AVAILABLE_BADGES]
                 if invalid_badges:
                     return jsonify({'error': f'Invalid badges: {invalid_badges}'}), 400
+                badges = list(dict.fromkeys(badges))
             
             badges_json = json.dumps(badges) if badges else None
             
@@ -97,9 +156,16 @@ def setup_review_routes(app, get_db_connection):
                 )
             )
             
-            conn.commit()
             review_id = cursor.lastrowid
             
+            # Комплименты - в review_badges (счётчики профиля обновит триггер)
+            conn.executemany(
+                'INSERT INTO review_badges (review_id, user_id, badge) VALUES (?, ?, ?)',
+                [(review_id, reviewee['id'], badge) for badge in badges or []]
+            )
+            
+            conn.commit()
+            
             return jsonify({
                 'success': True,
                 'review_id': review_id,
@@ -115,68 +181,50 @@ def setup_review_routes(app, get_db_connection):
     
     @app.route('/api/reviews/user/<int:telegram_id>', methods=['GET'])
     def get_detailed_user_reviews(telegram_id):
-        """Получить все отзывы о пользователе с детальными критериями"""
+        """
+        Получить отзывы о пользователе с детальными критериями
+        
+        Query: limit (по умолчанию 20), offset - страница публичных отзывов
+        """
+        limit = request.args.get('limit', default=REVIEWS_PAGE_SIZE, type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        limit = min(max(limit, 0), MAX_REVIEWS_PAGE_SIZE)
+        offset = max(offset, 0)
+        
         conn = get_db_connection()
         
         try:
             # Получаем ID пользователя
-            user = conn.execute(
-                'SELECT id, name, role FROM users WHERE telegram_id = ?',
-                (telegram_id,)
-            ).fetchone()
+            user = resolve_user(conn, telegram_id)
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
             
-            # Получаем все публичные отзывы
+            # Страница публичных отзывов
             reviews = conn.execute(
                 '''SELECT 
                     r.*,
                     reviewer.name as reviewer_name,
-                    reviewer.telegram_id as reviewer_telegram_id,
-                    o.id as order_id
+                    reviewer.telegram_id as reviewer_telegram_id
                 FROM reviews r
                 JOIN users reviewer ON r.reviewer_id = reviewer.id
-                JOIN orders o ON r.order_id = o.id
                 WHERE r.reviewee_id = ? AND r.is_public = 1
-                ORDER BY r.created_at DESC''',
-                (user['id'],)
+                ORDER BY r.created_at DESC, r.id DESC
+                LIMIT ? OFFSET ?''',
+                (user['id'], limit, offset)
             ).fetchall()
             
             # Подсчитываем статистику
-            stats = conn.execute(
-                '''SELECT 
-                    COUNT(*) as total_reviews,
-                    AVG(rating) as avg_rating,
-                    AVG(punctuality_rating) as avg_punctuality,
-                    AVG(quality_rating) as avg_quality,
-                    AVG(professionalism_rating) as avg_professionalism,
-                    AVG(communication_rating) as avg_communication,
-                    AVG(vehicle_condition_rating) as avg_vehicle_condition
-                FROM reviews
-                WHERE reviewee_id = ? AND is_public = 1''',
-                (user['id'],)
-            ).fetchone()
-            
-            # Подсчитываем комплименты
-            all_badges = []
-            for review in reviews:
-                if review['badges']:
-                    all_badges.extend(json.loads(review['badges']))
+            statistics = get_review_statistics(conn, user['id'])
             
-            badge_counts = {}
-            for badge in all_badges:
-                badge_counts[badge] = badge_counts.get(badge, 0) + 1
-            
-            # Топ-3 комплимента
-            top_badges = sorted(badge_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+            # Комплименты отзывов страницы
+            review_badges = get_review_badges(conn, [review['id'] for review in reviews])
             
             # Форматируем отзывы
             reviews_list = []
             for review in reviews:
                 review_dict = dict(review)
-                if review_dict['badges']:
-                    review_dict['badges'] = json.loads(review_dict['badges'])
+                review_dict['badges'] = review_badges[review['id']] or None
                 reviews_list.append(review_dict)
             
             return jsonify({
@@ -186,25 +234,16 @@ def setup_review_routes(app, get_db_connection):
                     'role': user['role']
                 },
                 'statistics': {
-                    'total_reviews': stats['total_reviews'],
-                    'average_rating': round(stats['avg_rating'], 1) if stats['avg_rating'] else 0,
-                    'criteria_averages': {
-                        'punctuality': round(stats['avg_punctuality'], 1) if stats['avg_punctuality'] else None,
-                        'quality': round(stats['avg_quality'], 1) if stats['avg_quality'] else None,
-                        'professionalism': round(stats['avg_professionalism'], 1) if stats['avg_professionalism'] else None,
-                        'communication': round(stats['avg_communication'], 1) if stats['avg_communication'] else None,
-                        'vehicle_condition': round(stats['avg_vehicle_condition'], 1) if stats['avg_vehicle_condition'] else None
-                    },
-                    'top_badges': [
-                        {
-                            'badge': badge,
-                            'label': AVAILABLE_BADGES.get(badge, badge),
-                            'count': count
-                        }
-                        for badge, count in top_badges
-                    ]
+                    **statistics,
+                    # Топ комплиментов - из предрасчитанных счётчиков
+                    'top_badges': get_top_badges(conn, user['id'])
                 },
-                'reviews': reviews_list
+                'reviews': reviews_list,
+                'pagination': {
+                    'limit': limit,
+                    'offset': offset,
+                    'total': statistics['total_reviews']
+                }
             })
             
         finally:
@@ -233,7 +272,7 @@ def setup_review_routes(app, get_db_connection):
             if not review:
                 return jsonify({'error': 'Review not found'}), 404
             
-            if review['reviewee_telegram_id'] != data['telegram_id']:
+            if review['reviewee_telegram_id'] != request_telegram_id():
                 return jsonify({'error': 'Unauthorized'}), 403
             
             # Обновляем отзыв с ответом
@@ -270,10 +309,7 @@ def setup_review_routes(app, get_db_connection):
         
         try:
             # Получаем ID пользователя
-            user = conn.execute(
-                'SELECT id FROM users WHERE telegram_id = ?',
-                (data['telegram_id'],)
-            ).fetchone()
+            user = current_user(conn, data['telegram_id'])
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -0,0 +1,31 @@
+"""
+Запросы к полнотекстовым индексам FTS5 из строки поиска
+
+Ввод пользователя не передаётся в MATCH как есть (кавычки, AND, * и т.п.
+ломают синтаксис FTS5): из него берутся слова, и каждое ищется как префикс.
+"""
+import re
+
+WORD_RE = re.compile(r'\w+')
+PHONE_RE = re.compile(r'^\+?[\d\s()-]+$')
+MAX_TERMS = 8  # Слов в одном запросе
+
+def fts_query(text):
+    """
+    MATCH-выражение FTS5: все слова как префиксы ("ив пет" -> "ив"* "пет"*)
+
+    Номер телефона ("+7 (999) 12") склеивается в одно слово из цифр -
+    так телефоны хранятся в индексах.
+
+    Returns:
+        Строка для MATCH или None, если искать нечего
+    """
+    text = (text or '').strip()
+    if PHONE_RE.match(text) and any(ch.isdigit() for ch in text):
+        terms = [re.sub(r'\D', '', text)]
+    else:
+        terms = WORD_RE.findall(text)[:MAX_TERMS]
+
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
@@ -65,6 +65,13 @@ let truckTypesMap = {}; // Маппинг ID -> название типа маш
 let ordersCache = null; // Кэш заказов
 let ordersCacheTime = 0; // Время последнего обновления кэша
 const CACHE_DURATION = 30000; // 30 секунд
+let eventSource = null; // Поток событий с сервера (SSE)
+let eventSourceConnecting = false; // Ждём билет потока (api/auth/stream-ticket)
+let lastServerEventId = null; // Курсор для нового подключения
+const SSE_RECONNECT_DELAY = 3000;
+let sseConnected = false; // Пока поток открыт, периодический опрос не нужен
+let sseRefreshTimer = null;
+let openOrdersMode = localStorage.getItem('openOrdersMode') || 'recent'; // Вкладка "Открытые": recent - новые, near - ближайшие к базе
 
 // Функция для форматирования даты/времени из UTC в локальное время
 function formatLocalDateTime(utcDateString) {
@@ -263,7 +270,7 @@ async function fetchWithTimeout(url, options = {}, timeout = 10000, retries = 2)
                 console.log(`🔄 Повторная попытка ${attempt}/${retries} для ${url}`, 'warning');
             }
             
-            const response = await fetch(url, {
+            const response = await sessionFetch(url, {
                 ...options,
                 signal: controller.signal
             });
@@ -357,7 +364,8 @@ async function fetchCustomerOrders(telegramId) {
 
 async function fetchDriverOrders(telegramId) {
     console.log('🚗 Загрузка заказов водителя, ID: ' + telegramId);
-    const url = `${API_BASE}api/driver/orders?telegram_id=${telegramId}`;
+    const mode = openOrdersMode === 'near' ? '&open=near' : '';
+    const url = `${API_BASE}api/driver/orders?telegram_id=${telegramId}${mode}`;
     const startTime = Date.now();
     
     try {
@@ -432,26 +440,10 @@ async function fetchUserRating(telegramId) {
     }
 }
 
-async function fetchUserStats(telegramId) {
-    try {
-        const response = await fetchWithTimeout(`${API_BASE}api/user/${telegramId}/stats`, {}, 10000);
-        if (!response.ok) return { total_orders: 0 };
-        return await response.json();
-    } catch (error) {
-        console.error('Ошибка загрузки статистики:', error);
-        return { total_orders: 0 };
-    }
-}
-
-async function fetchUserReviews(telegramId) {
-    try {
-        const response = await fetchWithTimeout(`${API_BASE}api/user/${telegramId}/reviews`, {}, 10000);
-        if (!response.ok) return [];
-        return await response.json();
-    } catch (error) {
-        console.error('Ошибка загрузки отзывов:', error);
-        return [];
-    }
+async function fetchUserProfile(telegramId) {
+    const response = await fetchWithTimeout(`${API_BASE}api/profile/${telegramId}`, {}, 10000);
+    if (!response.ok) throw new Error(`Profile request failed: ${response.status}`);
+    return await response.json();
 }
 
 async function submitReview(orderId, revieweeTelegramId, rating, comment, badges) {
@@ -532,8 +524,14 @@ async function showMainScreen() {
     // Инициализируем модальные окна
     initModals();
     
-    // Автоматическое обновление данных каждые 30 секунд
+    // Подписываемся на события с сервера
+    connectEventStream();
+    
+    // Автоматическое обновление данных каждые 30 секунд (только если SSE недоступен)
     setInterval(() => {
+        if (sseConnected) {
+            return;
+        }
         if (currentTab && !document.hidden) {
             // Не обновляем вкладку "Завершённые" автоматически, так как это исторические данные
             if (currentTab === 'closed') {
@@ -548,6 +546,84 @@ async function showMainScreen() {
     }, CACHE_DURATION);
 }
 
+// === SERVER-SENT EVENTS ===
+
+// Подключение к потоку событий (заказы, ставки, чат)
+async function connectEventStream() {
+    if (!window.EventSource || eventSource || eventSourceConnecting) {
+        return;
+    }
+    
+    eventSourceConnecting = true;
+    let url = `${API_BASE}api/events/stream?telegram_id=${currentUser.telegram_id}`;
+    if (lastServerEventId) {
+        // Новый EventSource не пришлёт Last-Event-ID - продолжаем с курсора
+        url += `&last_event_id=${lastServerEventId}`;
+    }
+    let source;
+    try {
+        source = new EventSource(await streamUrl(url));
+    } finally {
+        eventSourceConnecting = false;
+    }
+    eventSource = source;
+    
+    source.onopen = () => {
+        sseConnected = true;
+        console.log('📡 Поток событий подключен');
+    };
+    
+    source.onerror = () => {
+        // Браузер переподключится сам, а пока работает опрос
+        sseConnected = false;
+        if (source.readyState === EventSource.CLOSED) {
+            // Отказ сервера (например, истёк билет) - новое подключение с новым билетом
+            eventSource = null;
+            setTimeout(connectEventStream, SSE_RECONNECT_DELAY);
+        }
+    };
+    
+    source.onmessage = (message) => {
+        if (message.lastEventId) {
+            lastServerEventId = message.lastEventId;
+        }
+        try {
+            handleServerEvent(JSON.parse(message.data));
+        } catch (error) {
+            console.error('Error handling server event:', error);
+        }
+    };
+}
+
+// Обработка события с сервера
+function handleServerEvent(event) {
+    // Отметки о прочтении нужны только long-poll открытого чата
+    if (event.type === 'chat_read') {
+        return;
+    }
+    
+    if (event.type === 'chat_message') {
+        // Открытый чат получает сообщения через свой long-poll
+        if (currentChatOrderId === event.order_id) {
+            return;
+        }
+    }
+    
+    // Пачку событий (например, ставки в конце подбора) сводим в одно обновление
+    if (sseRefreshTimer) {
+        clearTimeout(sseRefreshTimer);
+    }
+    sseRefreshTimer = setTimeout(() => {
+        sseRefreshTimer = null;
+        if (currentTab && currentTab !== 'reports' && !document.hidden) {
+            loadTabData(currentTab, true);
+        } else {
+            // Вкладка неактивна - обновим при следующем показе
+            ordersCacheTime = 0;
+        }
+    }, 1000);
+}
+
 // Функция для форматирования номера телефона
 function formatPhoneNumber(phone) {
     if (!phone) return '+7 (000) 000-00-00';
@@ -599,15 +675,10 @@ function closeProfile() {
 // Загрузка данных профиля
 async function loadProfileData(telegramId) {
     try {
-        // Получаем данные пользователя
-        const userResponse = await fetchWithTimeout(`${API_BASE}api/user/${telegramId}`, {}, 10000);
-        const userData = await userResponse.json();
-        
-        const [rating, stats, reviews] = await Promise.all([
-            fetchUserRating(telegramId),
-            fetchUserStats(telegramId),
-            fetchUserReviews(telegramId)
-        ]);
+        // Данные, рейтинг, статистика и отзывы - одним запросом
+        const profile = await fetchUserProfile(telegramId);
+        const userData = profile.user;
+        const { rating, stats, reviews } = profile;
         
         // Обновляем данные профиля
         const avatarLarge = document.getElementById('profile-avatar-large');
@@ -958,7 +1029,7 @@ async function loadOrderPhotos(orderId) {
 
         console.log(`[LOAD PHOTOS] Loading photos for order ${orderId}, user ${telegram_id}`);
 
-        const response = await fetch(`${API_BASE}api/orders/${orderId}/photos`, {
+        const response = await sessionFetch(`${API_BASE}api/orders/${orderId}/photos`, {
             headers: {
                 'telegram-id': telegram_id.toString()
             }
@@ -991,9 +1062,10 @@ async function loadOrderPhotos(orderId) {
                     <div class="photo-stage-title">Фото загрузки груза</div>
                     <div class="photo-grid">
                         ${photos.loading.map(photo => `
-                            <img src="${API_BASE}api/photos/${photo.id}?telegram_id=${telegram_id}" 
+                            <img src="${photoUrl(photo.variants.thumb.url)}" 
                                  class="photo-thumbnail" 
-                                 onclick="openPhotoModal('${API_BASE}api/photos/${photo.id}?telegram_id=${telegram_id}')"
+                                 loading="lazy"
+                                 onclick="openPhotoModal('${photoUrl(photo.variants.medium.url)}')"
                                  alt="Фото загрузки">
                         `).join('')}
                     </div>
@@ -1008,9 +1080,10 @@ async function loadOrderPhotos(orderId) {
                     <div class="photo-stage-title">Фото выгрузки груза</div>
                     <div class="photo-grid">
                         ${photos.unloading.map(photo => `
-                            <img src="${API_BASE}api/photos/${photo.id}?telegram_id=${telegram_id}" 
+                            <img src="${photoUrl(photo.variants.thumb.url)}" 
                                  class="photo-thumbnail" 
-                                 onclick="openPhotoModal('${API_BASE}api/photos/${photo.id}?telegram_id=${telegram_id}')"
+                                 loading="lazy"
+                                 onclick="openPhotoModal('${photoUrl(photo.variants.medium.url)}')"
                                  alt="Фото выгрузки">
                         `).join('')}
                     </div>
@@ -1276,17 +1349,29 @@ function renderDriverOrders(orders, container, tabId) {
         return;
     }
     
+    // Для вкладки "Открытые" - выбор порядка: новые или ближайшие к базе
+    const modeSwitch = tabId === 'open' ? `
+        <div class="period-filter">
+            <div class="period-select-wrapper">
+                <select class="period-select" onchange="setOpenOrdersMode(this.value)">
+                    <option value="recent" ${openOrdersMode === 'recent' ? 'selected' : ''}>Сначала новые</option>
+                    <option value="near" ${openOrdersMode === 'near' ? 'selected' : ''}>Сначала ближайшие</option>
+                </select>
+            </div>
+        </div>
+    ` : '';
+    
     if (!orders || orders.length === 0) {
-        container.innerHTML = `
+        container.innerHTML = modeSwitch + `
             <div class="empty-state">
                 <div class="empty-title">Нет заявок</div>
-                <div class="empty-description">${getEmptyMessage(tabId)}</div>
+                <div class="empty-description">${tabId === 'open' && openOrdersMode === 'near' ? 'Рядом с базой заявок нет. Базу можно указать командой /base в боте' : getEmptyMessage(tabId)}</div>
             </div>
         `;
         return;
     }
     
-    container.innerHTML = orders.map(order => `
+    container.innerHTML = modeSwitch + orders.map(order => `
         <div class="order-card">
             <div class="order-header">
                 <div class="order-number">Заявка #${order.id}</div>
@@ -1312,6 +1397,7 @@ function renderDriverOrders(orders, container, tabId) {
                 ${order.delivery_date ? `<span>Доставка: ${order.delivery_date}</span>` : ''}
                 ${order.max_price ? `<span>Цена: ${formatPrice(order.max_price)}</span>` : ''}
                 ${order.total_bids ? `<span>${order.total_bids} предложений</span>` : ''}
+                ${order.distance_km != null ? `<span>${order.distance_km} км от базы</span>` : ''}
             </div>
             
             <div class="order-footer">
@@ -1684,7 +1770,7 @@ function initModals() {
     // Загрузка комплиментов
     async function loadBadges() {
         try {
-            const response = await fetch(`${API_BASE}api/reviews/badges`);
+            const response = await sessionFetch(`${API_BASE}api/reviews/badges`);
             const data = await response.json();
             
             const badgesGrid = document.getElementById('badges-grid');
@@ -2039,6 +2125,12 @@ function getDetailedStatus(order) {
     return getStatusLabel(order.status);
 }
 
+function setOpenOrdersMode(mode) {
+    openOrdersMode = mode;
+    localStorage.setItem('openOrdersMode', mode);
+    loadTabData('open', true);
+}
+
 function getEmptyMessage(tabId) {
     const messages = {
         'open': 'Новые заявки появятся здесь',
@@ -2244,7 +2336,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.log('Request headers:', headers);
                 console.log('Request URL:', `${API_BASE}api/orders/${orderId}/photos/${photoType}`);
                 
-                const response = await fetch(`${API_BASE}api/orders/${orderId}/photos/${photoType}`, {
+                const response = await sessionFetch(`${API_BASE}api/orders/${orderId}/photos/${photoType}`, {
                     method: 'POST',
                     headers: headers,
                     body: formData
@@ -2278,6 +2370,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 const result = await response.json();
                 console.log('Upload success:', result);
                 
+                // Фото обрабатываются на сервере в фоне - ждём завершения задачи
+                if (result.job_id) {
+                    await waitForPhotoJob(orderId, result.job_id, (job) => {
+                        submitBtn.textContent = `Обработка ${job.processed}/${job.total}...`;
+                    });
+                }
+                
                 // Успешно загружено
                 alert('Фотографии успешно загружены!');
                 document.getElementById('photo-upload-modal').classList.add('hidden');
@@ -2328,10 +2427,45 @@ window.removePhoto = function(index) {
     document.getElementById('submit-photos').disabled = selectedPhotos.length === 0;
 };
 
+// Подписанная ссылка из /api/orders/<id>/photos -> URL относительно API_BASE
+function photoUrl(url) {
+    return `${API_BASE}${url.replace(/^\//, '')}`;
+}
+
+// Ожидание фоновой обработки загруженных фото (photo_worker.py)
+async function waitForPhotoJob(orderId, jobId, onProgress) {
+    const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
+    const deadline = Date.now() + 120000;
+    
+    while (Date.now() < deadline) {
+        const response = await sessionFetch(`${API_BASE}api/orders/${orderId}/photos/status?job_id=${jobId}&telegram_id=${telegram_id}`);
+        if (!response.ok) {
+            throw new Error('Не удалось получить статус обработки фото');
+        }
+        
+        const job = (await response.json()).jobs[0];
+        if (job.status === 'done') {
+            return job;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Не удалось обработать фото');
+        }
+        
+        onProgress(job);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+    
+    throw new Error('Обработка фото занимает больше времени, чем обычно. Проверьте позже');
+}
+
 // ==================== CHAT FUNCTIONS ====================
 
 let currentChatOrderId = null;
-let chatRefreshInterval = null;
+let chatPollController = null; // AbortController текущего long-poll запроса
+let chatLastMessageId = 0; // Курсор ?after_id= - запрашиваем только новые сообщения
+let chatReadUpTo = 0; // Собеседник прочитал мои сообщения с id <= chatReadUpTo
+let chatLoading = false;
+let chatReloadPending = false;
 
 // Открыть чат для заказа
 async function openChat(orderId, recipientName, recipientRole) {
@@ -2347,19 +2481,16 @@ async function openChat(orderId, recipientName, recipientRole) {
     // Показываем модальное окно
     modal.classList.remove('hidden');
     
-    // Загружаем сообщения
-    await loadChatMessages(orderId);
+    // Сбрасываем курсор и загружаем всю переписку
+    chatLastMessageId = 0;
+    chatReadUpTo = 0;
+    document.getElementById('chat-messages-container').innerHTML = '';
     
-    // Отмечаем сообщения как прочитанные
-    await markMessagesRead(orderId);
+    // Загружаем сообщения (и сразу отмечаем прочитанными)
+    await loadChatMessages(orderId);
     
-    // Настраиваем автообновление каждые 3 секунды
-    if (chatRefreshInterval) {
-        clearInterval(chatRefreshInterval);
-    }
-    chatRefreshInterval = setInterval(() => {
-        loadChatMessages(orderId);
-    }, 3000);
+    // Новые сообщения приходят через одно long-poll соединение на открытый чат
+    startChatLongPoll(orderId);
     
     // Фокус на поле ввода
     setTimeout(() => {
@@ -2372,23 +2503,26 @@ function closeChat() {
     const modal = document.getElementById('chat-modal');
     modal.classList.add('hidden');
     
-    if (chatRefreshInterval) {
-        clearInterval(chatRefreshInterval);
-        chatRefreshInterval = null;
-    }
-    
     currentChatOrderId = null;
+    stopChatLongPoll();
     
     // Обновляем список заказов чтобы обновить счетчики
     loadTabData(currentTab, false);
 }
 
-// Загрузить сообщения чата
+// Загрузить новые сообщения чата (после chatLastMessageId) и отметить их прочитанными
 async function loadChatMessages(orderId, scrollToBottom = true) {
+    if (chatLoading) {
+        // Повторим сразу после текущего запроса, чтобы не потерять новое сообщение
+        chatReloadPending = true;
+        return;
+    }
+    chatLoading = true;
+    
     try {
         const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
         
-        const response = await fetch(`${API_BASE}api/orders/${orderId}/messages?telegram_id=${telegram_id}`);
+        const response = await sessionFetch(`${API_BASE}api/orders/${orderId}/messages?telegram_id=${telegram_id}&after_id=${chatLastMessageId}&mark_read=1`);
         
         if (!response.ok) {
             console.error('Failed to load chat messages');
@@ -2396,29 +2530,111 @@ async function loadChatMessages(orderId, scrollToBottom = true) {
         }
         
         const data = await response.json();
-        const container = document.getElementById('chat-messages-container');
         
-        if (!data.messages || data.messages.length === 0) {
-            container.innerHTML = '<div class="chat-empty-state">Сообщений пока нет.<br>Начните диалог!</div>';
+        // Чат успели закрыть или переключить, пока шёл запрос
+        if (currentChatOrderId !== orderId) {
             return;
         }
         
-        container.innerHTML = data.messages.map(msg => `
-            <div class="chat-message ${msg.is_mine ? 'mine' : 'theirs'}">
+        renderChatMessages(data, scrollToBottom);
+        
+    } catch (error) {
+        console.error('Error loading chat messages:', error);
+    } finally {
+        chatLoading = false;
+        if (chatReloadPending) {
+            chatReloadPending = false;
+            if (currentChatOrderId) {
+                loadChatMessages(currentChatOrderId, scrollToBottom);
+            }
+        }
+    }
+}
+
+// Добавить в чат новые сообщения из ответа сервера и обновить отметки о прочтении
+function renderChatMessages(data, scrollToBottom = true) {
+    const container = document.getElementById('chat-messages-container');
+    
+    chatReadUpTo = data.read_up_to || 0;
+    
+    if (chatLastMessageId === 0 && (!data.messages || data.messages.length === 0)) {
+        container.innerHTML = '<div class="chat-empty-state">Сообщений пока нет.<br>Начните диалог!</div>';
+        return;
+    }
+    
+    // Сообщения могли уже прийти через long-poll или после отправки
+    const messages = (data.messages || []).filter(msg => msg.id > chatLastMessageId);
+    
+    if (messages.length > 0) {
+        if (chatLastMessageId === 0) {
+            container.innerHTML = '';
+        }
+        container.insertAdjacentHTML('beforeend', messages.map(msg => `
+            <div class="chat-message ${msg.is_mine ? 'mine' : 'theirs'}" data-message-id="${msg.id}">
                 <div class="chat-message-header">${msg.sender_role === 'driver' ? '🚛 Водитель' : '👤 Заказчик'}</div>
                 <div class="chat-message-bubble">${escapeHtml(msg.message_text)}</div>
-                <div class="chat-message-time">${formatDateTime(msg.created_at)}</div>
+                <div class="chat-message-time">${formatDateTime(msg.created_at)}${msg.is_mine ? ' <span class="chat-message-status"></span>' : ''}</div>
             </div>
-        `).join('');
+        `).join(''));
+        chatLastMessageId = messages[messages.length - 1].id;
         
         // Прокручиваем вниз
         if (scrollToBottom) {
             container.scrollTop = container.scrollHeight;
         }
-        
-    } catch (error) {
-        console.error('Error loading chat messages:', error);
     }
+    
+    updateChatReadReceipts(container);
+}
+
+// Long-poll: сервер держит запрос, пока в чате не появится новое сообщение
+async function startChatLongPoll(orderId) {
+    stopChatLongPoll();
+    const controller = new AbortController();
+    chatPollController = controller;
+    const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
+    
+    while (currentChatOrderId === orderId && !controller.signal.aborted) {
+        try {
+            const response = await sessionFetch(
+                `${API_BASE}api/orders/${orderId}/messages/poll?telegram_id=${telegram_id}&after_id=${chatLastMessageId}&read_up_to=${chatReadUpTo}&mark_read=1`,
+                { signal: controller.signal }
+            );
+            
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            
+            const data = await response.json();
+            if (currentChatOrderId === orderId && !controller.signal.aborted) {
+                renderChatMessages(data);
+            }
+        } catch (error) {
+            if (controller.signal.aborted) {
+                return;
+            }
+            console.error('Chat long-poll error:', error);
+            // Пауза перед повтором, чтобы не крутить запросы при ошибках сети
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    }
+}
+
+function stopChatLongPoll() {
+    if (chatPollController) {
+        chatPollController.abort();
+        chatPollController = null;
+    }
+}
+
+// Отметки о прочтении своих сообщений: ✓ - отправлено, ✓✓ - прочитано
+function updateChatReadReceipts(container) {
+    container.querySelectorAll('.chat-message.mine').forEach(element => {
+        const status = element.querySelector('.chat-message-status');
+        if (status) {
+            status.textContent = Number(element.dataset.messageId) <= chatReadUpTo ? '✓✓' : '✓';
+        }
+    });
 }
 
 // Отправить сообщение
@@ -2435,7 +2651,7 @@ async function sendChatMessage(event) {
     try {
         const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
         
-        const response = await fetch(`${API_BASE}api/orders/${currentChatOrderId}/messages`, {
+        const response = await sessionFetch(`${API_BASE}api/orders/${currentChatOrderId}/messages`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -2473,7 +2689,7 @@ async function markMessagesRead(orderId) {
     try {
         const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
         
-        await fetch(`${API_BASE}api/orders/${orderId}/messages/read`, {
+        await sessionFetch(`${API_BASE}api/orders/${orderId}/messages/read`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -2493,7 +2709,7 @@ async function getUnreadCounts() {
     try {
         const telegram_id = window.Telegram.WebApp.initDataUnsafe.user?.id;
         
-        const response = await fetch(`${API_BASE}api/orders/unread-messages-count?telegram_id=${telegram_id}`);
+        const response = await sessionFetch(`${API_BASE}api/orders/unread-messages-count?telegram_id=${telegram_id}`);
         
         if (!response.ok) {
             return {};
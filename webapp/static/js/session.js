@@ -0,0 +1,88 @@
+// === СЕССИЯ MINI APP ===
+// Telegram initData один раз обменивается на короткоживущий токен
+// (POST api/auth/session), дальше запросы к API идут с заголовком
+// Authorization: Bearer <токен> - сервер не проверяет telegram_id по БД.
+
+const SESSION_URL = new URL('api/auth/session', document.baseURI).toString();
+const STREAM_TICKET_URL = new URL('api/auth/stream-ticket', document.baseURI).toString();
+
+let sessionToken = sessionStorage.getItem('sessionToken');
+let sessionRequest = null;
+
+async function requestSession() {
+    const initData = window.Telegram?.WebApp?.initData;
+    if (!initData) {
+        return null;
+    }
+
+    try {
+        const response = await fetch(SESSION_URL, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ init_data: initData })
+        });
+        const data = response.ok ? await response.json() : null;
+        sessionToken = data ? data.token : null;
+    } catch (error) {
+        console.error('Error creating session:', error);
+        sessionToken = null;
+    }
+
+    if (sessionToken) {
+        sessionStorage.setItem('sessionToken', sessionToken);
+    } else {
+        sessionStorage.removeItem('sessionToken');
+    }
+    return sessionToken;
+}
+
+// Токен сессии (параллельные вызовы ждут один запрос)
+function ensureSession(refresh = false) {
+    if (sessionToken && !refresh) {
+        return Promise.resolve(sessionToken);
+    }
+    if (!sessionRequest) {
+        sessionRequest = requestSession().finally(() => { sessionRequest = null; });
+    }
+    return sessionRequest;
+}
+
+// Опции fetch с заголовком сессии
+function withSession(options = {}) {
+    if (!sessionToken) {
+        return options;
+    }
+    const headers = new Headers(options.headers || {});
+    headers.set('Authorization', `Bearer ${sessionToken}`);
+    return { ...options, headers };
+}
+
+// URL потока SSE: EventSource не умеет заголовки, поэтому в query -
+// короткоживущий билет (api/auth/stream-ticket), а не сам токен сессии
+async function streamUrl(url) {
+    if (!await ensureSession()) {
+        return url;
+    }
+    
+    try {
+        const response = await sessionFetch(STREAM_TICKET_URL, { method: 'POST' });
+        if (response.ok) {
+            const data = await response.json();
+            return `${url}${url.includes('?') ? '&' : '?'}ticket=${encodeURIComponent(data.ticket)}`;
+        }
+    } catch (error) {
+        console.error('Error creating stream ticket:', error);
+    }
+    return url;
+}
+
+// fetch с токеном сессии; истёкший токен обновляется один раз
+async function sessionFetch(url, options = {}) {
+    await ensureSession();
+    let response = await fetch(url, withSession(options));
+
+    if (response.status === 401 && await ensureSession(true)) {
+        response = await fetch(url, withSession(options));
+    }
+    return response;
+}
@@ -86,7 +86,8 @@ else:
         DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'delivery.db')
 
 # Secret key для Flask
-SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+DEFAULT_SECRET_KEY = 'dev-secret-key-change-in-production'  # Только для локальной разработки
+SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
 
 def get_truck_display_name(truck_type_key: str) -> str:
     """Получить полное отображаемое название типа машины"""
@@ -26,9 +26,27 @@ def send_webhook(endpoint, data):
         return None
 
 
+def publish_event(event_type, order_id, telegram_ids=None, truck_type=None, payload=None):
+    """Дублирование уведомления в поток SSE для Mini App (не критично)"""
+    try:
+        from events_api import publish_event as publish
+        publish(event_type, order_id=order_id, telegram_ids=telegram_ids,
+                truck_type=truck_type, payload=payload)
+    except Exception as e:
+        print(f"❌ SSE event error: {e}")
+
+
 def notify_new_order(order_id, truck_type, cargo_description, delivery_address, max_price, 
-                     pickup_address=None, pickup_time=None, delivery_time=None, delivery_date=None):
-    """Уведомить водителей о новой заявке"""
+                     pickup_address=None, pickup_time=None, delivery_time=None, delivery_date=None,
+                     pickup_cells=None):
+    """
+    Уведомить водителей о новой заявке
+
+    pickup_cells - ячейки сетки вокруг точки подачи (geo.nearby_cells):
+    бот уведомит только водителей с базой в них и водителей без базы.
+    None - адрес не найден, уведомляются все водители с подходящей машиной.
+    """
+    publish_event('order_created', order_id, truck_type=truck_type)
     return send_webhook('/webhook/new-order', {
         'order_id': order_id,
         'truck_type': truck_type,
@@ -38,13 +56,16 @@ def notify_new_order(order_id, truck_type, cargo_description, delivery_address,
         'pickup_address': pickup_address,
         'pickup_time': pickup_time,
         'delivery_time': delivery_time,
-        'delivery_date': delivery_date
+        'delivery_date': delivery_date,
+        'pickup_cells': pickup_cells
     })
 
 
 def notify_auction_complete(order_id, winner_telegram_id, winner_user_id, winner_username, winning_price, cargo_description, 
                            delivery_address, customer_user_id, customer_username, customer_phone, driver_phone):
     """Уведомить о завершении подбора с победителем"""
+    publish_event('order_status', order_id, [winner_telegram_id, customer_user_id],
+                  payload={'status': 'in_progress'})
     return send_webhook('/webhook/auction-complete', {
         'order_id': order_id,
         'winner_telegram_id': winner_telegram_id,
@@ -60,8 +81,11 @@ def notify_auction_complete(order_id, winner_telegram_id, winner_user_id, winner
     })
 
 
-def notify_auction_no_bids(order_id, customer_user_id, cargo_description):
+def notify_auction_no_bids(order_id, customer_user_id, cargo_description, truck_type=None):
     """Уведомить об подборе без ставок"""
+    publish_event('order_status', order_id, [customer_user_id], payload={'status': 'no_offers'})
+    # Заявка пропадает из вкладки "Открытые" у водителей
+    publish_event('order_status', order_id, truck_type=truck_type, payload={'status': 'no_offers'})
     return send_webhook('/webhook/auction-no-bids', {
         'order_id': order_id,
         'customer_user_id': customer_user_id,
@@ -71,6 +95,8 @@ def notify_auction_no_bids(order_id, customer_user_id, cargo_description):
 
 def notify_order_confirmed(order_id, confirmed_by_telegram_id, confirmed_by_role, customer_telegram_id, driver_telegram_id):
     """Уведомить о подтверждении выполнения заказа одной из сторон"""
+    publish_event('order_confirmed', order_id, [customer_telegram_id, driver_telegram_id],
+                  payload={'confirmed_by_role': confirmed_by_role})
     return send_webhook('/webhook/order-confirmed', {
         'order_id': order_id,
         'confirmed_by_telegram_id': confirmed_by_telegram_id,
@@ -82,6 +108,8 @@ def notify_order_confirmed(order_id, confirmed_by_telegram_id, confirmed_by_role
 
 def notify_order_cancelled(order_id, cancelled_by_telegram_id, cancelled_by_role, customer_telegram_id, driver_telegram_id, cargo_description):
     """Уведомить об отмене заказа"""
+    publish_event('order_cancelled', order_id, [customer_telegram_id, driver_telegram_id],
+                  payload={'cancelled_by_role': cancelled_by_role})
     return send_webhook('/webhook/order-cancelled', {
         'order_id': order_id,
         'cancelled_by_telegram_id': cancelled_by_telegram_id,
@@ -92,8 +120,11 @@ def notify_order_cancelled(order_id, cancelled_by_telegram_id, cancelled_by_role
     })
 
 
-def notify_auction_bids_ready(order_id, customer_user_id, cargo_description, bids_count, min_price):
+def notify_auction_bids_ready(order_id, customer_user_id, cargo_description, bids_count, min_price, truck_type=None):
     """Уведомить заказчика о готовности предложений для выбора"""
+    publish_event('order_status', order_id, [customer_user_id],
+                  payload={'status': 'auction_completed', 'bids_count': bids_count, 'min_price': min_price})
+    publish_event('order_status', order_id, truck_type=truck_type, payload={'status': 'auction_completed'})
     return send_webhook('/webhook/auction-bids-ready', {
         'order_id': order_id,
         'customer_user_id': customer_user_id,
@@ -105,6 +136,8 @@ def notify_auction_bids_ready(order_id, customer_user_id, cargo_description, bid
 
 def notify_photo_uploaded(order_id, photo_type, uploader_role, customer_telegram_id, driver_telegram_id):
     """Уведомить о загрузке фото погрузки/выгрузки"""
+    publish_event('photo_uploaded', order_id, [customer_telegram_id, driver_telegram_id],
+                  payload={'photo_type': photo_type})
     return send_webhook('/webhook/photo-uploaded', {
         'order_id': order_id,
         'photo_type': photo_type,  # 'loading' или 'unloading'
@@ -116,6 +149,8 @@ def notify_photo_uploaded(order_id, photo_type, uploader_role, customer_telegram
 
 def notify_status_changed(order_id, old_status, new_status, customer_telegram_id, driver_telegram_id, cargo_description):
     """Уведомить об изменении статуса заказа"""
+    publish_event('order_status', order_id, [customer_telegram_id, driver_telegram_id],
+                  payload={'old_status': old_status, 'status': new_status})
     return send_webhook('/webhook/status-changed', {
         'order_id': order_id,
         'old_status': old_status,
@@ -144,6 +179,8 @@ def send_webhook_notification(notification_data):
     notification_type = notification_data.get('type')
     
     if notification_type == 'new_chat_message':
+        publish_event('chat_message', notification_data.get('order_id'),
+                      [notification_data.get('recipient_telegram_id')])
         return send_webhook('/webhook/new-chat-message', notification_data)
     
     print(f"⚠️  Unknown notification type: {notification_type}")